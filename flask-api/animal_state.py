@@ -0,0 +1,261 @@
+# animal_state.py
+# In-memory per-animal state for the prediction path.
+# One array row per cattle_id holds the inputs the animal was last scored on, the
+# model output for them, and the status / risk / alert signature last written to
+# storage. Readings that stay within tolerance of the last scored inputs reuse that
+# output, and an animal's latest-state document is only rewritten when the signature
+# changes (or a heartbeat is due); its history row is still appended on every reading.
+# Steady animals thus cost neither a forest pass nor a full-result write. The CPU saved
+# per reading is the forest pass: most of a /predict call, but only a few us of a
+# vectorized batch, where the skipped latest-state writes are the main gain.
+
+import operator
+import threading
+import time
+
+import numpy as np
+
+from features import NUMERIC_INPUT_FEATURES, to_float
+
+CATEGORY_INPUT_FEATURES = ['breed_type', 'faecal_consistency']
+
+
+def parse_tolerances(spec):
+    """
+    Parses a per-feature tolerance spec such as "body_temperature:0.05,heart_rate:2".
+
+    Returns:
+        dict: feature -> largest absolute change that still reuses the last prediction.
+    """
+    tolerances = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        feature, _, value = item.partition(':')
+        if not value:
+            raise ValueError(f"Tolerance entry '{item}' must look like feature:value")
+        tolerances[feature.strip()] = float(value)
+    unknown = set(tolerances) - set(NUMERIC_INPUT_FEATURES)
+    if unknown:
+        raise ValueError(f"Tolerance given for non-numeric or unknown feature(s): {', '.join(sorted(unknown))}")
+    return tolerances
+
+
+def animal_id(data):
+    """The reading's cattle_id if it can index the table (JSON strings and numbers), else None."""
+    cattle_id = data.get('cattle_id')
+    return cattle_id if isinstance(cattle_id, (str, int, float)) else None
+
+
+NO_RULES = frozenset()
+
+
+def result_signature(response_data):
+    """What a write has to change to be worth storing: status, risk level and the set of triggered rules."""
+    results = response_data.get('monitoring_results', {})
+    alerts = response_data.get('alerts')
+    rules = frozenset([alert.get('rule_triggered') for alert in alerts]) if alerts else NO_RULES
+    return results.get('health_status'), results.get('risk_level'), rules
+
+
+class AnimalStateTable:
+    """
+    Array-backed state table indexed by cattle_id.
+
+    Numeric inputs and probabilities live in preallocated float64 arrays (grown by
+    doubling); cattle_id -> row is a dict. Categorical inputs, labels and signatures
+    are per-row Python slots.
+
+    forget_predictions() (on a model change) drops the stored outputs but keeps the
+    write signatures; outputs computed before it was called are not recorded.
+
+    Args:
+        tolerances (dict, optional): feature -> absolute tolerance (exact match if omitted).
+        heartbeat_seconds (float): Longest an unchanged animal goes without a write.
+        max_animals (int): Animals tracked; readings for others are always scored and written.
+    """
+
+    def __init__(self, tolerances=None, heartbeat_seconds=900.0, max_animals=100000, initial_capacity=1024):
+        self.numeric_fields = list(NUMERIC_INPUT_FEATURES)
+        self._numeric_values = operator.itemgetter(*self.numeric_fields)
+        self._category_values = operator.itemgetter(*CATEGORY_INPUT_FEATURES)
+        self.tolerance = np.array([float((tolerances or {}).get(field, 0.0)) for field in self.numeric_fields])
+        self._tolerances = self.tolerance.tolist()
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_animals = max_animals
+        self._lock = threading.Lock()
+
+        capacity = max(min(initial_capacity, max_animals), 1)
+        self.index = {}
+        self.features = np.full((capacity, len(self.numeric_fields)), np.nan)
+        self.probabilities = None  # (capacity, n_classes), allocated on the first recorded output
+        self.categories = [None] * capacity
+        self.labels = [None] * capacity
+        self.stored_signature = [None] * capacity
+        self.stored_user = [None] * capacity
+        self.stored_at = [0.0] * capacity
+        self.generation = 0
+
+        # --- Metrics ---
+        self.reused = 0
+        self.scored = 0
+        self.writes = 0
+        self.skipped_writes = 0
+
+    # --- Inputs ---
+    def numeric_matrix(self, records):
+        """(n, numeric fields) float64 inputs; missing or unparsable values become NaN (never within tolerance)."""
+        try:
+            # Fast path: one C-level tuple per reading, converted in one go
+            return np.array(list(map(self._numeric_values, records)), dtype=np.float64).reshape(len(records), len(self.numeric_fields))
+        except (KeyError, TypeError, ValueError):
+            return np.array([[to_float(data.get(field)) for field in self.numeric_fields] for data in records], dtype=np.float64).reshape(len(records), len(self.numeric_fields))
+
+    def category_key(self, data):
+        try:
+            return self._category_values(data)
+        except KeyError:
+            return tuple(data.get(field) for field in CATEGORY_INPUT_FEATURES)
+
+    def _row(self, cattle_id):
+        row = self.index.get(cattle_id)
+        if row is None and len(self.index) < self.max_animals:
+            row = len(self.index)
+            if row == len(self.labels):
+                self._grow()
+            self.index[cattle_id] = row
+        return row
+
+    def _grow(self):
+        capacity = min(len(self.labels) * 2, self.max_animals)
+        extra = capacity - len(self.labels)
+        self.features = np.vstack([self.features, np.full((extra, self.features.shape[1]), np.nan)])
+        if self.probabilities is not None:
+            self.probabilities = np.vstack([self.probabilities, np.zeros((extra, self.probabilities.shape[1]))])
+        self.stored_at.extend([0.0] * extra)
+        for slots in (self.categories, self.labels, self.stored_signature, self.stored_user):
+            slots.extend([None] * extra)
+
+    # --- Skipping inference ---
+    def reusable_outputs(self, records):
+        """
+        Returns, per reading, the animal's last (label, probabilities) if every numeric input is
+        within tolerance of the inputs it was last scored on and the categories are unchanged;
+        None where the reading has to be scored.
+        """
+        outputs = [None] * len(records)
+        with self._lock:
+            index, labels, categories, category_key = self.index, self.labels, self.categories, self.category_key
+            rows = [index.get(animal_id(data)) for data in records]
+            known = [i for i, row in enumerate(rows) if row is not None and labels[row] is not None]
+            if not known:
+                return outputs
+            known_rows = [rows[i] for i in known]
+            numeric = self.numeric_matrix([records[i] for i in known])
+            within = (np.abs(numeric - self.features[known_rows]) <= self.tolerance).all(axis=1).tolist()
+            # One gathered copy of the candidates' probabilities, not one copy per reused row
+            probabilities = self.probabilities[known_rows]
+            reused = 0
+            for j, (i, row) in enumerate(zip(known, known_rows)):
+                if within[j] and categories[row] == category_key(records[i]):
+                    outputs[i] = (labels[row], probabilities[j])
+                    reused += 1
+            self.reused += reused
+        return outputs
+
+    def reusable_output(self, data):
+        """
+        reusable_outputs() for a single reading, compared value by value in Python (for one
+        row, numpy's per-call overhead would cost more than the forest pass it saves).
+        """
+        with self._lock:
+            row = self.index.get(animal_id(data))
+            if row is None or self.labels[row] is None:
+                return None
+            try:
+                values = self._numeric_values(data)
+            except KeyError:
+                return None
+            for value, last, tolerance in zip(values, self.features[row].tolist(), self._tolerances):
+                # (NaN, like an unparsable value, is never within tolerance)
+                if not abs(to_float(value) - last) <= tolerance:
+                    return None
+            if self.categories[row] != self.category_key(data):
+                return None
+            self.reused += 1
+            return self.labels[row], self.probabilities[row].copy()
+
+    def record_scored(self, records, outputs, generation=None):
+        """
+        Makes freshly scored inputs and outputs the new reference for their animals
+        (ignored if forget_predictions() ran since `generation` was read).
+        """
+        numeric = self.numeric_matrix(records)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self.probabilities is None and outputs:
+                self.probabilities = np.zeros((len(self.labels), len(outputs[0][1])))
+            for data, values, (label, probabilities) in zip(records, numeric, outputs):
+                cattle_id = animal_id(data)
+                row = self._row(cattle_id) if cattle_id is not None else None
+                if row is None:
+                    continue
+                self.features[row] = values
+                self.probabilities[row] = probabilities
+                self.categories[row] = self.category_key(data)
+                self.labels[row] = label
+            self.scored += len(records)
+
+    def forget_predictions(self):
+        with self._lock:
+            self.labels = [None] * len(self.labels)
+            self.generation += 1
+
+    # --- Skipping writes ---
+    def latest_changes(self, user_id, results, now=None):
+        """
+        Flags the prediction results whose latest-state document is worth rewriting: a new
+        animal or user, a different status / risk / alert signature, or an animal quiet for
+        heartbeat_seconds. History rows are appended for every result regardless.
+
+        Returns:
+            list: One bool per result; False leaves the animal's stored latest state as it is.
+        """
+        now = time.monotonic() if now is None else now
+        changed = []
+        with self._lock:
+            stored_signature, stored_user, stored_at = self.stored_signature, self.stored_user, self.stored_at
+            # (written since the heartbeat cutoff, i.e. less than heartbeat_seconds ago)
+            cutoff = now - self.heartbeat_seconds
+            for response_data in results:
+                cattle_id = animal_id(response_data)
+                row = self._row(cattle_id) if cattle_id is not None else None
+                signature = result_signature(response_data)
+                if row is not None and stored_at[row] > cutoff and stored_signature[row] == signature and stored_user[row] == user_id:
+                    changed.append(False)
+                    continue
+                if row is not None:
+                    stored_signature[row] = signature
+                    stored_user[row] = user_id
+                    stored_at[row] = now
+                changed.append(True)
+            writes = changed.count(True)
+            self.writes += writes
+            self.skipped_writes += len(results) - writes
+        return changed
+
+    def stats(self):
+        checked = self.reused + self.scored
+        attempted = self.writes + self.skipped_writes
+        return {
+            "animals": len(self.index),
+            "max_animals": self.max_animals,
+            "capacity": len(self.labels),
+            "tolerances": {field: float(tol) for field, tol in zip(self.numeric_fields, self.tolerance) if tol},
+            "heartbeat_seconds": self.heartbeat_seconds,
+            "reused": self.reused,
+            "scored": self.scored,
+            "reuse_rate": round(self.reused / checked, 4) if checked else 0.0,
+            "writes": self.writes,
+            "skipped_writes": self.skipped_writes,
+            "write_skip_rate": round(self.skipped_writes / attempted, 4) if attempted else 0.0,
+        }
@@ -1,277 +1,467 @@
 # app.py (Your Flask application file)
 #set GOOGLE_APPLICATION_CREDENTIALS=C:\Users\DELL\Downloads\DATASETS\CATTLE HEALTH MANAGEMENT APP\Remote_Cattle_Health_management_System\flask-api\firebase-key.json
 
-print("--- APP.PY EXECUTION STARTED ---")
-
-import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import joblib
 import numpy as np
+import atexit
+import concurrent.futures
+import contextlib
 import datetime
+import json
+import logging
 import os
-from google.cloud import firestore
+import queue
+import random
+import threading
+import time
+
+from animal_state import AnimalStateTable, parse_tolerances
+from cache import PredictionCache, parse_rounding
+from encoding import NDJSON_MIMETYPE, dumps_json, dumps_ndjson, response_encoder
+from features import DEFAULT_GOLDEN_VECTORS_PATH, MODEL_FEATURES, FeatureBuilder, check_golden_vectors
+from inference import FlatForest, ServingModel, load_serving_bundle
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from profiler import RequestProfiler, StackSampler
+from registry import BUNDLE_FILE, GOLDEN_FILE, ModelRegistry
+from rules import DEFAULT_RULES_PATH, RuleBook
+from schema import InputSchema, parse_ranges
+from shadow import ShadowScorer
+from storage import FirestoreBackend, LazyFirestoreClient, SQLiteBackend
+from streaming import InferenceBatcher, MicroBatcher, iter_body_lines, iter_ndjson
+from temporal import TemporalFeatureEngine, parse_windows
+
+# --- Logging: leveled (LOG_LEVEL), and messages about individual requests are sampled ---
+# Only a LOG_SAMPLE_RATE fraction of per-request messages (unseen categories, missing headers, ...)
+# is logged; every occurrence is still counted on /metrics. Request payloads are never logged.
+# LOG_LEVEL=DEBUG LOG_SAMPLE_RATE=1 logs every request.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+log = logging.getLogger('app')
+
+def log_sampled(level, message, *args):
+    # Arguments are only formatted for the messages that are kept
+    if log.isEnabledFor(level) and (LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE):
+        log.log(level, message, *args)
+
+log.info("--- APP.PY EXECUTION STARTED ---")
+
+# --- Metrics (Prometheus text format on /metrics; see 3m for the values read at scrape time) ---
+metrics = MetricsRegistry('livestock')
+request_count = metrics.counter('requests_total', 'HTTP requests by route and status code.', ('endpoint', 'status'))
+request_seconds = metrics.histogram('request_duration_seconds', 'Time to build each response (for /predict/stream: until the stream starts).', ('endpoint',))
+stage_seconds = metrics.histogram(
+    'stage_duration_seconds',
+    'Time per call in each stage of the scoring path (a batched call covers all of its readings).',
+    ('stage',),
+)
+readings_scored = metrics.counter('readings_total', 'Readings scored (cache and per-animal reuse included), by route.', ('endpoint',))
+unseen_categories = metrics.counter('unseen_categories_total', 'Readings with a category the encoders have not seen (encoded as class 0).', ('field',))
+nan_fills = metrics.counter('nan_fills_total', 'Readings with a missing or unparsable value filled with 0.', ('feature',))
+invalid_values = metrics.counter('invalid_values_total', 'Input values failing the schema (rejected or, with INPUT_VALIDATION=flag, scored anyway).', ('field', 'error'))
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage)
+
+def report_preprocessing(warnings, issues):
+    for (kind, field), count in issues.items():
+        (unseen_categories if kind == 'unseen_category' else nan_fills).inc(field, amount=count)
+    for warning in warnings:
+        log_sampled(logging.WARNING, "%s", warning)
+
+# --- Startup mode ---
+# STARTUP_MODE=eager (default): load the .joblib artifacts and the Firestore client at import,
+# exit if the model cannot be loaded.
+# STARTUP_MODE=lazy: serve from the memory-mapped serving bundle (sklearn and pandas are never
+# imported, and forked workers share the model pages), create the Firestore client on first
+# write, and load + warm up on a background thread. /ready turns green once warm-up is done.
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'eager')
+# Set by serve.py: this process is the prefork master, workers open their own storage after fork()
+SERVE_PREFORK = os.environ.get('SERVE_PREFORK') == '1'
+SERVING_BUNDLE_PATH = os.environ.get('SERVING_BUNDLE_PATH', 'serving_bundle.joblib')
+startup_started = time.monotonic()
+serving_ready = threading.Event()
+startup_status = {"mode": STARTUP_MODE, "stage": "loading", "error": None, "load_seconds": None, "warmup_seconds": None, "version": None}
+
+# --- Model registry (optional): serve the live version of MODEL_REGISTRY_DIR instead of the files in
+# the working directory, and swap in a new one when the registry's pointer moves (checked every
+# MODEL_RELOAD_SECONDS; under serve.py the master does this and rolls its workers)
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR')
+MODEL_RELOAD_SECONDS = float(os.environ.get('MODEL_RELOAD_SECONDS', 10))
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR) if MODEL_REGISTRY_DIR else None
 
 # --- 1. Load the pre-trained model and preprocessing tools ---
-try:
+model = scaler = le_health = le_breed = le_faecal = None
+
+def load_model_artifacts():
+    """
+    Loads the model and preprocessing tools into the module globals.
+
+    Returns:
+        The inference engine: a FlatForest, or the sklearn model when FOREST_ENGINE=sklearn
+        or the flat engine cannot be used.
+    """
+    global model, scaler, le_health, le_breed, le_faecal, training_features_for_model
+
+    if STARTUP_MODE == 'lazy' and os.environ.get('FOREST_ENGINE', 'flat') != 'sklearn':
+        try:
+            bundle = load_serving_bundle(SERVING_BUNDLE_PATH)
+            scaler, le_health, le_breed, le_faecal = bundle['scaler'], bundle['le_health'], bundle['le_breed'], bundle['le_faecal']
+            training_features_for_model = bundle['feature_names']
+            log.info("Serving bundle memory-mapped from %s (%d trees, %d nodes).", SERVING_BUNDLE_PATH, bundle['forest'].n_trees, bundle['forest'].n_nodes)
+            return bundle['forest']
+        except Exception as e:
+            log.warning("Failed to load serving bundle (%s). Falling back to the .joblib artifacts.", e)
+
+    import joblib
     model = joblib.load('model.joblib')
     scaler = joblib.load('scaler.joblib')
     le_health = joblib.load('le_health.joblib')
     le_breed = joblib.load('le_breed.joblib') # Load your breed LabelEncoder
     le_faecal = joblib.load('le_faecal.joblib') # Load your faecal consistency LabelEncoder
-    print("Model, Scaler, and LabelEncoders loaded successfully!")
-except FileNotFoundError as e:
-    print(f"Error loading a required file: {e}. Make sure all .joblib files are in the same directory.")
-    exit() # Exit if models aren't loaded, as app won't function
-except Exception as e:
-    print(f"An unexpected error occurred during loading: {e}")
-    exit() # Exit if models aren't loaded
+    # The scaler was fitted on the training frame, so it carries the model's exact column order
+    training_features_for_model = [str(name) for name in getattr(scaler, 'feature_names_in_', MODEL_FEATURES)]
+    log.info("Model, Scaler, and LabelEncoders loaded successfully!")
+    return load_forest_engine()
 
 # --- Initialize Firebase/Firestore ---
 db = None # Initialize to None
-try:
-    db = firestore.Client()
-    print("Firestore client initialized using default credentials.")
-except Exception as e:
-    print(f"Flask Warning: Failed to initialize Firestore client. Error: {e}")
-    print("Ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set for local runs.")
-
-
-# --- IMPORTANT: EXACT feature order from  training ---
-training_features_for_model = [
-    'body_temperature', 'breed_type_enc', 'milk_production', 'respiratory_rate',
-    'walking_capacity', 'sleeping_duration', 'body_condition_score', 'heart_rate',
-    'eating_duration', 'lying_down_duration', 'ruminating', 'rumen_fill',
-    'faecal_consistency_enc', 'activity_ratio', 'eating_efficiency', 'vital_sign_index'
+if STARTUP_MODE == 'lazy' or SERVE_PREFORK:
+    # Created by the first write instead (gRPC clients must not be shared across fork());
+    # only used when credentials appear to be configured
+    if os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or os.environ.get('GOOGLE_CLOUD_PROJECT') or os.environ.get('STORAGE_BACKEND') == 'firestore':
+        db = LazyFirestoreClient()
+else:
+    try:
+        from google.cloud import firestore
+        db = firestore.Client()
+        log.info("Firestore client initialized using default credentials.")
+    except Exception as e:
+        log.warning("Failed to initialize Firestore client. Error: %s", e)
+        log.warning("Ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set for local runs.")
+
+# --- Storage backend: Firestore (write-behind) or the embedded SQLite/Parquet store ---
+# STORAGE_BACKEND=auto (default) uses Firestore when the client initialized, otherwise SQLite,
+# so offline farms keep their results instead of dropping them. HISTORY_BUCKET (hour, or day for
+# animals reporting rarely) sets how much history each Firestore bucket document holds.
+def create_storage_backend():
+    choice = os.environ.get('STORAGE_BACKEND', 'auto')
+    if choice == 'none':
+        return None
+    if choice == 'firestore' or (choice == 'auto' and db):
+        if not db:
+            log.warning("STORAGE_BACKEND=firestore but the Firestore client is not initialized.")
+            return None
+        return FirestoreBackend(
+            db,
+            app_id=os.environ.get('CANVAS_APP_ID', 'default_app_id_for_local'),
+            granularity=os.environ.get('HISTORY_BUCKET', 'hour'),
+            max_queue_size=int(os.environ.get('FIRESTORE_QUEUE_SIZE', 10000)),
+            linger_seconds=float(os.environ.get('FIRESTORE_LINGER_SECONDS', 0.05)),
+            max_retries=int(os.environ.get('FIRESTORE_MAX_RETRIES', 5)),
+            spill_path=os.environ.get('FIRESTORE_SPILL_PATH', 'firestore_spill.jsonl'),
+        )
+    backend = SQLiteBackend(
+        path=os.environ.get('SQLITE_PATH', 'telemetry.db'),
+        parquet_dir=os.environ.get('PARQUET_HISTORY_DIR', 'telemetry_history'),
+        rollover_days=int(os.environ.get('PARQUET_ROLLOVER_DAYS', 30)),
+    )
+    log.info("Using embedded SQLite telemetry store at %s.", backend.path)
+    return backend
+
+
+storage_backend = None
+
+def open_storage_backend():
+    """Creates this process's storage backend. Its writer thread and database handles do not survive fork()."""
+    global storage_backend
+    storage_backend = create_storage_backend()
+    if storage_backend:
+        atexit.register(storage_backend.close)
+
+
+# The prefork master never saves; serve.py calls open_storage_backend() in each worker instead
+if not SERVE_PREFORK:
+    open_storage_backend()
+
+
+# --- IMPORTANT: EXACT feature order from training (replaced by the order stored with the loaded model) ---
+training_features_for_model = list(MODEL_FEATURES)
+
+# --- Inference engine: flat-array forest (scaler folded into thresholds) unless FOREST_ENGINE=sklearn ---
+def load_forest_engine():
+    if os.environ.get('FOREST_ENGINE', 'flat') == 'sklearn':
+        return model
+
+    try:
+        if os.path.exists('forest.npz'):
+            engine = FlatForest.load('forest.npz')
+        else:
+            engine = FlatForest.from_sklearn(model, scaler)
+
+        # Guard against a forest.npz exported from a different model.joblib
+        probe = scaler.mean_ + np.outer(np.linspace(-2.0, 2.0, 9), scaler.scale_)
+        expected = model.predict_proba(scaler.transform(probe))
+        if not np.array_equal(engine.predict_proba(probe if engine.scaler_folded else scaler.transform(probe)), expected):
+            log.warning("forest.npz does not match model.joblib. Falling back to sklearn inference.")
+            return model
+
+        log.info("Flat forest engine loaded (%d trees, %d nodes).", engine.n_trees, len(engine.feature))
+        return engine
+    except Exception as e:
+        log.warning("Failed to load flat forest engine (%s). Falling back to sklearn inference.", e)
+        return model
+
+
+# --- Training/serving parity: replay the golden vectors recorded when the model was trained ---
+GOLDEN_VECTORS_PATH = os.environ.get('GOLDEN_VECTORS_PATH', DEFAULT_GOLDEN_VECTORS_PATH)
+
+def verify_golden_vectors(serving, path):
+    """
+    Raises ValueError if this process's feature pipeline or inference engine does not reproduce
+    what the training script recorded, so a skewed model is never served.
+    """
+    if not os.path.exists(path):
+        log.warning("%s not found; skipping the training/serving parity check.", path)
+        return
+    with open(path) as f:
+        golden = json.load(f)
+    check_golden_vectors(serving.feature_builder, golden)
+    if 'probabilities' in golden:
+        _, probabilities = serving.predict_records(golden['readings'])
+        if not np.allclose(probabilities, golden['probabilities'], rtol=0.0, atol=1e-9):
+            raise ValueError("Golden vector mismatch: model probabilities differ from the ones recorded at training")
+    log.info("Feature pipeline matches training on %d golden vectors.", len(golden['readings']))
+
+
+# --- The serving model: feature pipeline + engine + labels of one version, replaced as a whole ---
+serving_model = None
+
+def build_serving_model(version, engine, scaler, le_health, le_breed, le_faecal, feature_names, golden_path, manifest=None):
+    # Precompiled feature builder: category lookup tables and scaler constants resolved once
+    feature_builder = FeatureBuilder(feature_names, le_breed, le_faecal, scaler)
+    serving = ServingModel(version, feature_builder, engine, le_health, manifest)
+    verify_golden_vectors(serving, golden_path)
+    return serving
+
+
+def load_registry_version(version):
+    """Loads one registry version (checksums verified, bundle memory-mapped) as a ServingModel."""
+    directory, manifest = model_registry.verify(version)
+    bundle = load_serving_bundle(os.path.join(directory, BUNDLE_FILE))
+    log.info("Loaded model version %s from %s (%d trees, %d nodes).", version, MODEL_REGISTRY_DIR, bundle['forest'].n_trees, bundle['forest'].n_nodes)
+    return build_serving_model(
+        version, bundle['forest'], bundle['scaler'], bundle['le_health'], bundle['le_breed'], bundle['le_faecal'],
+        bundle['feature_names'], os.path.join(directory, GOLDEN_FILE), manifest,
+    )
+
+
+def load_live_model():
+    """Loads and verifies (but does not serve yet) the registry's live version, or the artifacts in the working directory."""
+    if model_registry:
+        version = model_registry.live_version()
+        if version is None:
+            raise FileNotFoundError(f"No live model version in the registry at {MODEL_REGISTRY_DIR}")
+        return load_registry_version(version)
+    engine = load_model_artifacts()
+    return build_serving_model('local', engine, scaler, le_health, le_breed, le_faecal, training_features_for_model, GOLDEN_VECTORS_PATH)
+
+
+# --- Files whose replacement means a new model (serve.py's master watches them) ---
+LOCAL_MODEL_FILES = ['model.joblib', 'scaler.joblib', 'le_health.joblib', 'le_breed.joblib', 'le_faecal.joblib', 'forest.npz']
+
+def model_files():
+    if model_registry:
+        # Versions are immutable; only the live / candidate pointer changes
+        return [model_registry.pointer_path]
+    return [SERVING_BUNDLE_PATH, GOLDEN_VECTORS_PATH] + LOCAL_MODEL_FILES
+
+
+# --- Shadow scoring (MODEL_SHADOW=1): the registry's candidate version scores sampled traffic in the
+# background and /models reports how often it disagrees with the live version and how fast it is
+MODEL_SHADOW = os.environ.get('MODEL_SHADOW', '0') == '1'
+MODEL_SHADOW_SAMPLE = float(os.environ.get('MODEL_SHADOW_SAMPLE', 1.0))
+MODEL_SHADOW_MAX_PENDING = int(os.environ.get('MODEL_SHADOW_MAX_PENDING', 64))
+shadow_scorer = None
+shadow_version = None
+
+def load_shadow_candidate():
+    """Starts, replaces or stops shadow scoring to match the registry's candidate pointer."""
+    global shadow_scorer, shadow_version
+    version = model_registry.candidate_version() if model_registry and MODEL_SHADOW else None
+    if version == shadow_version:
+        return
+    previous, scorer = shadow_scorer, None
+    if version:
+        try:
+            scorer = ShadowScorer(load_registry_version(version), sample_rate=MODEL_SHADOW_SAMPLE, max_pending=MODEL_SHADOW_MAX_PENDING)
+            log.info("Shadow scoring candidate version %s.", version)
+        except Exception as e:
+            log.warning("Could not load candidate version %s for shadow scoring: %s", version, e)
+    shadow_scorer, shadow_version = scorer, version
+    if previous:
+        previous.close()
+
+# --- Raw input fields every reading must carry ---
+required_input_features = [
+    'body_temperature', 'breed_type', 'milk_production',
+    'respiratory_rate', 'walking_capacity', 'sleeping_duration',
+    'body_condition_score', 'heart_rate', 'eating_duration',
+    'lying_down_duration', 'ruminating', 'rumen_fill', 'faecal_consistency'
 ]
 
-# --- Define the original categorical columns that need Label Encoding ---
-original_categorical_cols = ['breed_type', 'faecal_consistency']
+# --- Input schema (types and plausible ranges, see schema.py), compiled once ---
+# INPUT_VALIDATION=reject answers invalid readings with a 400 (an error entry in batches and streams),
+# flag scores them anyway and lists the problems under "input_warnings", off only checks presence.
+# reject is the default: clients sending out-of-range or non-numeric values, which used to be
+# scored (as 0), now get a 400; set flag (or off) to keep scoring them while they are fixed.
+INPUT_VALIDATION_MODES = ('reject', 'flag', 'off')
+INPUT_VALIDATION = os.environ.get('INPUT_VALIDATION', 'reject')
+if INPUT_VALIDATION not in INPUT_VALIDATION_MODES:
+    raise ValueError(f"INPUT_VALIDATION must be one of: {', '.join(INPUT_VALIDATION_MODES)}")
+input_schema = InputSchema(required_input_features, parse_ranges(os.environ.get('INPUT_RANGES')))
 
-# --- Helper Function for Rule-Based Alerts ---
-def get_rule_based_alerts(data):
-    detected_diseases = []
-    generated_alerts = []
-    abnormal_indicator_count = 0
-
-    THRESHOLDS = {
-        'body_temperature_high_respiratory': 39.5,
-        'respiratory_rate_high_respiratory': 40,
-        'faecal_consistency_abnormal': ['watery', 'black faece', 'fresh blood in faeces', 'very liquid faeces'],
-        'milk_production_low': 8.0,
-        'body_condition_score_low_reproductive': 2.5,
-        'heart_rate_high_reproductive': 80,
-        'walking_capacity_low': 9000,
-        'body_temperature_high_systemic': 39.8,
-        'heart_rate_high_systemic': 80,
-        'respiratory_rate_high_systemic': 42,
-    }
+def validate_reading(data):
+    """Returns (missing fields, value problems) for one reading, normalizing its values in place."""
+    missing_features, problems = input_schema.validate(
+        data, check_values=INPUT_VALIDATION != 'off', coerce_invalid=INPUT_VALIDATION == 'flag')
+    if problems:
+        report_invalid_values(problems)
+    return missing_features, problems
 
-    # Respiratory Disease
-    if data.get('body_temperature', 0) > THRESHOLDS['body_temperature_high_respiratory'] and \
-       data.get('respiratory_rate', 0) > THRESHOLDS['respiratory_rate_high_respiratory']:
-        detected_diseases.append('Respiratory Disease')
-        generated_alerts.append({
-            'symptom': 'body_temperature',
-            'value': data.get('body_temperature'),
-            'message': f"High body temperature detected ({data.get('body_temperature')}°C)!",
-            'severity': 'Medium',
-            'rule_triggered': 'Respiratory_Temp'
-        })
-        generated_alerts.append({
-            'symptom': 'respiratory_rate',
-            'value': data.get('respiratory_rate'),
-            'message': f"High respiratory rate detected ({data.get('respiratory_rate')} breaths/min)!",
-            'severity': 'Medium',
-            'rule_triggered': 'Respiratory_Rate'
-        })
-        abnormal_indicator_count += 2
-
-    # GI Disease
-    faecal_consistency = data.get('faecal_consistency', '').lower()
-    if faecal_consistency in THRESHOLDS['faecal_consistency_abnormal']:
-        detected_diseases.append('Gastrointestinal Disease')
-        generated_alerts.append({
-            'symptom': 'faecal_consistency',
-            'value': data.get('faecal_consistency'),
-            'message': f"Abnormal faecal consistency detected ({data.get('faecal_consistency')})!",
-            'severity': 'High',
-            'rule_triggered': 'GI_Feces'
-        })
-        abnormal_indicator_count += 1
-
-    # Udder Health Issue
-    if data.get('milk_production', 0) < THRESHOLDS['milk_production_low']:
-        detected_diseases.append('Udder Health Issue')
-        generated_alerts.append({
-            'symptom': 'milk_production',
-            'value': data.get('milk_production'),
-            'message': f"Very low milk production detected ({data.get('milk_production')} L/day)!",
-            'severity': 'Medium',
-            'rule_triggered': 'Udder_MilkProd'
-        })
-        abnormal_indicator_count += 1
-
-    # Reproductive Disease
-    if data.get('body_condition_score', 0) < THRESHOLDS['body_condition_score_low_reproductive'] and \
-       data.get('heart_rate', 0) > THRESHOLDS['heart_rate_high_reproductive']:
-        detected_diseases.append('Reproductive Disease')
-        generated_alerts.append({
-            'symptom': 'body_condition_score',
-            'value': data.get('body_condition_score'),
-            'message': f"Low body condition score detected ({data.get('body_condition_score')})!",
-            'severity': 'Medium',
-            'rule_triggered': 'Reproductive_BCS'
-        })
-        generated_alerts.append({
-            'symptom': 'heart_rate',
-            'value': data.get('heart_rate'),
-            'message': f"High heart rate detected ({data.get('heart_rate')} bpm)!",
-            'severity': 'Medium',
-            'rule_triggered': 'Reproductive_HR'
-        })
-        abnormal_indicator_count += 2
-
-    # Musculoskeletal Issue
-    if data.get('walking_capacity', 0) < THRESHOLDS['walking_capacity_low']:
-        detected_diseases.append('Lameness / Musculoskeletal Issue')
-        generated_alerts.append({
-            'symptom': 'walking_capacity',
-            'value': data.get('walking_capacity'),
-            'message': f"Low walking capacity detected ({data.get('walking_capacity')} steps/day)!",
-            'severity': 'High',
-            'rule_triggered': 'Musculoskeletal_Walking'
-        })
-        abnormal_indicator_count += 1
-
-    # Systemic Infection
-    if data.get('body_temperature', 0) > THRESHOLDS['body_temperature_high_systemic'] and \
-       data.get('heart_rate', 0) > THRESHOLDS['heart_rate_high_systemic'] and \
-       data.get('respiratory_rate', 0) > THRESHOLDS['respiratory_rate_high_systemic']:
-        detected_diseases.append('Systemic Infection')
-        generated_alerts.append({
-            'symptom': 'body_temperature',
-            'value': data.get('body_temperature'),
-            'message': f"Critically high body temperature detected ({data.get('body_temperature')}°C)!",
-            'severity': 'Critical',
-            'rule_triggered': 'Systemic_Temp'
-        })
-        generated_alerts.append({
-            'symptom': 'heart_rate',
-            'value': data.get('heart_rate'),
-            'message': f"Critically high heart rate detected ({data.get('heart_rate')} bpm)!",
-            'severity': 'Critical',
-            'rule_triggered': 'Systemic_HR'
-        })
-        generated_alerts.append({
-            'symptom': 'respiratory_rate',
-            'value': data.get('respiratory_rate'),
-            'message': f"Critically high respiratory rate detected ({data.get('respiratory_rate')} breaths/min)!",
-            'severity': 'Critical',
-            'rule_triggered': 'Systemic_RR'
-        })
-        abnormal_indicator_count += 3
-
-    # Remove duplicate alert messages and sort by severity
-    unique_alerts_by_message = {}
-    for alert in generated_alerts:
-        unique_alerts_by_message[alert['message']] = alert
-    final_alerts_list = list(unique_alerts_by_message.values())
-
-    severity_order = {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1}
-    final_alerts_list.sort(key=lambda x: severity_order.get(x.get('severity', 'Low'), 0), reverse=True)
-
-    return list(set(detected_diseases)), final_alerts_list, abnormal_indicator_count
+def report_invalid_values(problems):
+    for problem in problems:
+        invalid_values.inc(problem["field"], problem["error"])
+    log_sampled(logging.WARNING, "Invalid input values: %s", problems)
 
+# --- Upper bound on readings accepted by /predict/batch in one request ---
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
 
-# --- 2. Initialize Flask App ---
-app = Flask(__name__)
-CORS(app)
+# --- /predict/stream: concurrent streams, micro-batch window (size / wait) and read-ahead buffer ---
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 8))
+STREAM_MAX_BATCH = int(os.environ.get('STREAM_MAX_BATCH', 256))
+STREAM_MAX_WAIT_MS = float(os.environ.get('STREAM_MAX_WAIT_MS', 50))
+STREAM_MAX_PENDING = int(os.environ.get('STREAM_MAX_PENDING', 4096))
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
 
-# --- 3. Define the /predict API endpoint ---
-@app.route('/predict', methods=['POST'])
-def predict(): # REMOVED 'async'
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
+# --- /predict micro-batching: concurrent single readings are scored together on one inference thread ---
+# INFERENCE_MAX_WAIT_MS bounds the queueing delay a request can pick up; INFERENCE_BATCHING=0 scores inline
+INFERENCE_BATCHING = os.environ.get('INFERENCE_BATCHING', '1') != '0'
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 64))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 2))
+INFERENCE_MAX_PENDING = int(os.environ.get('INFERENCE_MAX_PENDING', 1024))
+INFERENCE_TIMEOUT_MS = float(os.environ.get('INFERENCE_TIMEOUT_MS', 5000))
 
-    data = request.get_json()
-    print(f"Received data: {data}")
+# --- Opt-in request profiling, enabled by setting PROFILE_TOKEN. A request is profiled when it is sent
+# with "X-Profile: 1" and the token in X-Profile-Token, or at random during a profiling window
+# (PROFILE_SAMPLE_RATE from startup, or opened through POST /profile). Sampled stacks are
+# written in collapsed-stack format (flamegraph.pl, speedscope) to PROFILE_DIR, one file per process.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 3600))
+request_profiler = RequestProfiler(
+    PROFILE_TOKEN,
+    StackSampler(
+        interval_seconds=max(float(os.environ.get('PROFILE_INTERVAL_MS', 2)), 0.5) / 1000,
+        max_stacks=int(os.environ.get('PROFILE_MAX_STACKS', 5000)),
+        # Threads that score and store on behalf of requests
+        background_threads=('inference-batcher', 'firestore-write-behind', 'sqlite-writer'),
+    ),
+    output_dir=os.environ.get('PROFILE_DIR', 'profiles'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    max_concurrent=max(int(os.environ.get('PROFILE_MAX_CONCURRENT', 2)), 1),
+    flush_seconds=float(os.environ.get('PROFILE_FLUSH_SECONDS', 60)),
+) if PROFILE_TOKEN else None
+if request_profiler:
+    atexit.register(request_profiler.write)
 
-    required_input_features = [
-        'body_temperature', 'breed_type', 'milk_production',
-        'respiratory_rate', 'walking_capacity', 'sleeping_duration',
-        'body_condition_score', 'heart_rate', 'eating_duration',
-        'lying_down_duration', 'ruminating', 'rumen_fill', 'faecal_consistency'
-    ]
+# --- Prediction cache: model outputs keyed on the raw input values, cleared when the model changes ---
+# PREDICTION_CACHE_ROUNDING (e.g. "body_temperature:1,walking_capacity:-2") lets near-identical
+# readings share an entry; PREDICTION_CACHE_SIZE=0 disables the cache
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get('PREDICTION_CACHE_TTL_SECONDS', 300))
+prediction_cache = PredictionCache(
+    required_input_features,
+    max_entries=PREDICTION_CACHE_SIZE,
+    ttl_seconds=PREDICTION_CACHE_TTL_SECONDS,
+    rounding=parse_rounding(os.environ.get('PREDICTION_CACHE_ROUNDING')),
+) if PREDICTION_CACHE_SIZE > 0 else None
 
-    if not all(feature in data for feature in required_input_features):
-        missing_features = [feature for feature in required_input_features if feature not in data]
-        return jsonify({"error": "Missing features in input", "missing": missing_features}), 400
+# --- Per-animal state: an animal whose inputs stay within tolerance keeps its last prediction,
+# and with WRITE_ON_CHANGE its latest-state document is only rewritten when its status / risk
+# level / alert set changed (plus one every ANIMAL_STATE_HEARTBEAT_SECONDS). History rows are
+# appended for every reading either way. Tolerances default to exact matches;
+# e.g. ANIMAL_STATE_TOLERANCE="body_temperature:0.05,heart_rate:2". ANIMAL_STATE=0 disables both.
+ANIMAL_STATE = os.environ.get('ANIMAL_STATE', '1') != '0'
+WRITE_ON_CHANGE = os.environ.get('WRITE_ON_CHANGE', '1') != '0'
+animal_state = AnimalStateTable(
+    tolerances=parse_tolerances(os.environ.get('ANIMAL_STATE_TOLERANCE')),
+    heartbeat_seconds=float(os.environ.get('ANIMAL_STATE_HEARTBEAT_SECONDS', 900)),
+    max_animals=int(os.environ.get('ANIMAL_STATE_MAX_ANIMALS', 100000)),
+) if ANIMAL_STATE else None
 
-    input_df = pd.DataFrame([data])
+# --- Rolling temporal features per animal (EWMA, rolling mean / std / slope, deviation from baseline) ---
+# Opt-in with TEMPORAL_FEATURES=1: every reading updates its animal's windows in O(1), responses
+# gain "temporal_features", and rules can test those fields (e.g. body_temperature_slope_6 > 0.1).
+# Readings are placed in time by their "timestamp" (epoch seconds or ISO), else their arrival time.
+# State is per process: under serve.py with several workers each one sees only part of an animal's readings.
+TEMPORAL_FEATURES = os.environ.get('TEMPORAL_FEATURES', '0') == '1'
+temporal_engine = TemporalFeatureEngine(
+    signals=[s.strip() for s in os.environ.get('TEMPORAL_SIGNALS', '').split(',') if s.strip()] or None,
+    windows=parse_windows(os.environ.get('TEMPORAL_WINDOWS', '6,24')),
+    ewma_span=float(os.environ.get('TEMPORAL_EWMA_SPAN', 6)),
+    baseline_span=float(os.environ.get('TEMPORAL_BASELINE_SPAN', 96)),
+    max_animals=int(os.environ.get('TEMPORAL_MAX_ANIMALS', 100000)),
+) if TEMPORAL_FEATURES else None
 
-    # --- Feature Engineering (MUST mirror training) ---
-    epsilon = 1e-6
-    input_df['activity_ratio'] = input_df['walking_capacity'] / (input_df['sleeping_duration'] + epsilon)
-    input_df['eating_efficiency'] = input_df['milk_production'] / (input_df['eating_duration'] + epsilon)
-    input_df['vital_sign_index'] = (input_df['heart_rate'] + input_df['respiratory_rate'] + input_df['body_temperature']) / 3
+def update_temporal_features(records):
+    """Feeds readings to their animals' rolling windows; returns one feature dict per reading (None when disabled)."""
+    if not temporal_engine:
+        return None
+    return temporal_engine.as_dicts(temporal_engine.update_many(records))
 
-    # --- Categorical Encoding (MUST mirror training: Use LabelEncoder) ---
-    # Handle 'breed_type'
-    breed_type_val = input_df['breed_type'].iloc[0]
-    if breed_type_val in le_breed.classes_:
-        input_df['breed_type_enc'] = le_breed.transform([breed_type_val])[0]
-    else:
-        fallback_breed_type_idx = 0
-        print(f"Warning: Unseen breed_type '{breed_type_val}' in input. Encoding as '{le_breed.classes_[fallback_breed_type_idx]}' ({fallback_breed_type_idx}).")
-        input_df['breed_type_enc'] = fallback_breed_type_idx
-
-    # Handle 'faecal_consistency'
-    faecal_consistency_val = input_df['faecal_consistency'].iloc[0]
-    if faecal_consistency_val in le_faecal.classes_:
-        input_df['faecal_consistency_enc'] = le_faecal.transform([faecal_consistency_val])[0]
-    else:
-        fallback_faecal_idx = 0
-        print(f"Warning: Unseen faecal_consistency '{faecal_consistency_val}' in input. Encoding as '{le_faecal.classes_[fallback_faecal_idx]}' ({fallback_faecal_idx}).")
-        input_df['faecal_consistency_enc'] = fallback_faecal_idx
+def with_temporal_features(data, temporal_features):
+    # Untracked animals (TEMPORAL_MAX_ANIMALS reached) have no values; rules then see the reading alone
+    return {**data, **{name: value for name, value in temporal_features.items() if value is not None}}
 
-    # Drop the original categorical columns now that they are encoded
-    input_df = input_df.drop(columns=original_categorical_cols)
+# --- Rule-Based Alerts (versioned rule file, compiled at load and hot-reloaded on change) ---
+RULES_PATH = os.environ.get('RULES_PATH', DEFAULT_RULES_PATH)
+RULES_RELOAD_SECONDS = float(os.environ.get('RULES_RELOAD_SECONDS', 5))
+try:
+    rule_book = RuleBook(RULES_PATH, check_interval=RULES_RELOAD_SECONDS if RULES_RELOAD_SECONDS >= 0 else None)
+except (OSError, ValueError) as e:
+    log.error("Error loading rules from %s: %s", RULES_PATH, e)
+    exit() # Exit if the rules aren't loaded, as alerts would silently stop
 
-    # --- Prepare final DataFrame for model by selecting and ordering features ---
-    final_input_df_for_model = pd.DataFrame(0, index=input_df.index, columns=training_features_for_model)
+def get_rule_based_alerts(data):
+    return rule_book.current().evaluate(data)
 
-    for col in training_features_for_model:
-        if col in input_df.columns:
-            final_input_df_for_model[col] = input_df[col]
-        else:
-            print(f"Warning: Feature '{col}' not found in processed input_df. Using default 0.")
 
-    # Ensure all columns are numeric before scaling
-    for col in final_input_df_for_model.columns:
-        final_input_df_for_model[col] = pd.to_numeric(final_input_df_for_model[col], errors='coerce')
-        if final_input_df_for_model[col].isnull().any():
-            print(f"Warning: NaN detected in numeric column {col}. Filling with 0.")
-            final_input_df_for_model[col].fillna(0, inplace=True)
+# Response timestamps have one-second resolution: format each second once, not once per reading
+_timestamp_cache = (None, None)
 
-    # --- Scale features with the scaler fitted on training data ---
-    X_processed_scaled = scaler.transform(final_input_df_for_model)
+def current_timestamp():
+    global _timestamp_cache
+    second = int(time.time())
+    cached_second, text = _timestamp_cache
+    if cached_second != second:
+        text = datetime.datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        _timestamp_cache = (second, text)
+    return text
 
-    # Make prediction
-    prediction = model.predict(X_processed_scaled)
-    predicted_label_encoded = prediction[0]
-    predicted_health_status = le_health.inverse_transform([predicted_label_encoded])[0]
 
-    # Get prediction probabilities
-    probabilities = model.predict_proba(X_processed_scaled)[0]
+# --- Helper Function to Consolidate ML + Rule Output for the Dashboard ---
+def build_prediction_response(data, predicted_health_status, probabilities, rule_result=None, temporal_features=None):
+    class_names = serving_model.class_names
     confidence = max(probabilities) * 100
-    probability_dict = {
-        le_health.inverse_transform([i])[0]: round(probabilities[i]*100, 2)
-        for i in range(len(le_health.classes_))
-    }
+    # (one numpy rounding for all classes: the same values round() gives per numpy scalar, far cheaper)
+    probability_dict = dict(zip(class_names, np.multiply(probabilities, 100).round(2).tolist()))
 
     # --- Rule-Based Disease Detection and Alert Generation Part ---
-    rule_based_diseases, structured_alerts_list, abnormal_indicator_count = get_rule_based_alerts(data)
+    # (batch callers pass the row's precomputed RuleEngine.evaluate_many() result)
+    if rule_result is None:
+        rule_result = get_rule_based_alerts(with_temporal_features(data, temporal_features) if temporal_features else data)
+    rule_based_diseases, structured_alerts_list, abnormal_indicator_count = rule_result
 
     # --- Consolidate and Finalize Output for Dashboard ---
     overall_health_status = predicted_health_status.capitalize()
@@ -305,9 +495,9 @@ def predict(): # REMOVED 'async'
                             overall_health_status = "Observation"
 
     # Final structured output dictionary
-    response_data = {
+    response = {
         "cattle_id": data.get('cattle_id', 'Unknown'),
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": current_timestamp(),
         "monitoring_results": {
             "health_status": overall_health_status,
             "confidence": f"{confidence:.2f}%",
@@ -321,30 +511,816 @@ def predict(): # REMOVED 'async'
         "alerts": structured_alerts_list,
         "input_data_snapshot": data
     }
+    if temporal_features is not None:
+        response["temporal_features"] = temporal_features
+    return response
+
+
+# --- Response formats: "full" (the dashboard view above) or "compact" for high-volume gateway clients ---
+# Chosen per request with ?format=full|compact, or server-wide with RESPONSE_FORMAT. Compact results
+# leave out the input echo and carry numeric confidence and probabilities, the latter as an array in
+# the order of the model's classes ("classes" in /predict and /predict/batch bodies, and on /models).
+RESPONSE_FORMATS = ('full', 'compact')
+RESPONSE_FORMAT = os.environ.get('RESPONSE_FORMAT', 'full')
+
+def requested_response_format():
+    response_format = request.args.get('format', RESPONSE_FORMAT)
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(RESPONSE_FORMATS)}")
+    return response_format
+
+
+def compact_prediction_response(response_data):
+    # (error entries of batch and stream results pass through unchanged)
+    if "monitoring_results" not in response_data:
+        return response_data
+    monitoring_results = response_data["monitoring_results"]
+    detail = response_data["ml_predictions_detail"]
+    probabilities = list(detail["prediction_probabilities"].values())
+    compact = {
+        "cattle_id": response_data["cattle_id"],
+        "timestamp": response_data["timestamp"],
+        "health_status": monitoring_results["health_status"],
+        "risk_level": monitoring_results["risk_level"],
+        "confidence": max(probabilities),
+        "predicted_class": detail["predicted_class"],
+        "probabilities": probabilities,
+        "diseases": response_data["specific_diseases_detected"],
+        "alerts": response_data["alerts"],
+    }
+    if "temporal_features" in response_data:
+        compact["temporal_features"] = response_data["temporal_features"]
+    if "input_warnings" in response_data:
+        compact["input_warnings"] = response_data["input_warnings"]
+    return compact
+
+
+# --- Helper Function to Encode a Prediction Body (JSON, or MessagePack if the client's Accept prefers it) ---
+def encode_response(body):
+    mimetype, encode = response_encoder(request.accept_mimetypes)
+    return Response(encode(body), mimetype=mimetype)
+
+
+# --- Helper Function for Vectorized Scoring of Many Readings ---
+def predict_with(serving, records, raw_columns=None):
+    """
+    Runs the same feature engineering, label encoding, ordering and scaling as
+    /predict, but over all readings at once so a 10k-row batch costs a handful
+    of column operations instead of 10k per-row builds, then one forest pass.
+    With shadow scoring on, the readings and outputs are also handed to the candidate.
+
+    Args:
+        serving (ServingModel): The version to score with (read once by the caller).
+        records (list): Reading dicts that already carry every required input feature.
+        raw_columns (dict, optional): Filled with the raw numeric input columns for reuse.
 
-    # --- Save to Firestore ---
-    if db:
+    Returns:
+        tuple: (predicted labels, (n, n_classes) probability matrix)
+    """
+    preprocessing_warnings, preprocessing_issues = [], {}
+    start = time.perf_counter()
+    predicted_labels, all_probabilities = serving.predict_records(records, preprocessing_warnings, raw_columns, preprocessing_issues)
+    elapsed = time.perf_counter() - start
+    report_preprocessing(preprocessing_warnings, preprocessing_issues)
+    shadow = shadow_scorer
+    if shadow:
+        shadow.submit(records, predicted_labels, all_probabilities, elapsed, serving.version)
+    return predicted_labels, all_probabilities
+
+
+# --- Helper Function to Resolve the Firestore User for this Request ---
+def get_request_user_id():
+    user_id = request.headers.get('X-User-Id')
+    if not user_id:
+        log_sampled(logging.WARNING, "'X-User-Id' header not found. Using 'anonymous_flask_user'.")
+        user_id = 'anonymous_flask_user'
+    return user_id
+
+
+# --- Helper Function to Hand Prediction Results to the Storage Backend ---
+def save_predictions(results, user_id):
+    if not storage_backend:
+        log_sampled(logging.DEBUG, "No storage backend configured, skipping database save.")
+        return
+
+    start = time.perf_counter()
+    to_save = []
+    for response_data in results:
+        if response_data.get('cattle_id'):
+            to_save.append(response_data)
+        else:
+            log_sampled(logging.WARNING, "cattle_id missing in response_data, skipping database save.")
+
+    # Every result is appended to history; unchanged animals (same status, risk level and alerts
+    # as their last write) keep their latest-state document as it is
+    latest = animal_state.latest_changes(user_id, to_save) if animal_state and WRITE_ON_CHANGE else None
+
+    # Backends only queue here; commits happen off the request path
+    if to_save:
+        storage_backend.save_predictions(user_id, to_save, latest)
+    observe_stage('storage_write', time.perf_counter() - start)
+
+
+# --- Helper Function to Validate and Score Many Readings in One Pass ---
+def score_records(records):
+    """
+    Scores a list of readings with one vectorized preprocessing pass and one forest pass.
+
+    Returns:
+        tuple: (results aligned with records, with error entries for invalid rows;
+                the successfully scored results, ready to save)
+    """
+    # Rows missing inputs or (unless INPUT_VALIDATION=flag) with invalid values get an error entry
+    # in place; the rest are scored together
+    results = [None] * len(records)
+    readings = []
+    for i, data in enumerate(records):
+        if isinstance(data, dict):
+            readings.append(i)
+        else:
+            results[i] = {"error": "Reading must be a JSON object", "index": i}
+
+    start = time.perf_counter()
+    invalid = input_schema.validate_many(
+        [records[i] for i in readings], check_values=INPUT_VALIDATION != 'off', coerce_invalid=INPUT_VALIDATION == 'flag')
+    observe_stage('validate', time.perf_counter() - start)
+    flagged = {}
+    for j, (missing_features, problems) in invalid.items():
+        i = readings[j]
+        if missing_features:
+            results[i] = {"error": "Missing features in input", "missing": missing_features, "index": i}
+            continue
+        report_invalid_values(problems)
+        if INPUT_VALIDATION == 'reject':
+            results[i] = {"error": "Invalid input values", "invalid": problems, "index": i}
+        else:
+            flagged[i] = problems
+    valid_indices = [i for i in readings if results[i] is None] if invalid else readings
+
+    if not valid_indices:
+        return results, []
+
+    valid_records = [records[i] for i in valid_indices]
+    scored = []
+    for i, response_data in zip(valid_indices, score_valid_records(valid_records)):
+        if "error" in response_data:
+            response_data["index"] = i
+        else:
+            if i in flagged:
+                response_data["input_warnings"] = flagged[i]
+            scored.append(response_data)
+        results[i] = response_data
+
+    return results, scored
+
+
+def score_valid_records(records):
+    outputs, raw_columns = model_outputs(records)
+    temporal_rows = update_temporal_features(records)
+
+    # One column-wise rule pass for every row (reusing the extracted columns when there are any)
+    start = time.perf_counter()
+    if temporal_rows is None:
+        temporal_rows = [None] * len(records)
+        rule_results = rule_book.current().evaluate_many(records, raw_columns)
+    else:
+        rule_inputs = [with_temporal_features(data, features) for data, features in zip(records, temporal_rows)]
+        rule_results = rule_book.current().evaluate_many(rule_inputs, raw_columns)
+    built = time.perf_counter()
+    observe_stage('rules', built - start)
+
+    # (a reading the rules could not evaluate comes back as its ValueError and gets an error entry)
+    responses = [
+        build_prediction_response(data, predicted_health_status, probabilities, rule_result, temporal_features)
+        if not isinstance(rule_result, ValueError) else {"error": str(rule_result)}
+        for data, (predicted_health_status, probabilities), rule_result, temporal_features in zip(records, outputs, rule_results, temporal_rows)
+    ]
+    observe_stage('response_build', time.perf_counter() - built)
+    return responses
+
+
+# --- Helper Function to Get Model Outputs for Many Readings, Skipping Work Where Possible ---
+def model_outputs(records):
+    """
+    Returns (label, probabilities) for each validated reading. Animals whose inputs stayed
+    within tolerance reuse their last output, resent readings hit the prediction cache, and
+    only the rest go through one vectorized preprocessing and forest pass.
+
+    Returns:
+        tuple: (outputs aligned with records; the raw input columns when every row was
+                preprocessed, else None)
+    """
+    if not prediction_cache and not animal_state:
+        raw_columns = {}
+        predicted_labels, all_probabilities = predict_with(serving_model, records, raw_columns)
+        return list(zip(predicted_labels, all_probabilities)), raw_columns
+
+    state_generation = animal_state.generation if animal_state else None
+    cache_generation = prediction_cache.generation if prediction_cache else None
+    # (read after the generations: outputs of a model swapped out meanwhile are not stored)
+    serving = serving_model
+    outputs = animal_state.reusable_outputs(records) if animal_state else [None] * len(records)
+    pending = [i for i, output in enumerate(outputs) if output is None]
+
+    keys = {}
+    if prediction_cache:
+        for i in pending:
+            keys[i] = prediction_cache.key(records[i])
+            outputs[i] = prediction_cache.get(keys[i])
+    misses = [i for i in pending if outputs[i] is None]
+
+    raw_columns = None
+    if misses:
+        raw_columns = {}
+        miss_records = records if len(misses) == len(records) else [records[i] for i in misses]
+        predicted_labels, all_probabilities = predict_with(serving, miss_records, raw_columns)
+        for i, predicted_health_status, probabilities in zip(misses, predicted_labels, all_probabilities):
+            # Copy the row so a cached entry doesn't keep the whole batch matrix alive
+            outputs[i] = (predicted_health_status, probabilities.copy())
+            if prediction_cache:
+                prediction_cache.put(keys[i], outputs[i], cache_generation)
+        # The extracted columns only line up with the rows when every row was preprocessed
+        if len(misses) != len(records):
+            raw_columns = None
+
+    if animal_state and pending:
+        animal_state.record_scored([records[i] for i in pending], [outputs[i] for i in pending], state_generation)
+    return outputs, raw_columns
+
+
+# --- Helper Function to Score One Reading (the /predict path) ---
+def score_reading(data):
+    # --- An animal whose inputs stayed within tolerance keeps its last prediction ---
+    output = animal_state.reusable_output(data) if animal_state else None
+    if output is None:
+        output = predict_reading(data)
+    predicted_health_status, probabilities = output
+    temporal_features = update_temporal_features([data])[0] if temporal_engine else None
+
+    start = time.perf_counter()
+    try:
+        rule_result = get_rule_based_alerts(with_temporal_features(data, temporal_features) if temporal_features else data)
+    except ValueError as e:
+        return {"error": str(e)}
+    built = time.perf_counter()
+    observe_stage('rules', built - start)
+    response_data = build_prediction_response(data, predicted_health_status, probabilities, rule_result, temporal_features)
+    observe_stage('response_build', time.perf_counter() - built)
+    return response_data
+
+
+def predict_reading(data):
+    state_generation = animal_state.generation if animal_state else None
+
+    # --- Resent (or, with rounding, near-identical) readings reuse the cached model output ---
+    cache_generation = prediction_cache.generation if prediction_cache else None
+    cache_key = prediction_cache.key(data) if prediction_cache else None
+    output = prediction_cache.get(cache_key) if cache_key is not None else None
+
+    if output is None:
+        serving = serving_model
+        # --- Build the model input row (encoding, engineering, ordering and, for sklearn, scaling),
+        # then a single forest pass: predicted class is the argmax of the probabilities ---
+        preprocessing_warnings, preprocessing_issues = [], {}
+        start = time.perf_counter()
+        output = serving.predict_reading(data, preprocessing_warnings, preprocessing_issues)
+        elapsed = time.perf_counter() - start
+        report_preprocessing(preprocessing_warnings, preprocessing_issues)
+
+        shadow = shadow_scorer
+        if shadow:
+            shadow.submit([data], [output[0]], [output[1]], elapsed, serving.version)
+        if cache_key is not None:
+            prediction_cache.put(cache_key, output, cache_generation)
+
+    if animal_state:
+        animal_state.record_scored([data], [output], state_generation)
+    return output
+
+
+# --- Micro-batch scorer behind /predict ---
+# Below this many readings the per-row fast path beats the vectorized one (fixed per-pass overhead)
+VECTORIZED_MIN_ROWS = 8
+
+def score_readings(records):
+    if len(records) < VECTORIZED_MIN_ROWS:
+        return [score_reading(data) for data in records]
+    return score_valid_records(records)
+
+
+inference_batcher = InferenceBatcher(
+    score_readings,
+    max_batch_size=max(INFERENCE_MAX_BATCH, 1),
+    max_wait_seconds=max(INFERENCE_MAX_WAIT_MS, 0.0) / 1000,
+    max_pending=INFERENCE_MAX_PENDING,
+) if INFERENCE_BATCHING else None
+
+
+# --- Helper Function to Read a Batch Body (JSON array or NDJSON) ---
+def parse_batch_body():
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        records = []
+        for line_number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {line_number}: {e}")
+        return records
+
+    if not request.is_json:
+        raise ValueError("Request must be JSON or NDJSON")
+
+    body = request.get_json()
+    # Accept either a bare array or {"readings": [...]}
+    if isinstance(body, dict):
+        body = body.get('readings')
+    if not isinstance(body, list):
+        raise ValueError("Batch body must be a JSON array of readings")
+    return body
+
+
+# --- Startup: load the model, run every scoring path once, then report ready ---
+def warm_up(serving):
+    # A synthetic reading at the training means exercises preprocessing, the forest and the rule engine
+    builder = serving.feature_builder
+    reading = {name: float(builder.mean[i]) for i, name in enumerate(builder.training_features) if name in required_input_features}
+    reading.update(cattle_id='warm-up', breed_type=builder.breed_classes[0], faecal_consistency=builder.faecal_classes[0])
+    serving.predict_reading(reading, [])
+    serving.predict_records([reading] * 64, [])
+    rule_book.current().evaluate_many([reading] * 64)
+
+
+def start_serving():
+    global serving_model
+    try:
+        loaded = load_live_model()
+        startup_status.update(stage="warming_up", load_seconds=round(time.monotonic() - startup_started, 3))
+        warm_up_started = time.monotonic()
+        warm_up(loaded)
+        # (timed from here on: warm-up and golden vector checks stay out of the stage histograms)
+        loaded.observe = observe_stage
+        serving_model = loaded
+        load_shadow_candidate()
+        startup_status.update(stage="ready", warmup_seconds=round(time.monotonic() - warm_up_started, 3), version=loaded.version)
+        serving_ready.set()
+        log.info("Ready after %.2fs (%s startup, model version %s).", time.monotonic() - startup_started, STARTUP_MODE, loaded.version)
+    except FileNotFoundError as e:
+        startup_status.update(stage="failed", error=str(e))
+        log.error("Error loading a required file: %s. Make sure all .joblib files are in the same directory.", e)
+    except Exception as e:
+        startup_status.update(stage="failed", error=str(e))
+        log.error("An unexpected error occurred during loading: %s", e)
+
+
+def reload_model():
+    """
+    Loads, verifies and warms up the live model again (after retraining, or when the registry's
+    live pointer moved), then swaps it in with a single assignment: requests already running
+    finish on the version they started with. If anything fails the current model stays in place.
+
+    Returns:
+        bool: True if the new model is now serving.
+    """
+    global serving_model, model, scaler, le_health, le_breed, le_faecal, training_features_for_model
+    if model_registry and serving_model and model_registry.live_version() == serving_model.version:
+        # Registry versions never change in place; only the shadow candidate may have moved
+        load_shadow_candidate()
+        return True
+
+    previous = (model, scaler, le_health, le_breed, le_faecal, training_features_for_model)
+    try:
+        loaded = load_live_model()
+        warm_up(loaded)
+    except Exception as e:
+        (model, scaler, le_health, le_breed, le_faecal, training_features_for_model) = previous
+        log.error("Model reload failed, keeping the current model: %s", e)
+        return False
+    loaded.observe = observe_stage
+    serving_model = loaded
+    if prediction_cache:
+        prediction_cache.clear()
+    if animal_state:
+        animal_state.forget_predictions()
+    load_shadow_candidate()
+    startup_status.update(version=loaded.version)
+    log.info("Model reloaded (version %s).", loaded.version)
+    return True
+
+
+def watch_model_registry():
+    """Follows the registry pointer in a single-process server (serve.py's master does it for its workers)."""
+    failed_version = None
+    while True:
+        time.sleep(MODEL_RELOAD_SECONDS)
+        if not serving_ready.is_set():
+            continue
         try:
-            user_id = request.headers.get('X-User-Id')
-            if not user_id:
-                print("Flask Warning: 'X-User-Id' header not found. Using 'anonymous_flask_user'.")
-                user_id = 'anonymous_flask_user'
-            
-            app_id = os.environ.get('CANVAS_APP_ID', 'default_app_id_for_local') 
-
-            if response_data.get('cattle_id'):
-                doc_ref = db.collection(f'artifacts/{app_id}/users/{user_id}/cattle_data').document(response_data['cattle_id'])
-                doc_ref.set(response_data) # REMOVED 'await'
-                print(f"Flask: Data for Cattle ID {response_data['cattle_id']} saved to Firestore successfully for user {user_id}.")
-            else:
-                print("Flask Warning: cattle_id missing in response_data, skipping Firestore save.")
-        except Exception as firestore_e:
-            print(f"Flask ERROR: Failed to save data to Firestore: {firestore_e}")
+            live_version = model_registry.live_version()
+        except (OSError, ValueError) as e:
+            log.warning("Could not read the model registry pointer: %s", e)
+            continue
+        if live_version and live_version not in (serving_model.version, failed_version):
+            failed_version = None if reload_model() else live_version
+        else:
+            load_shadow_candidate()
+
+
+if STARTUP_MODE == 'lazy' and not SERVE_PREFORK:
+    # A failed load keeps the process up with /ready red (and the reason in it) instead of exiting
+    threading.Thread(target=start_serving, name='startup', daemon=True).start()
+else:
+    # (the prefork master loads in the foreground, so workers are forked warm and thread-free)
+    start_serving()
+    if not serving_ready.is_set():
+        exit() # Exit if models aren't loaded, as app won't function
+
+if model_registry and not SERVE_PREFORK and MODEL_RELOAD_SECONDS > 0:
+    threading.Thread(target=watch_model_registry, name='model-registry', daemon=True).start()
+
+
+# --- Helper Function to Refuse Scoring Until Startup Has Finished ---
+def not_ready_response():
+    response = jsonify({"error": "Model is not ready yet", "stage": startup_status["stage"], "detail": startup_status["error"]})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+# --- 2. Initialize Flask App ---
+app = Flask(__name__)
+CORS(app)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request_profiler and request.path not in ('/profile', '/metrics'):
+        g.profile = request_profiler.begin(request.headers.get('X-Profile'), request.headers.get('X-Profile-Token'))
+
+@app.after_request
+def count_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_count.inc(endpoint, str(response.status_code))
+    if 'request_started' in g:
+        request_seconds.observe(time.perf_counter() - g.request_started, endpoint)
+    return response
+
+@app.teardown_request
+def end_request_profile(exc):
+    # (for streamed responses teardown runs once the stream is finished)
+    handle = g.pop('profile', None)
+    if handle is not None:
+        request_profiler.end(handle)
+
+# --- 3. Define the /predict API endpoint ---
+@app.route('/predict', methods=['POST'])
+def predict(): # REMOVED 'async'
+    if not serving_ready.is_set():
+        return not_ready_response()
+    try:
+        response_format = requested_response_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Announced before the body is parsed, so an open micro-batch window waits for this reading
+    with (inference_batcher.reserve() if inference_batcher else contextlib.nullcontext()) as submit:
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+
+        start = time.perf_counter()
+        data = request.get_json()
+        observe_stage('decode', time.perf_counter() - start)
+
+        if not isinstance(data, dict):
+            return jsonify({"error": "Reading must be a JSON object"}), 400
+        start = time.perf_counter()
+        missing_features, problems = validate_reading(data)
+        observe_stage('validate', time.perf_counter() - start)
+        if missing_features:
+            return jsonify({"error": "Missing features in input", "missing": missing_features}), 400
+        if problems and INPUT_VALIDATION == 'reject':
+            return jsonify({"error": "Invalid input values", "invalid": problems}), 400
+        log_sampled(logging.DEBUG, "Received reading for cattle_id %s", data.get('cattle_id'))
+
+        if submit is None:
+            response_data = score_reading(data)
+        else:
+            try:
+                response_data = submit(data).result(timeout=INFERENCE_TIMEOUT_MS / 1000)
+            except (queue.Full, concurrent.futures.TimeoutError):
+                response = jsonify({"error": "Inference queue is saturated; retry later"})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+        if "error" in response_data:
+            return jsonify(response_data), 400
+        if problems:
+            response_data["input_warnings"] = problems
+
+    readings_scored.inc('/predict')
+
+    # --- Save to the storage backend (queued; committed in the background) ---
+    save_predictions([response_data], get_request_user_id())
+
+    start = time.perf_counter()
+    if response_format == 'compact':
+        response_data = dict(compact_prediction_response(response_data), classes=serving_model.class_names)
+    response = encode_response(response_data)
+    observe_stage('serialize', time.perf_counter() - start)
+    return response
+
+# --- 3b. Define the /predict/batch API endpoint ---
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    if not serving_ready.is_set():
+        return not_ready_response()
+
+    start = time.perf_counter()
+    try:
+        response_format = requested_response_format()
+        records = parse_batch_body()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    observe_stage('decode', time.perf_counter() - start)
+
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large; at most {MAX_BATCH_SIZE} readings per request", "received": len(records)}), 413
+
+    log_sampled(logging.DEBUG, "Received batch of %d reading(s)", len(records))
+
+    results, scored = score_records(records)
+    readings_scored.inc('/predict/batch', amount=len(scored))
+    save_predictions(scored, get_request_user_id())
+
+    start = time.perf_counter()
+    if response_format == 'compact':
+        results = [compact_prediction_response(result) for result in results]
+    mimetype, encode = response_encoder(request.accept_mimetypes)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl') and encode is dumps_json:
+        response = Response(dumps_ndjson(results), mimetype=NDJSON_MIMETYPE)
     else:
-        print("Flask: Firestore client not initialized, skipping database save.")
+        body = {"count": len(results), "scored": len(scored), "results": results}
+        if response_format == 'compact':
+            body["classes"] = serving_model.class_names
+        response = Response(encode(body), mimetype=mimetype)
+    observe_stage('serialize', time.perf_counter() - start)
+    return response
+
+# --- 3c. Define the /predict/stream API endpoint (long-lived NDJSON ingestion) ---
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    if not serving_ready.is_set():
+        return not_ready_response()
+
+    # Per-stream window overrides (e.g. ?max_batch=64&max_wait_ms=10), capped by the server settings
+    try:
+        max_batch = min(int(request.args.get('max_batch', STREAM_MAX_BATCH)), STREAM_MAX_BATCH)
+        max_wait_ms = min(float(request.args.get('max_wait_ms', STREAM_MAX_WAIT_MS)), STREAM_MAX_WAIT_MS)
+    except ValueError:
+        return jsonify({"error": "max_batch and max_wait_ms must be numbers"}), 400
+    try:
+        compact = requested_response_format() == 'compact'
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Explicit backpressure at the connection level: refuse new streams beyond the configured limit
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({"error": f"Too many open streams (limit {MAX_STREAMS}); retry later"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    user_id = get_request_user_id()
+    batcher = MicroBatcher(
+        iter_ndjson(iter_body_lines(request.environ)),
+        max_batch_size=max(max_batch, 1),
+        max_wait_seconds=max(max_wait_ms, 0.0) / 1000,
+        max_pending=STREAM_MAX_PENDING,
+    )
+
+    def generate():
+        received = 0
+        try:
+            for window in batcher:
+                # Lines that were not valid JSON come through as ValueErrors
+                records = [item if not isinstance(item, ValueError) else None for _, item in window]
+                results, scored = score_records(records)
+                for (line_number, item), result in zip(window, results):
+                    result.pop('index', None)
+                    if isinstance(item, ValueError):
+                        result['error'] = str(item)
+                    if 'error' in result:
+                        result['line'] = line_number
+                readings_scored.inc('/predict/stream', amount=len(scored))
+                save_predictions(scored, user_id)
+                received += len(window)
+                start = time.perf_counter()
+                chunk = dumps_ndjson([compact_prediction_response(result) for result in results] if compact else results)
+                observe_stage('serialize', time.perf_counter() - start)
+                yield chunk
+        except Exception as e:
+            yield dumps_json({"error": f"Stream aborted: {e}", "received": received}) + b"\n"
+        finally:
+            close_stream()
+            log_sampled(logging.INFO, "Stream closed after %d reading(s).", received)
+
+    closed = []
+    def close_stream():
+        if not closed:
+            closed.append(True)
+            batcher.close()
+            stream_slots.release()
+
+    # Also run when the server closes the response: a client gone before the first chunk never
+    # starts the generator, so its finally would not run
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    response.call_on_close(close_stream)
+    return response
+
+# --- 3d. Per-animal history for a date range (Firestore buckets or SQLite/Parquet) ---
+@app.route('/history/<cattle_id>', methods=['GET'])
+def history(cattle_id):
+    if not storage_backend:
+        return jsonify({"error": "No storage backend configured"}), 503
+
+    try:
+        today = datetime.date.today()
+        start = datetime.date.fromisoformat(request.args.get('from', today.isoformat()))
+        end = datetime.date.fromisoformat(request.args.get('to', start.isoformat()))
+    except ValueError:
+        return jsonify({"error": "'from' and 'to' must be YYYY-MM-DD dates"}), 400
+    if end < start or (end - start).days > 31:
+        return jsonify({"error": "Date range must be ascending and at most 31 days"}), 400
+
+    readings = storage_backend.query_history(get_request_user_id(), cattle_id, start, end)
+    return jsonify({"cattle_id": cattle_id, "from": start.isoformat(), "to": end.isoformat(), "count": len(readings), "readings": readings})
+
+# --- 3e. Storage backend metrics ---
+@app.route('/storage/stats', methods=['GET'])
+def storage_stats():
+    if not storage_backend:
+        return jsonify({"backend": "none"})
+    return jsonify(storage_backend.stats())
+
+# --- 3f. Rule configuration: active version and on-demand reload ---
+@app.route('/rules', methods=['GET'])
+def rules_status():
+    return jsonify(rule_book.stats())
+
+@app.route('/rules/reload', methods=['POST'])
+def rules_reload():
+    reloaded = rule_book.reload()
+    status = rule_book.stats()
+    if not reloaded:
+        return jsonify(status), 422
+    return jsonify(status)
+
+# --- 3g. Readiness: green only once the model is loaded and warmed up ---
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = dict(startup_status, ready=serving_ready.is_set(), pid=os.getpid())
+    return jsonify(status), (200 if status["ready"] else 503)
+
+# --- 3h. /predict micro-batching metrics ---
+@app.route('/inference/stats', methods=['GET'])
+def inference_stats():
+    if not inference_batcher:
+        return jsonify({"batching": False})
+    return jsonify(dict(inference_batcher.stats(), batching=True, max_batch=inference_batcher.max_batch_size, max_wait_ms=INFERENCE_MAX_WAIT_MS))
+
+# --- 3i. Prediction cache metrics ---
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if not prediction_cache:
+        return jsonify({"enabled": False})
+    return jsonify(dict(prediction_cache.stats(), enabled=True))
+
+# --- 3j. Per-animal state metrics (inference reuse and skipped writes) ---
+@app.route('/animals/stats', methods=['GET'])
+def animal_stats():
+    if not animal_state:
+        return jsonify({"enabled": False})
+    return jsonify(dict(animal_state.stats(), enabled=True, write_on_change=WRITE_ON_CHANGE))
+
+# --- 3k. Rolling temporal feature state ---
+@app.route('/temporal/stats', methods=['GET'])
+def temporal_stats():
+    if not temporal_engine:
+        return jsonify({"enabled": False})
+    return jsonify(dict(temporal_engine.stats(), enabled=True))
+
+# --- 3l. Model versions (registry pointer, live manifest, shadow comparison) ---
+@app.route('/models', methods=['GET'])
+def models():
+    live = serving_model
+    status = {
+        "registry": model_registry.root if model_registry else None,
+        "live": live.version if live else None,
+        "live_metadata": (live.manifest or {}).get("metadata") if live else None,
+        "live_classes": live.class_names if live else None,
+        "versions": [],
+        "candidate": None,
+        "shadow": shadow_scorer.stats() if shadow_scorer else None,
+    }
+    if model_registry:
+        try:
+            status["versions"] = model_registry.versions()
+            status["candidate"] = model_registry.candidate_version()
+        except (OSError, ValueError) as e:
+            status["error"] = str(e)
+    return jsonify(status)
+
+# --- 3m. Prometheus metrics: request and stage histograms plus the counters kept by each component ---
+def component_stats(component, *fields):
+    """Collects numeric fields from a component's stats() (None when the component is disabled)."""
+    def collect():
+        if not component():
+            return None
+        stats = component().stats()
+        return {(field,): stats[field] for field in fields if field in stats}
+    return collect
+
+def storage_commit_seconds():
+    if not storage_backend:
+        return None
+    stats = storage_backend.stats()
+    total_ms = stats.get('total_flush_ms', stats.get('total_insert_ms'))
+    return None if total_ms is None else total_ms / 1000
+
+metrics.gauge_callback('info', 'Process serving this scrape (metrics are kept per process) and its model version.',
+                       lambda: {(str(os.getpid()), str(serving_model.version if serving_model else None)): 1}, ('pid', 'model_version'))
+metrics.gauge_callback('ready', '1 once the model is loaded and warmed up.', lambda: int(serving_ready.is_set()))
+metrics.counter_callback('prediction_cache_events_total', 'Prediction cache lookups and removals.',
+                         component_stats(lambda: prediction_cache, 'hits', 'misses', 'evictions', 'expirations', 'invalidations'), ('event',))
+metrics.counter_callback('animal_state_events_total', 'Per-animal reuse of the last prediction and latest-state writes skipped because nothing changed.',
+                         component_stats(lambda: animal_state, 'reused', 'scored', 'writes', 'skipped_writes'), ('event',))
+metrics.counter_callback('inference_batcher_events_total', '/predict micro-batches and the readings scored in them.',
+                         component_stats(lambda: inference_batcher, 'batches', 'scored'), ('event',))
+metrics.gauge_callback('inference_batcher_pending', 'Readings waiting for the /predict inference thread.',
+                       lambda: inference_batcher.stats()['pending'] if inference_batcher else None)
+# Firestore reports commit failures, spills and replays; SQLite reports failed inserts
+metrics.counter_callback('storage_events_total', 'Storage writes, commit failures, spills and replays.',
+                         component_stats(lambda: storage_backend, 'enqueued', 'written', 'inserted', 'commit_failures', 'write_failures',
+                                         'spilled', 'replayed', 'flushes', 'insert_batches', 'rolled_over'), ('event',))
+metrics.counter_callback('storage_commit_seconds_total', 'Time the storage writer thread spent committing (off the request path).',
+                         storage_commit_seconds)
+metrics.gauge_callback('storage_queue_depth', 'Results waiting for the storage writer thread.',
+                       lambda: storage_backend.stats().get('queue_depth') if storage_backend else None)
+metrics.counter_callback('shadow_events_total', 'Shadow-scored readings, disagreements with the live model, drops and errors.',
+                         component_stats(lambda: shadow_scorer, 'rows', 'disagreements', 'dropped', 'errors'), ('event',))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+# --- 3n. Request profiling: open / close a sampling window and fetch the collapsed stacks ---
+def profiler_denied():
+    if not request_profiler:
+        return jsonify({"error": "Profiling is disabled (set PROFILE_TOKEN)"}), 404
+    if not request_profiler.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"error": "Missing or invalid X-Profile-Token"}), 403
+    return None
+
+metrics.counter_callback('profiler_events_total', 'Requests profiled or skipped (concurrency limit) and stack samples taken or dropped.',
+                         component_stats(lambda: request_profiler, 'profiled_requests', 'skipped_requests', 'samples', 'dropped_samples'), ('event',))
+
+@app.route('/profile', methods=['GET'])
+def profile_stacks():
+    denied = profiler_denied()
+    if denied:
+        return denied
+    if request.args.get('format') == 'json':
+        return jsonify(request_profiler.stats())
+    body = request_profiler.sampler.collapsed()
+    if request.args.get('reset') == '1':
+        request_profiler.reset()
+    return Response(body, mimetype='text/plain')
+
+@app.route('/profile', methods=['POST'])
+def profile_start():
+    denied = profiler_denied()
+    if denied:
+        return denied
+    options = request.get_json(silent=True) or {}
+    try:
+        sample_rate = float(options.get('sample_rate', 0.01))
+        seconds = min(float(options.get('seconds', 300)), PROFILE_MAX_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate and seconds must be numbers"}), 400
+    if not 0 < sample_rate <= 1 or seconds <= 0:
+        return jsonify({"error": "sample_rate must be in (0, 1] and seconds positive"}), 400
+    request_profiler.start(sample_rate, seconds)
+    log.info("Profiling %.1f%% of requests for %.0fs.", sample_rate * 100, seconds)
+    return jsonify(request_profiler.stats())
 
-    return jsonify(response_data)
+@app.route('/profile', methods=['DELETE'])
+def profile_stop():
+    denied = profiler_denied()
+    if denied:
+        return denied
+    written = request_profiler.stop()
+    return jsonify(dict(request_profiler.stats(), written=written))
 
 # --- 4. Run the Flask App ---
+# (development server; production runs `python serve.py`: prefork workers sharing one loaded model)
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,661 @@
+# benchmark.py
+# Micro-benchmarks for the /predict hot path.
+# Run from the flask-api directory (next to the .joblib files):
+#     python benchmark.py                 # run every benchmark
+#     python benchmark.py preprocessing   # run a single one
+#
+# Each benchmark reports the per-call latency of the fast path and of the reference path it
+# replaces (kept in reference.py). Output parity between the two is tested by the test_*.py
+# modules (python -m pytest -q); benchmarks not covered there still check it first.
+# End-to-end service latency / throughput (with JSON results for release comparisons) is
+# measured by loadtest.py instead.
+
+import datetime
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from features import NUMERIC_INPUT_FEATURES, FeatureBuilder
+from inference import FlatForest, HealthPredictor
+from reference import (FakeFirestore, le_breed, le_faecal, le_health, legacy_inference, legacy_preprocess, legacy_rule_alerts, legacy_training_features,
+                       make_readings, model, recompute_temporal_features, scaler, training_features_for_model)
+from rules import RuleEngine
+from schema import InputSchema
+from storage import SQLiteBackend, WriteBehindQueue
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+
+def time_per_call(fn, inputs, repeat=3):
+    """Best-of-`repeat` mean seconds per call of fn over inputs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        best = min(best, (time.perf_counter() - start) / len(inputs))
+    return best
+
+
+def report(name, reference_s, fast_s):
+    print(f"{name:<28} reference {reference_s * 1e6:9.1f} us/call   fast {fast_s * 1e6:9.1f} us/call   speedup {reference_s / fast_s:6.1f}x")
+
+
+# --- Benchmarks ---
+def bench_preprocessing():
+    print("\n== Preprocessing: pandas DataFrame path vs FeatureBuilder ==")
+    readings = make_readings(2000)
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+
+    # Bit-identical check, single-row and batch
+    for data in readings:
+        expected = legacy_preprocess(data)
+        got = builder.build_scaled_row(data)
+        assert expected.tobytes() == got.tobytes(), f"Mismatch for {data['cattle_id']}: {expected} vs {got}"
+    expected_matrix = np.vstack([legacy_preprocess(data) for data in readings])
+    assert expected_matrix.tobytes() == builder.build_scaled_matrix(readings).tobytes(), "Batch matrix mismatch"
+    print(f"Parity OK: {len(readings)} readings bit-identical (single-row and batch)")
+
+    sample = readings[:500]
+    report("single row", time_per_call(legacy_preprocess, sample), time_per_call(builder.build_scaled_row, sample))
+
+    batch = make_readings(10000, seed=7)
+    start = time.perf_counter()
+    builder.build_scaled_matrix(batch)
+    batch_s = time.perf_counter() - start
+    print(f"{'batch of 10k (matrix)':<28} {batch_s * 1e3:.1f} ms total, {batch_s / len(batch) * 1e6:.2f} us/row")
+
+
+def bench_pipeline():
+    print("\n== Shared feature pipeline: training-time featurization ==")
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+    df = pd.read_excel(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cattle_dataset.xlsx'))
+    report('training matrix', time_per_call(legacy_training_features, [df]), time_per_call(lambda frame: builder.build_scaled_matrix(frame.to_dict('records')), [df]))
+
+
+def bench_inference():
+    print("\n== Inference: predict + predict_proba + inverse_transform vs HealthPredictor ==")
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+    predictor = HealthPredictor(model, le_health)
+    rows = [builder.build_scaled_row(data) for data in make_readings(100)]
+
+    def fused(X_row):
+        label, probabilities = predictor.predict_one(X_row)
+        probability_dict = {
+            predictor.class_names[i]: round(probabilities[i]*100, 2)
+            for i in range(len(predictor.class_names))
+        }
+        return label, probabilities, probability_dict
+
+    report("single row", time_per_call(legacy_inference, rows), time_per_call(fused, rows))
+
+
+def bench_forest():
+    print("\n== Forest: sklearn predict_proba on scaled rows vs FlatForest on raw rows ==")
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+    forest = FlatForest.from_sklearn(model, scaler)
+    X_raw = builder.build_matrix(make_readings(5000))
+
+    rows = [X_raw[i:i + 1] for i in range(200)]
+    report("single row", time_per_call(lambda X: model.predict_proba(scaler.transform(X)), rows), time_per_call(forest.predict_proba, rows))
+
+    X_batch = X_raw[:5000]
+    start = time.perf_counter()
+    model.predict_proba(scaler.transform(X_batch))
+    sklearn_s = time.perf_counter() - start
+    start = time.perf_counter()
+    forest.predict_proba(X_batch)
+    flat_s = time.perf_counter() - start
+    report("batch of 5k (per row)", sklearn_s / len(X_batch), flat_s / len(X_batch))
+
+
+def bench_write_behind():
+    print("\n== Storage: synchronous document.set() vs WriteBehindQueue.enqueue() (fake Firestore, 5 ms RTT) ==")
+    results = [{'cattle_id': data['cattle_id'], 'reading': data} for data in make_readings(200)]
+    collection_path = 'artifacts/bench/users/bench/cattle_data'
+    spill_dir = tempfile.mkdtemp()
+
+    # Request-path cost: blocking set() per prediction vs enqueue()
+    client = FakeFirestore()
+    sync_s = time_per_call(lambda r: client.collection(collection_path).document(r['cattle_id']).set(r), results, repeat=1)
+    writer = WriteBehindQueue(client, spill_path=os.path.join(spill_dir, 'spill.jsonl')).start()
+    async_s = time_per_call(lambda r: writer.enqueue(collection_path, r['cattle_id'], r), results)
+    writer.stop()
+    report("request-path write", sync_s, async_s)
+    stats = writer.stats()
+    print(f"{'queue flushes':<28} {stats['flushes']} commits, avg {stats['avg_flush_ms']} ms, max {stats['max_flush_ms']} ms")
+
+
+def bench_sqlite():
+    print("\n== Storage: embedded SQLite store (WAL, batched inserts, indexed range queries) ==")
+    store = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'telemetry.db'), rollover_days=0)
+    readings = make_readings(500)
+    day = datetime.date.today()
+    results = []
+    for minute in range(100):
+        for data in readings:
+            results.append({
+                'cattle_id': data['cattle_id'],
+                'timestamp': f"{day.isoformat()} {minute // 60:02d}:{minute % 60:02d}:00",
+                'monitoring_results': {'health_status': 'Healthy', 'risk_level': 'Low', 'confidence': '90.00%'},
+                'alerts': [],
+                'input_data_snapshot': data,
+            })
+
+    start = time.perf_counter()
+    for offset in range(0, len(results), 500):
+        store.save_predictions('bench_user', results[offset:offset + 500])
+    enqueue_s = time.perf_counter() - start
+    store.flush()
+    total_s = time.perf_counter() - start
+    stats = store.stats()
+    assert stats['inserted'] == len(results), stats
+    print(f"{'insert ' + str(len(results)) + ' rows':<28} enqueue {enqueue_s / len(results) * 1e6:.1f} us/row, "
+          f"committed at {len(results) / total_s:,.0f} rows/s in {stats['insert_batches']} transactions")
+
+    history = store.query_history('bench_user', readings[7]['cattle_id'], day, day)
+    assert len(history) == 100, len(history)
+    query_s = time_per_call(lambda cattle_id: store.query_history('bench_user', cattle_id, day, day), [data['cattle_id'] for data in readings[:100]])
+    print(f"{'range query (100 rows)':<28} {query_s * 1e3:.2f} ms/query")
+    store.close()
+
+
+def bench_rules():
+    print("\n== Rules: per-reading if-chain vs column-wise RuleEngine.evaluate_many ==")
+    engine = RuleEngine.from_file()
+    readings = make_readings(100000)
+    report("single reading", time_per_call(legacy_rule_alerts, readings[:2000]), time_per_call(engine.evaluate, readings[:2000]))
+
+    # The synthetic readings alert on most rows; a herd where ~5% of animals are off-range is more typical
+    herd = [data if i % 20 == 0 else dict(data, walking_capacity=max(data['walking_capacity'], 9500),
+                                            milk_production=max(data['milk_production'], 8.5), faecal_consistency='ideal')
+            for i, data in enumerate(readings)]
+
+    # In /predict/batch the numeric columns come for free from FeatureBuilder.build_matrix()
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal)
+
+    # Every side keeps its results, as the batch path does while building responses. The collector
+    # is paused while timing: both sides allocate about the same number of containers, and gen-2
+    # passes over the 100k live input dicts otherwise add ~0.3 s of noise to each side.
+    for name, batch in (('synthetic', readings), ('herd', herd)):
+        raw_columns = {}
+        builder.build_matrix(batch, raw_columns=raw_columns)
+        timings = []
+        for evaluate in (lambda: [legacy_rule_alerts(data) for data in batch],
+                         lambda: engine.evaluate_many(batch),
+                         lambda: engine.evaluate_many(batch, raw_columns)):
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            results = evaluate()
+            timings.append(time.perf_counter() - start)
+            gc.enable()
+            del results
+        reference_s, fast_s, shared_s = timings
+        print(f"{'100k ' + name + ' readings':<28} reference {reference_s * 1e3:7.1f} ms   vectorized {fast_s * 1e3:7.1f} ms "
+              f"({reference_s / fast_s:3.1f}x)   with shared columns {shared_s * 1e3:7.1f} ms ({reference_s / shared_s:3.1f}x)")
+
+
+def bench_streaming():
+    print("\n== Streaming: /predict/stream NDJSON ingestion (micro-batched, one core) ==")
+    import json
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    client = flask_app.app.test_client()
+    readings = make_readings(20000)
+    body = "".join(json.dumps(data) + "\n" for data in readings).encode()
+
+    start = time.perf_counter()
+    response = client.post('/predict/stream', input_stream=io.BytesIO(body), content_type='application/x-ndjson')
+    lines = response.get_data().count(b"\n")
+    elapsed = time.perf_counter() - start
+    print(f"{'sustained throughput':<28} {len(readings) / elapsed:,.0f} readings/s ({lines} lines for {len(readings)} readings in {elapsed:.2f} s)")
+
+
+# Run in a fresh interpreter per startup mode: import the app, wait for /ready, then fork
+# two workers that each score a 100-reading batch and report how much of their memory is still shared
+STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+app.serving_ready.wait(120)
+ready = time.perf_counter() - start
+
+def memory_kb():
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        pass
+    return fields.get('Rss', 0), fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+
+rss_kb, _ = memory_kb()
+reading = {name: 1.0 for name in app.required_input_features}
+reading.update(breed_type=str(app.le_breed.classes_[0]), faecal_consistency=str(app.le_faecal.classes_[0]))
+workers = []
+for _ in range(2):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        app.score_records([reading] * 100)
+        os.write(write_fd, json.dumps(memory_kb()).encode())
+        os._exit(0)
+    os.close(write_fd)
+    workers.append((pid, read_fd))
+worker_memory = []
+for pid, read_fd in workers:
+    worker_memory.append(json.loads(os.read(read_fd, 4096)))
+    os.waitpid(pid, 0)
+print(json.dumps({'imported': imported, 'ready': ready, 'rss_kb': rss_kb, 'workers': worker_memory,
+                  'sklearn': 'sklearn' in sys.modules, 'pandas': 'pandas' in sys.modules}))
+"""
+
+
+def bench_concurrency():
+    print("\n== Concurrency: /predict from 16 client threads (inline scoring vs micro-batched inference thread) ==")
+    import contextlib
+    import queue
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    flask_app.serving_ready.wait()
+    batcher = flask_app.inference_batcher or flask_app.InferenceBatcher(flask_app.score_readings)
+    readings = make_readings(4000)
+    clients = 16
+
+    def run(mode_batcher):
+        flask_app.inference_batcher = mode_batcher
+        latencies = queue.SimpleQueue()
+
+        def client(k):
+            test_client = flask_app.app.test_client()
+            for i in range(k, len(readings), clients):
+                start = time.perf_counter()
+                test_client.post('/predict', json=readings[i])
+                latencies.put(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(k,)) for k in range(clients)]
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        samples = np.sort([latencies.get() for _ in range(len(readings))]) * 1000
+        return len(readings) / elapsed, np.percentile(samples, 50), np.percentile(samples, 99)
+
+    inline = run(None)
+    batched = run(batcher)
+    for name, (throughput, p50, p99) in (('inline', inline), ('micro-batched', batched)):
+        print(f"{name:<28} {throughput:>8,.0f} req/s   p50 {p50:6.2f} ms   p99 {p99:6.2f} ms")
+    print(f"{'mean window':<28} {batcher.stats()['mean_batch_size']:>8.1f} readings (max {batcher.max_batch_size}, wait <= {batcher.max_wait_seconds * 1000:.1f} ms)")
+
+
+def bench_cache():
+    print("\n== Prediction cache: steady herd of 500 animals resending readings ==")
+    import contextlib
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    from cache import PredictionCache
+    flask_app.serving_ready.wait()
+    herd = make_readings(500)
+    # Every animal resends its reading 20 times (ids differ, sensor values repeat)
+    resent = [dict(herd[i % len(herd)], cattle_id=f'RESEND{i:05d}') for i in range(10000)]
+    batches = [resent[start:start + 500] for start in range(0, len(resent), 500)]
+
+    cache = PredictionCache(flask_app.required_input_features, max_entries=10000)
+    # Cache only: per-animal reuse would not apply here anyway (every reading has a new cattle_id)
+    flask_app.animal_state = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        flask_app.prediction_cache = None
+        reference_single = time_per_call(flask_app.score_reading, resent[:2000])
+        reference_batch = time_per_call(flask_app.score_valid_records, batches, repeat=3) / 500
+
+        flask_app.prediction_cache = cache
+        cached_single = time_per_call(flask_app.score_reading, resent[:2000])
+        cached_batch = time_per_call(flask_app.score_valid_records, batches, repeat=3) / 500
+
+    report('/predict path (per reading)', reference_single, cached_single)
+    report('batch path (per reading)', reference_batch, cached_batch)
+    print(f"{'hit rate':<28} {cache.stats()['hit_rate']:.1%}")
+
+
+def bench_animal_state():
+    print("\n== Per-animal state: 1,000-animal herd, 20 rounds of small sensor drift ==")
+    import contextlib
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    from animal_state import AnimalStateTable
+    flask_app.serving_ready.wait()
+
+    class CountingBackend:
+        writes = 0
+        history_rows = 0
+
+        def save_predictions(self, user_id, results, latest=None):
+            self.history_rows += len(results)
+            self.writes += len(results) if latest is None else latest.count(True)
+
+    rng = np.random.default_rng(7)
+    herd = make_readings(1000)
+    rounds = []
+    for round_number in range(20):
+        readings = []
+        for data in herd:
+            reading = dict(data, cattle_id=data['cattle_id'])
+            # Sensor noise well inside tolerance; 2% of animals actually change each round
+            reading['body_temperature'] = round(data['body_temperature'] + float(rng.normal(0, 0.01)), 2)
+            if rng.random() < 0.02:
+                reading['heart_rate'] = int(rng.integers(40, 90))
+                data['heart_rate'] = reading['heart_rate']
+            readings.append(reading)
+        rounds.append(readings)
+
+    def run(state, one_by_one=False):
+        flask_app.animal_state, flask_app.prediction_cache = state, None
+        flask_app.storage_backend = backend = CountingBackend()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for readings in rounds[:5] if one_by_one else rounds:
+                if one_by_one:
+                    for data in readings:
+                        flask_app.save_predictions([flask_app.score_reading(data)], 'bench')
+                    continue
+                for batch_start in range(0, len(readings), 250):
+                    flask_app.save_predictions(flask_app.score_valid_records(readings[batch_start:batch_start + 250]), 'bench')
+            elapsed = time.perf_counter() - start
+        return elapsed / ((5 if one_by_one else len(rounds)) * len(herd)), backend.writes
+
+    saved = flask_app.animal_state, flask_app.prediction_cache, flask_app.storage_backend
+    try:
+        reference_s, reference_writes = run(None)
+        state = AnimalStateTable(tolerances={'body_temperature': 0.05})
+        fast_s, fast_writes = run(state)
+        reference_single_s, _ = run(None, one_by_one=True)
+        fast_single_s, _ = run(AnimalStateTable(tolerances={'body_temperature': 0.05}), one_by_one=True)
+    finally:
+        flask_app.animal_state, flask_app.prediction_cache, flask_app.storage_backend = saved
+
+    # In batches the vectorized forest pass is already a few us per reading, so reuse mainly saves
+    # writes there; one reading at a time (/predict) the skipped forest pass is most of the work
+    report('batches of 250 (per reading)', reference_s, fast_s)
+    report('one by one (per reading)', reference_single_s, fast_single_s)
+    print(f"{'forest passes skipped':<28} {state.stats()['reuse_rate']:.1%}")
+    print(f"{'latest-state writes':<28} {reference_writes:,} -> {fast_writes:,} ({reference_writes / max(fast_writes, 1):.1f}x fewer; "
+          f"every reading still appends a history row)")
+
+
+def bench_temporal():
+    print("\n== Temporal features: one new reading per animal, 100 animals, growing history ==")
+    from temporal import TemporalFeatureEngine
+
+    signals = ['body_temperature', 'heart_rate']
+    windows = (6, 24)
+    rng = np.random.default_rng(11)
+    animals = [f'cow-{i}' for i in range(100)]
+
+    print(f"{'history':>8} {'reference':>14} {'incremental':>14} {'speedup':>8}")
+    for history_length in (100, 1000, 10000):
+        engine = TemporalFeatureEngine(signals=signals, windows=windows, ewma_span=6)
+        times = 1.7e9 + 600.0 * np.arange(history_length + 1)
+        values = np.column_stack([rng.normal(38.6, 0.3, history_length + 1), rng.normal(65, 5, history_length + 1)])
+        histories = {cattle_id: [] for cattle_id in animals}
+        for step in range(history_length):
+            noisy = values[step] + rng.normal(0, 0.05, (len(animals), 2))
+            engine.update_arrays(animals, np.full(len(animals), times[step]), noisy)
+            if history_length <= 1000:
+                for cattle_id, row in zip(animals, noisy):
+                    histories[cattle_id].append([times[step], *row])
+        latest = values[-1] + rng.normal(0, 0.05, (len(animals), 2))
+
+        start = time.perf_counter()
+        engine.update_arrays(animals, np.full(len(animals), times[-1]), latest)
+        fast_s = (time.perf_counter() - start) / len(animals)
+        for extra in range(1, 6):
+            start = time.perf_counter()
+            engine.update_arrays(animals, np.full(len(animals), times[-1] + 600.0 * extra), latest)
+            fast_s = min(fast_s, (time.perf_counter() - start) / len(animals))
+
+        if history_length <= 1000:
+            start = time.perf_counter()
+            for cattle_id, row in zip(animals, latest):
+                recompute_temporal_features(histories[cattle_id] + [[times[-1], *row]], signals, windows)
+            reference_s = (time.perf_counter() - start) / len(animals)
+            print(f"{history_length:>8} {reference_s * 1e6:11.1f} us {fast_s * 1e6:11.2f} us {reference_s / fast_s:7.0f}x")
+        else:
+            print(f"{history_length:>8} {'-':>14} {fast_s * 1e6:11.2f} us {'':>8}")
+
+
+def bench_training():
+    print("\n== Training: cached dataset loading, column-wise featurization, parallel fitting ==")
+    import train
+    from sklearn.ensemble import RandomForestClassifier
+
+    dataset = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cattle_dataset.xlsx')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        parsed, _, cached = train.load_dataset(dataset, cache_dir)
+        parse_s = time.perf_counter() - start
+        start = time.perf_counter()
+        reloaded, _, cached = train.load_dataset(dataset, cache_dir)
+        cached_s = time.perf_counter() - start
+    assert cached and reloaded.equals(parsed), "Cached dataset differs from the parsed one"
+    print(f"dataset load                 parse {parse_s * 1000:8.1f} ms   cached {cached_s * 1000:8.1f} ms   speedup {parse_s / cached_s:6.1f}x")
+
+    # A large synthetic export: one dict per row (notebook) vs column arrays (train.py)
+    frame = pd.DataFrame(make_readings(20000) * 10)
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal)
+    assert builder.build_columns(frame).tobytes() == builder.build_matrix(frame.to_dict('records')).tobytes(), "Column-wise featurization mismatch"
+    start = time.perf_counter()
+    builder.build_matrix(frame.to_dict('records'))
+    rows_s = time.perf_counter() - start
+    start = time.perf_counter()
+    X = builder.build_columns(frame)
+    columns_s = time.perf_counter() - start
+    print(f"{f'featurize {len(frame):,} rows':<28} records {rows_s * 1000:8.1f} ms   columns {columns_s * 1000:8.1f} ms   speedup {rows_s / columns_s:6.1f}x")
+
+    # Per-tree seeds are fixed before fitting, so parallel fitting builds the same forest
+    y = (X[:, training_features_for_model.index('body_temperature')] > 39.2).astype(int)
+    X_fit, y_fit = X[:40000], y[:40000]
+    timings, forests = {}, {}
+    for n_jobs in (1, -1):
+        start = time.perf_counter()
+        forests[n_jobs] = RandomForestClassifier(n_estimators=50, random_state=42, n_jobs=n_jobs).fit(X_fit, y_fit)
+        timings[n_jobs] = time.perf_counter() - start
+    assert np.array_equal(forests[1].predict_proba(X[:2000]), forests[-1].predict_proba(X[:2000])), "Parallel forest differs"
+    print(f"{f'fit 50 trees x {len(X_fit):,} rows':<28} 1 core {timings[1]:8.2f} s    {os.cpu_count()} core(s) {timings[-1]:8.2f} s   speedup {timings[1] / timings[-1]:6.1f}x")
+
+
+def bench_startup():
+    print("\n== Startup: time to ready and memory per worker (eager .joblib vs lazy memory-mapped bundle) ==")
+    import json
+    import subprocess
+    print(f"{'mode':<8} {'import':>9} {'ready':>9} {'RSS':>9} {'worker RSS':>11} {'shared':>9} {'private':>9}  heavy imports")
+    for mode in ('eager', 'lazy'):
+        env = dict(os.environ, STARTUP_MODE=mode, STORAGE_BACKEND='none', PYTHONWARNINGS='ignore')
+        completed = subprocess.run([sys.executable, '-c', STARTUP_PROBE], env=env, capture_output=True, text=True, check=True)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        worker_rss, worker_private = result['workers'][-1]
+        heavy = ", ".join(name for name in ('sklearn', 'pandas') if result[name]) or "none"
+        print(f"{mode:<8} {result['imported'] * 1000:>7.0f}ms {result['ready'] * 1000:>7.0f}ms {result['rss_kb'] / 1024:>7.1f}MB "
+              f"{worker_rss / 1024:>9.1f}MB {(worker_rss - worker_private) / 1024:>7.1f}MB {worker_private / 1024:>7.1f}MB  {heavy}")
+
+
+def bench_metrics():
+    print("\n== Instrumentation: stage timers, unseen-category / NaN tallies, /metrics scrape ==")
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    from metrics import Histogram
+    flask_app.serving_ready.wait()
+    serving = flask_app.serving_model
+    builder = serving.feature_builder
+    readings = make_readings(2000)  # includes unseen breeds / faecal consistencies
+    batches = [readings[start:start + 500] for start in range(0, len(readings), 500)]
+
+    # Tallying must not change the features, and the row and batch paths must count the same readings
+    batch_issues, row_issues = {}, {}
+    assert builder.build_matrix(readings, None, None, batch_issues).tobytes() == builder.build_matrix(readings).tobytes(), "Tally changed the matrix"
+    for data in readings:
+        builder.build_row(data, None, row_issues)
+    assert batch_issues == row_issues, (batch_issues, row_issues)
+    assert batch_issues[('unseen_category', 'breed_type')] == sum(data['breed_type'] not in builder.breed_index for data in readings)
+
+    def overhead(name, untimed_s, timed_s):
+        print(f"{name:<28} untimed {untimed_s * 1e6:9.1f} us/call   timed {timed_s * 1e6:9.1f} us/call   overhead {(timed_s - untimed_s) * 1e6:+6.1f} us")
+
+    observe = serving.observe
+    try:
+        serving.observe = None
+        untimed_single = time_per_call(serving.predict_reading, readings)
+        untimed_batch = time_per_call(serving.predict_records, batches)
+        serving.observe = flask_app.observe_stage
+        timed_single = time_per_call(serving.predict_reading, readings)
+        timed_batch = time_per_call(serving.predict_records, batches)
+    finally:
+        serving.observe = observe
+    overhead('model call (1 reading)', untimed_single, timed_single)
+    overhead('model call (500 readings)', untimed_batch, timed_batch)
+
+    histogram = Histogram('bench_seconds', 'Benchmark observations.', ('stage',))
+    values = list(np.random.default_rng(0).exponential(0.0005, 100000))
+    print(f"{'histogram observe':<28} {time_per_call(lambda value: histogram.observe(value, 'inference'), values) * 1e9:9.0f} ns/call")
+    render_s = time_per_call(lambda _: flask_app.metrics.render(), range(200))
+    print(f"{'/metrics render':<28} {render_s * 1e6:9.1f} us/scrape ({len(flask_app.metrics.render().splitlines())} lines)")
+
+
+def bench_profiler():
+    print("\n== Request profiler: /predict with every request sampled vs profiling off ==")
+    import contextlib
+    import tempfile
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    from profiler import RequestProfiler, StackSampler
+    flask_app.serving_ready.wait()
+    client = flask_app.app.test_client()
+    readings = [dict(data, cattle_id=f'PROFILE{i:05d}') for i, data in enumerate(make_readings(2000))]
+
+    def post(data):
+        client.post('/predict', json=data)
+
+    profiler = RequestProfiler('bench', StackSampler(interval_seconds=0.002, background_threads=('inference-batcher',)), output_dir=tempfile.mkdtemp(prefix='profiles-'),
+                               sample_rate=1.0, max_concurrent=1)
+    previous, cache = flask_app.request_profiler, flask_app.prediction_cache
+    flask_app.prediction_cache = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            flask_app.request_profiler = None
+            reference = time_per_call(post, readings)
+            flask_app.request_profiler = profiler
+            profiled = time_per_call(post, readings)
+    finally:
+        flask_app.request_profiler, flask_app.prediction_cache = previous, cache
+    print(f"{'/predict request':<28} off {reference * 1e6:9.1f} us/call   profiled {profiled * 1e6:9.1f} us/call   "
+          f"overhead {(profiled / reference - 1) * 100:+5.1f}%")
+    stats = profiler.stats()
+    print(f"{'samples':<28} {stats['samples']:,} in {stats['stacks']} distinct stacks -> {profiler.write()}")
+
+
+def bench_responses():
+    print("\n== Response encoding: bytes and serialization time per prediction (500 results) ==")
+    os.environ.setdefault('STORAGE_BACKEND', 'none')
+    import app as flask_app
+    import encoding
+    flask_app.serving_ready.wait()
+    results = flask_app.score_valid_records(make_readings(500))
+    with flask_app.app.test_request_context():
+        reference_body = flask_app.jsonify(results[0]).get_data()
+
+        def reference(result):
+            return flask_app.jsonify(result).get_data()
+
+        def compact_json(result):
+            return encoding.dumps_json(flask_app.compact_prediction_response(result))
+
+        def compact_msgpack(result):
+            return encoding.dumps_msgpack(flask_app.compact_prediction_response(result))
+
+        candidates = [('full, fast JSON', encoding.dumps_json), ('compact, fast JSON', compact_json)]
+        if encoding.msgpack is not None:
+            candidates.append(('compact, MessagePack', compact_msgpack))
+        assert json.loads(encoding.dumps_json(results[0])) == json.loads(reference_body), "Fast JSON differs from jsonify"
+
+        reference_s = time_per_call(reference, results)
+        reference_bytes = sum(len(reference(result)) for result in results) / len(results)
+        print(f"{'full, jsonify (current)':<28} {reference_bytes:7.0f} bytes   {reference_s * 1e6:7.1f} us/prediction")
+        for name, encode in candidates:
+            seconds = time_per_call(encode, results)
+            size = sum(len(encode(result)) for result in results) / len(results)
+            print(f"{name:<28} {size:7.0f} bytes   {seconds * 1e6:7.1f} us/prediction   "
+                  f"{reference_bytes / size:4.1f}x smaller   {reference_s / seconds:5.1f}x faster")
+        if encoding.orjson is None:
+            print("(orjson not installed: fast JSON is json.dumps with compact separators)")
+        if encoding.msgpack is None:
+            print("(msgpack not installed: MessagePack skipped)")
+
+
+# --- Reference: the presence-only check predict() and score_records() used to run ---
+REQUIRED_INPUT_FEATURES = NUMERIC_INPUT_FEATURES + ['breed_type', 'faecal_consistency']
+
+def legacy_presence_check(data):
+    if not all(feature in data for feature in REQUIRED_INPUT_FEATURES):
+        return [feature for feature in REQUIRED_INPUT_FEATURES if feature not in data]
+    return None
+
+
+def bench_validation():
+    print("\n== Input validation: presence-only check vs compiled schema (types and ranges) ==")
+    schema = InputSchema(REQUIRED_INPUT_FEATURES)
+    readings = make_readings(20000)
+    report("single reading", time_per_call(legacy_presence_check, readings), time_per_call(schema.validate, readings))
+    for size in (100, 10000):
+        batches = [readings[i:i + size] for i in range(0, len(readings), size)]
+        reference_s = time_per_call(lambda batch: [legacy_presence_check(data) for data in batch], batches) / size
+        fast_s = time_per_call(schema.validate_many, batches) / size
+        report(f"batch of {size} (per reading)", reference_s, fast_s)
+
+
+BENCHMARKS = {
+    'preprocessing': bench_preprocessing,
+    'pipeline': bench_pipeline,
+    'inference': bench_inference,
+    'forest': bench_forest,
+    'write_behind': bench_write_behind,
+    'sqlite': bench_sqlite,
+    'rules': bench_rules,
+    'streaming': bench_streaming,
+    'concurrency': bench_concurrency,
+    'cache': bench_cache,
+    'animal_state': bench_animal_state,
+    'temporal': bench_temporal,
+    'training': bench_training,
+    'startup': bench_startup,
+    'metrics': bench_metrics,
+    'profiler': bench_profiler,
+    'responses': bench_responses,
+    'validation': bench_validation,
+}
+
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Choose from: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name]()
@@ -0,0 +1,131 @@
+# cache.py
+# LRU/TTL cache of model outputs in front of the forest.
+# Collars and the simulator often resend identical (or, after rounding, identical)
+# readings for the same animal; those skip encoding and the forest entirely. Only the
+# model output is cached: rules still run on the actual reading, so alert messages
+# carry its real values and rule file edits apply immediately.
+
+import collections
+import threading
+import time
+
+
+def parse_rounding(spec):
+    """
+    Parses a per-feature rounding spec such as "body_temperature:1,heart_rate:0".
+
+    Returns:
+        dict: feature -> decimal places.
+    """
+    rounding = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        feature, _, digits = item.partition(':')
+        if not digits:
+            raise ValueError(f"Rounding entry '{item}' must look like feature:digits")
+        rounding[feature.strip()] = int(digits)
+    return rounding
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a TTL, keyed on a reading's input feature values.
+
+    The key is the tuple of the fields' values in a fixed order, each rounded to its
+    configured decimal places (exact values otherwise; 40 and 40.0 share a key, as they
+    share a model input). Readings with a missing or unhashable value are not cached.
+
+    clear() starts a new generation: results computed for the previous model are
+    dropped, including ones still in flight when it was called.
+
+    Args:
+        fields (list): Input features that fully determine the model output, in key order.
+        max_entries (int): Entries kept before the least recently used is evicted.
+        ttl_seconds (float): Lifetime of an entry.
+        rounding (dict, optional): feature -> decimal places used for the key.
+    """
+
+    def __init__(self, fields, max_entries=10000, ttl_seconds=300.0, rounding=None):
+        self.fields = list(fields)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.rounding = dict(rounding or {})
+        unknown = set(self.rounding) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Rounding given for unknown feature(s): {', '.join(sorted(unknown))}")
+        self._digits = [(i, self.rounding[field]) for i, field in enumerate(self.fields) if field in self.rounding]
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.generation = 0
+
+        # --- Metrics ---
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def key(self, data):
+        """Returns the cache key for a reading, or None if it cannot be cached."""
+        try:
+            values = [data[field] for field in self.fields]
+            for i, digits in self._digits:
+                values[i] = round(values[i], digits)
+            key = tuple(values)
+            hash(key)
+        except (KeyError, TypeError):
+            return None
+        return key
+
+    def get(self, key):
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """Stores a value; ignored if it was computed before the last clear() (pass the generation read then)."""
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "rounding": self.rounding,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "generation": self.generation,
+        }
@@ -0,0 +1,24 @@
+# conftest.py
+# pytest setup for the flask-api tests:
+#     python -m pytest -q
+#
+# The service, benchmark.py and the tests open their artifacts (.joblib files, golden_vectors.json)
+# relative to the working directory, so tests always run from this directory.
+# test_api.py is a manual smoke script against a running server, not a pytest module.
+
+import os
+
+import pytest
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+collect_ignore = ['test_api.py']
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    """The app module, loaded once without a storage backend and ready to serve."""
+    os.environ['STORAGE_BACKEND'] = 'none'
+    import app
+    app.serving_ready.wait()
+    return app
@@ -0,0 +1,65 @@
+# encoding.py
+# Response body encoders for the prediction endpoints.
+# JSON goes through orjson when it is installed (it serializes straight to bytes, several times
+# faster than the json module; NaN becomes null), else json.dumps with compact separators.
+# MessagePack is offered to clients whose Accept header prefers it, when the msgpack package is
+# installed; everyone else gets JSON.
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+def _default(value):
+    # numpy scalars and arrays (probabilities come straight from the forest)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_json(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps_json(obj):
+        return json.dumps(obj, separators=(',', ':'), default=_default).encode()
+
+
+def dumps_ndjson(items):
+    return b"".join(dumps_json(item) + b"\n" for item in items)
+
+
+def dumps_msgpack(obj):
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def response_encoder(accept_mimetypes):
+    """
+    Picks the body encoding for a request's Accept header (werkzeug MIMEAccept).
+
+    Returns:
+        tuple: (mimetype, encode function returning bytes)
+    """
+    if msgpack is not None:
+        best = accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES)
+        if best in MSGPACK_MIMETYPES:
+            return best, dumps_msgpack
+    return JSON_MIMETYPE, dumps_json
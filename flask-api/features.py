@@ -0,0 +1,291 @@
+# features.py
+# The one feature pipeline shared by the training script and the API.
+# Turns raw reading dicts straight into float64 rows in MODEL_FEATURES order
+# (encoding, engineering, ordering, scaling) without building pandas DataFrames.
+# Training writes golden vectors with it; the API refuses a model whose golden
+# vectors its own pipeline does not reproduce bit for bit.
+
+import numpy as np
+
+EPSILON = 1e-6
+
+# --- Raw numeric inputs copied straight into the feature vector ---
+NUMERIC_INPUT_FEATURES = [
+    'body_temperature', 'milk_production', 'respiratory_rate', 'walking_capacity',
+    'sleeping_duration', 'body_condition_score', 'heart_rate', 'eating_duration',
+    'lying_down_duration', 'ruminating', 'rumen_fill'
+]
+
+
+# --- Model input columns, in the exact order the model is trained on ---
+MODEL_FEATURES = [
+    'body_temperature', 'breed_type_enc', 'milk_production', 'respiratory_rate',
+    'walking_capacity', 'sleeping_duration', 'body_condition_score', 'heart_rate',
+    'eating_duration', 'lying_down_duration', 'ruminating', 'rumen_fill',
+    'faecal_consistency_enc', 'activity_ratio', 'eating_efficiency', 'vital_sign_index'
+]
+
+# Written next to the model artifacts by the training script
+DEFAULT_GOLDEN_VECTORS_PATH = 'golden_vectors.json'
+
+# --- Golden readings: typical values plus the edge cases both sides must treat the same way ---
+GOLDEN_READINGS = [
+    {'body_temperature': 38.6, 'breed_type': 'Cross Breed', 'milk_production': 18.4, 'respiratory_rate': 28,
+     'walking_capacity': 9800, 'sleeping_duration': 5.2, 'body_condition_score': 3, 'heart_rate': 64,
+     'eating_duration': 3.4, 'lying_down_duration': 12.5, 'ruminating': 5.6, 'rumen_fill': 3,
+     'faecal_consistency': 'ideal'},
+    {'body_temperature': 40.2, 'breed_type': 'Normal Breed', 'milk_production': 9.5, 'respiratory_rate': 45,
+     'walking_capacity': 8500, 'sleeping_duration': 5.1, 'body_condition_score': 2, 'heart_rate': 75,
+     'eating_duration': 2.7, 'lying_down_duration': 11.0, 'ruminating': 4.5, 'rumen_fill': 2,
+     'faecal_consistency': 'Black faece'},
+    # Unseen categories encode as class 0; zero durations hit the epsilon guard
+    {'body_temperature': 39.1, 'breed_type': 'Holstein', 'milk_production': 12.0, 'respiratory_rate': 36,
+     'walking_capacity': 4000, 'sleeping_duration': 0, 'body_condition_score': 4, 'heart_rate': 88,
+     'eating_duration': 0.0, 'lying_down_duration': 16.0, 'ruminating': 2.0, 'rumen_fill': 1,
+     'faecal_consistency': 'watery'},
+    # Numeric strings are parsed; missing and unparsable values become 0 (after NaN fill)
+    {'body_temperature': '38.9', 'breed_type': 'Cross Breed', 'milk_production': None, 'respiratory_rate': 'n/a',
+     'walking_capacity': 11250, 'sleeping_duration': 7.5, 'body_condition_score': 5, 'heart_rate': 52,
+     'eating_duration': 4.9, 'lying_down_duration': 9.0, 'ruminating': 6.9, 'rumen_fill': 5,
+     'faecal_consistency': None},
+]
+
+
+def to_float(value):
+    """Mirrors pd.to_numeric(errors='coerce') for a single value: unparsable -> NaN."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _tally(issues, key, count):
+    issues[key] = issues.get(key, 0) + count
+
+
+class FeatureBuilder:
+    """
+    Precompiled mapping from a raw reading to the model's feature vector.
+
+    Column positions, category->index lookup tables and scaler constants are all
+    resolved once at load time, so building a row is a fixed sequence of float
+    stores. The arithmetic is done in the same order as the original pandas path,
+    so outputs are bit-identical to it.
+
+    Args:
+        training_features (list): Exact feature order the model was trained on.
+        le_breed (LabelEncoder): Fitted breed_type encoder.
+        le_faecal (LabelEncoder): Fitted faecal_consistency encoder.
+        scaler (StandardScaler, optional): Fitted scaler; enables scale()/build_scaled_*().
+    """
+
+    def __init__(self, training_features, le_breed, le_faecal, scaler=None):
+        self.training_features = list(training_features)
+        self.n_features = len(self.training_features)
+        position = {name: idx for idx, name in enumerate(self.training_features)}
+
+        # (input key, output column) pairs for the plain numeric copies
+        self.numeric_slots = [(name, position[name]) for name in NUMERIC_INPUT_FEATURES]
+        self.breed_slot = position['breed_type_enc']
+        self.faecal_slot = position['faecal_consistency_enc']
+        self.activity_ratio_slot = position['activity_ratio']
+        self.eating_efficiency_slot = position['eating_efficiency']
+        self.vital_sign_index_slot = position['vital_sign_index']
+
+        # Raw inputs the engineered features are derived from
+        self.walking_capacity_slot = position['walking_capacity']
+        self.sleeping_duration_slot = position['sleeping_duration']
+        self.milk_production_slot = position['milk_production']
+        self.eating_duration_slot = position['eating_duration']
+        self.heart_rate_slot = position['heart_rate']
+        self.respiratory_rate_slot = position['respiratory_rate']
+        self.body_temperature_slot = position['body_temperature']
+
+        # Category -> encoded index tables replace LabelEncoder.transform; unseen values fall back to 0
+        self.breed_classes = list(le_breed.classes_)
+        self.faecal_classes = list(le_faecal.classes_)
+        self.breed_index = {label: float(idx) for idx, label in enumerate(self.breed_classes)}
+        self.faecal_index = {label: float(idx) for idx, label in enumerate(self.faecal_classes)}
+
+        self.mean = None
+        self.scale_ = None
+        if scaler is not None:
+            self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+            self.scale_ = np.asarray(scaler.scale_, dtype=np.float64)
+
+    # --- Single reading ---
+    def build_row(self, data, warnings=None, issues=None):
+        """
+        Builds the unscaled (1, n_features) float64 vector for one reading dict.
+
+        Unseen categories and NaN fills are appended to `warnings` (if given) so the
+        caller decides whether and how to report them, and tallied in `issues` (if given,
+        a dict of ('unseen_category', field) / ('nan_fill', feature) -> readings affected).
+        """
+        values = [0.0] * self.n_features
+        for name, slot in self.numeric_slots:
+            values[slot] = to_float(data.get(name))
+
+        breed_type_val = data.get('breed_type')
+        breed_enc = self.breed_index.get(breed_type_val) if isinstance(breed_type_val, str) else None
+        if breed_enc is None:
+            breed_enc = 0.0
+            if warnings is not None:
+                warnings.append(f"Unseen breed_type '{breed_type_val}' in input. Encoding as '{self.breed_classes[0]}' (0).")
+            if issues is not None:
+                _tally(issues, ('unseen_category', 'breed_type'), 1)
+        values[self.breed_slot] = breed_enc
+
+        faecal_consistency_val = data.get('faecal_consistency')
+        faecal_enc = self.faecal_index.get(faecal_consistency_val) if isinstance(faecal_consistency_val, str) else None
+        if faecal_enc is None:
+            faecal_enc = 0.0
+            if warnings is not None:
+                warnings.append(f"Unseen faecal_consistency '{faecal_consistency_val}' in input. Encoding as '{self.faecal_classes[0]}' (0).")
+            if issues is not None:
+                _tally(issues, ('unseen_category', 'faecal_consistency'), 1)
+        values[self.faecal_slot] = faecal_enc
+
+        # Python floats are IEEE doubles, so scalar arithmetic here matches the vectorized path bit for bit
+        values[self.activity_ratio_slot] = values[self.walking_capacity_slot] / (values[self.sleeping_duration_slot] + EPSILON)
+        values[self.eating_efficiency_slot] = values[self.milk_production_slot] / (values[self.eating_duration_slot] + EPSILON)
+        values[self.vital_sign_index_slot] = (values[self.heart_rate_slot] + values[self.respiratory_rate_slot] + values[self.body_temperature_slot]) / 3
+
+        row = np.array([values], dtype=np.float64)
+        self._fill_nan(row, warnings, issues)
+        return row
+
+    # --- Many readings ---
+    def build_matrix(self, records, warnings=None, raw_columns=None, issues=None):
+        """
+        Builds the unscaled (n, n_features) float64 matrix for a list of reading dicts.
+
+        If `raw_columns` is a dict, the raw value list pulled out for each numeric input
+        is stored in it, so later column-wise passes (the rule engine) can reuse it.
+        """
+        n = len(records)
+        X = np.empty((n, self.n_features), dtype=np.float64)
+
+        for name, slot in self.numeric_slots:
+            column = [record.get(name) for record in records]
+            if raw_columns is not None:
+                raw_columns[name] = column
+            try:
+                X[:, slot] = np.array(column, dtype=np.float64)
+            except (TypeError, ValueError):
+                X[:, slot] = [to_float(value) for value in column]
+
+        for name, slot, index, classes in (('breed_type', self.breed_slot, self.breed_index, self.breed_classes),
+                                           ('faecal_consistency', self.faecal_slot, self.faecal_index, self.faecal_classes)):
+            codes = [index.get(value) if isinstance(value, str) else None for value in (record.get(name) for record in records)]
+            unseen = codes.count(None)
+            if unseen:
+                codes = [0.0 if code is None else code for code in codes]
+                if warnings is not None:
+                    warnings.append(f"Unseen {name} in {unseen} reading(s). Encoding as '{classes[0]}' (0).")
+                if issues is not None:
+                    _tally(issues, ('unseen_category', name), unseen)
+            X[:, slot] = codes
+
+        self._engineer(X)
+        self._fill_nan(X, warnings, issues)
+        return X
+
+    def build_columns(self, columns, warnings=None):
+        """
+        Same matrix as build_matrix() from column arrays (a DataFrame or a dict of name -> sequence),
+        for training exports with millions of rows where one dict per row costs more than the model.
+        """
+        n = len(columns[NUMERIC_INPUT_FEATURES[0]])
+        X = np.empty((n, self.n_features), dtype=np.float64)
+
+        for name, slot in self.numeric_slots:
+            column = columns[name]
+            try:
+                X[:, slot] = np.asarray(column, dtype=np.float64)
+            except (TypeError, ValueError):
+                X[:, slot] = [to_float(value) for value in column]
+
+        for name, slot, index in (('breed_type', self.breed_slot, self.breed_index), ('faecal_consistency', self.faecal_slot, self.faecal_index)):
+            X[:, slot] = [index.get(value, 0.0) if isinstance(value, str) else 0.0 for value in columns[name]]
+
+        self._engineer(X)
+        self._fill_nan(X, warnings)
+        return X
+
+    # --- Scaling (same in-order ops as StandardScaler.transform) ---
+    def scale(self, X):
+        if self.mean is None:
+            raise ValueError("FeatureBuilder was created without a scaler")
+        X -= self.mean
+        X /= self.scale_
+        return X
+
+    def build_scaled_row(self, data, warnings=None, issues=None):
+        return self.scale(self.build_row(data, warnings, issues))
+
+    def build_scaled_matrix(self, records, warnings=None, raw_columns=None, issues=None):
+        return self.scale(self.build_matrix(records, warnings, raw_columns, issues))
+
+    # --- Feature Engineering (MUST mirror training) ---
+    def _engineer(self, X):
+        X[:, self.activity_ratio_slot] = X[:, self.walking_capacity_slot] / (X[:, self.sleeping_duration_slot] + EPSILON)
+        X[:, self.eating_efficiency_slot] = X[:, self.milk_production_slot] / (X[:, self.eating_duration_slot] + EPSILON)
+        X[:, self.vital_sign_index_slot] = (X[:, self.heart_rate_slot] + X[:, self.respiratory_rate_slot] + X[:, self.body_temperature_slot]) / 3
+
+    def _fill_nan(self, X, warnings, issues=None):
+        nan_mask = np.isnan(X)
+        if nan_mask.any():
+            if warnings is not None or issues is not None:
+                filled = nan_mask.sum(axis=0)
+                for slot in np.flatnonzero(filled):
+                    if warnings is not None:
+                        warnings.append(f"NaN detected in numeric column {self.training_features[slot]}. Filling with 0.")
+                    if issues is not None:
+                        _tally(issues, ('nan_fill', self.training_features[slot]), int(filled[slot]))
+            X[nan_mask] = 0.0
+
+
+# --- Golden vectors: recorded by training, replayed by the API before it serves a model ---
+def golden_vectors(builder, readings=None):
+    """
+    Runs `builder` (created with a scaler) over the golden readings.
+
+    Returns:
+        dict: feature_names, readings, features (unscaled rows) and scaled (model input rows).
+    """
+    readings = GOLDEN_READINGS if readings is None else readings
+    features = builder.build_matrix(readings)
+    return {
+        'feature_names': list(builder.training_features),
+        'readings': readings,
+        'features': features.tolist(),
+        'scaled': builder.scale(features.copy()).tolist(),
+    }
+
+
+def check_golden_vectors(builder, golden):
+    """
+    Checks that `builder` reproduces recorded golden vectors exactly, on both the
+    single-row and the batch path.
+
+    Raises:
+        ValueError: On a different feature order or any differing value.
+    """
+    if list(builder.training_features) != list(golden['feature_names']):
+        raise ValueError(f"Feature order differs from the trained model: {golden['feature_names']}")
+    readings = golden['readings']
+    expected = np.array(golden['features'], dtype=np.float64).reshape(len(readings), builder.n_features)
+    batch = builder.build_matrix(readings)
+    rows = np.vstack([builder.build_row(data) for data in readings]) if readings else batch
+    for path, actual in (('batch', batch), ('row', rows)):
+        mismatched = actual != expected
+        if mismatched.any():
+            reading, slot = np.argwhere(mismatched)[0]
+            raise ValueError(
+                f"Golden vector mismatch ({path} path) for reading {reading}, feature "
+                f"{builder.training_features[slot]}: {float(actual[reading, slot])!r} != {float(expected[reading, slot])!r}"
+            )
+    if builder.mean is not None and 'scaled' in golden:
+        if not np.array_equal(builder.scale(batch.copy()), np.array(golden['scaled'], dtype=np.float64).reshape(expected.shape)):
+            raise ValueError("Golden vector mismatch after scaling (scaler constants differ from training)")
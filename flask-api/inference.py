@@ -0,0 +1,420 @@
+# inference.py
+# Fused inference wrapper around the trained forest.
+# Evaluates the trees once per call (predict_proba), takes the predicted class as
+# the argmax of the probabilities, and decodes labels from tables built at load time.
+
+import os
+import time
+
+import numpy as np
+
+
+class HealthPredictor:
+    """
+    Single-pass wrapper for the health-status classifier.
+
+    model.predict() is itself argmax(predict_proba()), so calling both ran the whole
+    forest twice; this runs it once and derives both outputs. Shared by the single,
+    batch and streaming request paths.
+
+    Args:
+        model: Fitted classifier exposing predict_proba() and classes_.
+        le_health (LabelEncoder): Encoder used for the health_status target.
+    """
+
+    def __init__(self, model, le_health):
+        self.model = model
+        # Decoded label for each predict_proba column, and the per-class names used in responses
+        self.column_labels = np.array([str(label) for label in le_health.inverse_transform(model.classes_)], dtype=object)
+        self.class_names = [str(label) for label in le_health.inverse_transform(np.arange(len(le_health.classes_)))]
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+    def predict(self, X):
+        """
+        Returns:
+            tuple: (predicted labels as an object array, (n, n_classes) probability matrix)
+        """
+        probabilities = self.predict_proba(X)
+        return self.column_labels[probabilities.argmax(axis=1)], probabilities
+
+    def predict_one(self, X_row):
+        """Convenience for a single (1, n_features) row: returns (label, probability vector)."""
+        labels, probabilities = self.predict(X_row)
+        return labels[0], probabilities[0]
+
+
+class ServingModel:
+    """
+    Everything one model version needs to turn readings into predictions: its feature
+    pipeline, inference engine and label table.
+
+    The API swaps versions by replacing a single reference to one of these, and each
+    scoring call reads that reference once, so a request in flight during a swap finishes
+    entirely on the version it started with.
+
+    Args:
+        version (str): Registry version (or 'local' for artifacts loaded from the working directory).
+        feature_builder (FeatureBuilder): The version's feature pipeline (built with its scaler).
+        engine: FlatForest (scaler folded in) or a fitted sklearn classifier.
+        le_health: Encoder (or ClassLabels) for the health_status target.
+        manifest (dict, optional): The registry manifest the version was loaded from.
+
+    Setting `observe` to a callable(stage, seconds) times every scoring call's
+    'feature_build', 'scaling' (sklearn engine only) and 'inference' stages.
+    """
+
+    def __init__(self, version, feature_builder, engine, le_health, manifest=None):
+        self.version = version
+        self.feature_builder = feature_builder
+        self.engine = engine
+        self.predictor = HealthPredictor(engine, le_health)
+        self.class_names = self.predictor.class_names
+        self.manifest = manifest or {}
+        self.observe = None
+        # The flat engine takes raw feature rows (scaling is folded into its thresholds); sklearn needs scaled rows
+        self.scaled_input = not getattr(engine, 'scaler_folded', False)
+        if self.scaled_input:
+            self.build_row, self.build_matrix = feature_builder.build_scaled_row, feature_builder.build_scaled_matrix
+        else:
+            self.build_row, self.build_matrix = feature_builder.build_row, feature_builder.build_matrix
+
+    def predict_records(self, records, warnings=None, raw_columns=None, issues=None):
+        """Returns (labels, probability matrix) for a list of reading dicts in one vectorized pass."""
+        if self.observe is None:
+            return self.predictor.predict(self.build_matrix(records, warnings, raw_columns, issues))
+        return self._timed(self.predictor.predict, self.feature_builder.build_matrix, records, warnings, raw_columns, issues)
+
+    def predict_reading(self, data, warnings=None, issues=None):
+        """Returns (label, probability vector) for one reading dict."""
+        if self.observe is None:
+            return self.predictor.predict_one(self.build_row(data, warnings, issues))
+        return self._timed(self.predictor.predict_one, self.feature_builder.build_row, data, warnings, issues=issues)
+
+    def _timed(self, predict, build, *args, **kwargs):
+        # Same operations as build_scaled_*() + predict, with a clock read between them
+        observe = self.observe
+        start = time.perf_counter()
+        X = build(*args, **kwargs)
+        built = time.perf_counter()
+        if self.scaled_input:
+            X = self.feature_builder.scale(X)
+        scaled = time.perf_counter()
+        outputs = predict(X)
+        observe('feature_build', built - start)
+        if self.scaled_input:
+            observe('scaling', scaled - built)
+        observe('inference', time.perf_counter() - scaled)
+        return outputs
+
+
+# --- Flat-array tree ensemble engine ---
+def _float_keys(x):
+    """Maps float64 values to int64 keys with the same ordering (for bisection over doubles)."""
+    bits = np.ascontiguousarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits >= 0, bits, -(bits & np.int64(0x7FFFFFFFFFFFFFFF)))
+
+
+def _keys_to_float(keys):
+    magnitude = np.abs(keys)
+    bits = np.where(keys >= 0, magnitude, magnitude | np.int64(-0x8000000000000000))
+    return bits.view(np.float64)
+
+
+def fold_scaler_thresholds(thresholds, mean, scale):
+    """
+    Converts split thresholds on scaled features into exact thresholds on raw features.
+
+    sklearn compares float32(float64((x - mean) / scale)) <= t. That map is monotone in x,
+    so the rows going left are exactly those with x <= T, where T is the largest double
+    satisfying the inequality. T is found by bisection over the ordered double bit
+    patterns, so the folded split agrees with sklearn for every possible input.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32).astype(np.float64) <= thresholds
+
+    estimate = thresholds * scale + mean
+    delta = (np.abs(estimate) + np.abs(mean) + scale) * 1e-6
+    lo, hi = estimate - delta, estimate + delta
+    # Widen the bracket until lo goes left and hi goes right for every split
+    for _ in range(64):
+        bad_lo, bad_hi = ~goes_left(lo), goes_left(hi)
+        if not (bad_lo.any() or bad_hi.any()):
+            break
+        delta = delta * 2
+        lo = np.where(bad_lo, estimate - delta, lo)
+        hi = np.where(bad_hi, estimate + delta, hi)
+    else:
+        raise ValueError("Could not bracket folded thresholds")
+
+    lo_keys, hi_keys = _float_keys(lo), _float_keys(hi)
+    while True:
+        open_gap = (hi_keys - lo_keys) > 1
+        if not open_gap.any():
+            break
+        mid_keys = lo_keys + (hi_keys - lo_keys) // 2
+        left = goes_left(_keys_to_float(mid_keys))
+        lo_keys = np.where(open_gap & left, mid_keys, lo_keys)
+        hi_keys = np.where(open_gap & ~left, mid_keys, hi_keys)
+    return _keys_to_float(lo_keys)
+
+
+def order_splits_first(feature, threshold, left, right, value, roots):
+    """
+    Renumbers flattened nodes so that every split node comes before every leaf (each group
+    keeps its order). FlatForest's batch path then rewrites one contiguous block per chunk.
+
+    Returns:
+        tuple: (feature, threshold, left, right, value, roots), renumbered.
+    """
+    split = np.isfinite(threshold)
+    order = np.concatenate([np.flatnonzero(split), np.flatnonzero(~split)])
+    new_id = np.empty(len(order), dtype=np.asarray(left).dtype)
+    new_id[order] = np.arange(len(order))
+    return feature[order], threshold[order], new_id[left[order]], new_id[right[order]], value[order], new_id[roots]
+
+
+def flatten_forest(model, scaler=None):
+    """
+    Flattens a fitted RandomForestClassifier into contiguous node arrays.
+
+    Leaves point back to themselves (threshold +inf), so every tree can be walked a
+    fixed max_depth steps without branching, and are numbered after all split nodes.
+    Leaf values are pre-normalised the way DecisionTreeClassifier.predict_proba does it.
+    If a StandardScaler is given, it is folded into the split thresholds and the engine
+    takes raw (unscaled) features.
+
+    Returns:
+        dict: Arrays ready for np.savez / FlatForest(**arrays).
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+        proba = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(proba / normalizer)
+
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    feature = np.concatenate(features).astype(np.intp)
+    threshold = np.concatenate(thresholds)
+    if scaler is not None:
+        split = np.isfinite(threshold)
+        threshold[split] = fold_scaler_thresholds(threshold[split], scaler.mean_[feature[split]], scaler.scale_[feature[split]])
+    feature, threshold, left, right, value, roots = order_splits_first(
+        feature, threshold, np.concatenate(lefts).astype(np.intp), np.concatenate(rights).astype(np.intp),
+        np.concatenate(values), np.asarray(roots, dtype=np.intp),
+    )
+
+    return {
+        'feature': feature,
+        'threshold': threshold,
+        'left': left,
+        'right': right,
+        'value': value,
+        'roots': roots,
+        'max_depth': np.asarray(max_depth),
+        'classes': np.asarray(model.classes_),
+        'scaler_folded': np.asarray(scaler is not None),
+    }
+
+
+class FlatForest:
+    """
+    NumPy inference engine over flatten_forest() arrays.
+
+    For a chunk of rows every split decision is evaluated in one comparison, giving a
+    per-row "next node" table (leaves, numbered after the splits, always lead back to
+    themselves, so only the split block is recomputed per chunk); each tree is then
+    walked max_depth steps by indexing. Leaf probabilities are accumulated tree by tree
+    in the same order as sklearn, so predict_proba matches RandomForestClassifier.predict_proba
+    exactly.
+    """
+
+    # Rows per chunk; keeps the (rows x nodes) next-node table cache-sized
+    CHUNK_ROWS = 128
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, scaler_folded):
+        # Index arrays are used as given (memory-mapped ones stay shared) when they are already
+        # native-width, as flatten_forest() writes them; older int32 exports are converted once
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.scaler_folded = bool(scaler_folded)
+        self.n_trees = len(self.roots)
+        self.n_nodes = len(self.feature)
+        split = np.isfinite(self.threshold)
+        self.n_splits = int(split.sum())
+        if not split[:self.n_splits].all():
+            # Exported before leaves were numbered last: renumber (a private copy)
+            self.feature, self.threshold, self.left, self.right, self.value, self.roots = order_splits_first(
+                self.feature, self.threshold, self.left, self.right, self.value, self.roots)
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None):
+        return cls(**flatten_forest(model, scaler))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 1:
+            return self._predict_proba_row(X[0])[np.newaxis, :]
+
+        # Scratch for this call (calls run concurrently): the next-node table of CHUNK_ROWS rows, with
+        # the leaves' self-loops filled in once, each row's offset into the flattened table, and the
+        # split nodes' right child and (left - right) step. These are int32, which halves the table's
+        # cache footprint (CHUNK_ROWS * n_nodes stays far below 2**31).
+        rows = min(len(X), self.CHUNK_ROWS)
+        splits = slice(0, self.n_splits)
+        row_offset = (np.arange(rows, dtype=np.int32) * self.n_nodes)[:, np.newaxis]
+        table = np.empty((rows, self.n_nodes), dtype=np.int32)
+        table[:, self.n_splits:] = np.arange(self.n_splits, self.n_nodes, dtype=np.int32) + row_offset
+        right = self.right[splits].astype(np.int32)
+        step = (self.left[splits] - self.right[splits]).astype(np.int32)
+
+        proba = np.empty((len(X), self.value.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), rows):
+            chunk = X[start:start + rows]
+            proba[start:start + len(chunk)] = self._predict_proba_chunk(chunk, table, row_offset[:len(chunk)], right, step)
+        proba /= self.n_trees
+        return proba
+
+    def _predict_proba_row(self, x):
+        next_node = np.where(x[self.feature] <= self.threshold, self.left, self.right)
+        node = self.roots
+        for _ in range(self.max_depth):
+            node = next_node[node]
+        return np.cumsum(self.value[node], axis=0)[-1] / self.n_trees
+
+    def _predict_proba_chunk(self, X, table, row_offset, right, step):
+        # Every split decision for every row at once: right child + went_left * (left - right),
+        # written straight into the split block of the per-row "next node" table
+        splits = slice(0, self.n_splits)
+        next_node = table[:len(X), splits]
+        np.multiply(X[:, self.feature[splits]] <= self.threshold[splits], step, out=next_node)
+        next_node += right
+        next_node += row_offset
+
+        # (indices come from the table itself, so the bounds check of mode='raise' is skipped)
+        flat = table.ravel()
+        node = self.roots + row_offset
+        for _ in range(self.max_depth):
+            node = flat.take(node, mode='clip')
+        node -= row_offset
+
+        # Summed over the outer (tree) axis, so trees are added one after another like sklearn's
+        # accumulation (numpy only reorders adds, pairwise, along the innermost axis)
+        return np.add.reduce(self.value.take(node.T, axis=0), axis=0)
+
+
+# --- Serving bundle: everything the API needs to score, without sklearn ---
+FOREST_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'max_depth', 'classes', 'scaler_folded')
+
+
+class ClassLabels:
+    """Stand-in for a fitted LabelEncoder when serving from a bundle (classes_ lookups only)."""
+
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+
+    def transform(self, values):
+        index = {label: idx for idx, label in enumerate(self.classes_)}
+        return np.array([index[value] for value in values])
+
+    def inverse_transform(self, y):
+        return self.classes_[np.asarray(y, dtype=np.intp)]
+
+
+class ScalerConstants:
+    """Stand-in for a fitted StandardScaler when serving from a bundle (same in-order arithmetic)."""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+def save_serving_bundle(path, model, scaler, le_health, le_breed, le_faecal, feature_names):
+    """
+    Writes the flattened forest (scaler folded in), the feature pipeline's constants (feature
+    order, scaler constants, label tables) to one joblib file, plus probe rows scored by sklearn
+    so the loader can verify itself without it.
+    """
+    import joblib
+
+    # (index arrays stay intp, the engine's own dtype, so loading maps them instead of copying)
+    bundle = flatten_forest(model, scaler)
+    bundle['feature_names'] = [str(name) for name in feature_names]
+    bundle['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+    bundle['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+    bundle['health_classes'] = [str(label) for label in le_health.classes_]
+    bundle['breed_classes'] = [str(label) for label in le_breed.classes_]
+    bundle['faecal_classes'] = [str(label) for label in le_faecal.classes_]
+    bundle['probe'] = scaler.mean_ + np.outer(np.linspace(-2.0, 2.0, 9), scaler.scale_)
+    # (StandardScaler.transform's own ops, minus its feature-name check on this unnamed array)
+    bundle['probe_proba'] = model.predict_proba((bundle['probe'] - bundle['scaler_mean']) / bundle['scaler_scale'])
+    # Write then rename: running servers keep their mapping of the old file intact
+    # (truncating a memory-mapped file in place crashes its readers with SIGBUS)
+    joblib.dump(bundle, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def load_serving_bundle(path, mmap_mode='r'):
+    """
+    Loads a save_serving_bundle() file. Arrays come back memory-mapped, so processes forked
+    from (or started next to) each other share the same page-cache pages.
+
+    Returns:
+        dict: forest (FlatForest), feature_names (model input order), scaler (ScalerConstants),
+              le_health / le_breed / le_faecal (ClassLabels).
+
+    Raises:
+        ValueError: If the engine does not reproduce the probabilities recorded at export.
+    """
+    import joblib
+
+    bundle = joblib.load(path, mmap_mode=mmap_mode)
+    forest = FlatForest(**{name: bundle[name] for name in FOREST_ARRAYS})
+    if not np.array_equal(forest.predict_proba(bundle['probe']), bundle['probe_proba']):
+        raise ValueError(f"{path} failed its self-check")
+    return {
+        'forest': forest,
+        'feature_names': list(bundle['feature_names']),
+        'scaler': ScalerConstants(bundle['scaler_mean'], bundle['scaler_scale']),
+        'le_health': ClassLabels(bundle['health_classes']),
+        'le_breed': ClassLabels(bundle['breed_classes']),
+        'le_faecal': ClassLabels(bundle['faecal_classes']),
+    }
@@ -0,0 +1,331 @@
+# loadtest.py
+# End-to-end latency and throughput suite for the prediction service.
+# A synthetic herd (bootstrapped from cattle_dataset.xlsx, with per-round sensor drift) is sent
+# through /predict (one client and several concurrent clients), /predict/batch and /predict/stream.
+# Each mode reports p50 / p95 / p99 latency and requests/s. In-process runs also split the
+# server-side time per reading into the stages the service reports on /metrics (decode, input
+# validation, feature build, scaling, inference, rules, response build, serialization, storage).
+#
+#     python loadtest.py                                  # every mode, in-process (app.test_client())
+#     python loadtest.py single batch --json run.json     # selected modes, results written as JSON
+#     python loadtest.py --url http://127.0.0.1:5000      # against a running server (no stage split:
+#                                                         # serve.py workers each keep their own /metrics)
+#     python loadtest.py --compare baseline.json run.json # exit 1 if run.json regressed
+#
+# In-process runs store results in a throwaway SQLite database, so storage is part of the measurement.
+# Stage times are summed over all threads ("other" is what remains of the request latency: HTTP
+# handling, validation, caches, the /predict micro-batch window), so with concurrent clients
+# they also include time spent waiting for the GIL.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cattle_dataset.xlsx')
+USER_ID = 'loadtest'
+MODES = ['single', 'concurrent', 'batch', 'stream']
+NUMERIC_COLUMNS = [
+    'body_temperature', 'milk_production', 'respiratory_rate', 'walking_capacity', 'sleeping_duration',
+    'body_condition_score', 'heart_rate', 'eating_duration', 'lying_down_duration', 'ruminating', 'rumen_fill'
+]
+# Relative change in a latency percentile (up) or throughput (down) reported as a regression
+DEFAULT_TOLERANCE = 0.10
+
+
+# --- Synthetic herd ---
+def make_herd(n_animals, rounds, seed=42, drift=0.05, prefix='HERD'):
+    """
+    Readings for `n_animals` animals over `rounds` rounds, in arrival order.
+
+    Each animal starts from a dataset row drawn at random (so the joint distribution of its
+    vitals, breed and health pattern is a real one) and then drifts: every round adds Gaussian
+    noise of `drift` column standard deviations, clipped to the range seen in the dataset.
+    """
+    from train import load_dataset
+
+    df, _, _ = load_dataset(DATASET_PATH)
+    rng = np.random.default_rng(seed)
+    values = df[NUMERIC_COLUMNS].to_numpy(dtype=np.float64)
+    low, high, std = values.min(axis=0), values.max(axis=0), values.std(axis=0)
+    integer = [bool(np.all(np.mod(values[:, i], 1) == 0)) for i in range(len(NUMERIC_COLUMNS))]
+    base_rows = rng.integers(len(df), size=n_animals)
+    current = values[base_rows].copy()
+    start = datetime.datetime(2026, 1, 1).timestamp()
+
+    readings = []
+    for round_index in range(rounds):
+        if round_index:
+            current = np.clip(current + rng.normal(0.0, drift, current.shape) * std, low, high)
+        for animal, row in enumerate(base_rows):
+            reading = {
+                name: (int(round(current[animal, i])) if integer[i] else round(float(current[animal, i]), 2))
+                for i, name in enumerate(NUMERIC_COLUMNS)
+            }
+            reading.update(
+                cattle_id=f'{prefix}{animal:05d}',
+                breed_type=str(df['breed_type'].iloc[row]),
+                faecal_consistency=str(df['faecal_consistency'].iloc[row]),
+                timestamp=start + round_index * 3600 + animal,
+            )
+            readings.append(reading)
+    return readings
+
+
+# --- Clients: in-process (Flask test client) or HTTP ---
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.app.test_client()
+
+    def post(self, path, body, content_type):
+        response = self.client.post(path, data=body, content_type=content_type, headers={'X-User-Id': USER_ID})
+        return response.status_code, response.get_data()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    """One keep-alive connection per client thread."""
+
+    def __init__(self, url):
+        import http.client
+        import urllib.parse
+
+        parsed = urllib.parse.urlparse(url)
+        self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=120)
+
+    def post(self, path, body, content_type):
+        self.connection.request('POST', path, body=body, headers={'Content-Type': content_type, 'X-User-Id': USER_ID})
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def get(self, path):
+        self.connection.request('GET', path)
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+
+# --- Server-side stage timing (read from the service's /metrics) ---
+STAGE_SUM = re.compile(r'^livestock_stage_duration_seconds_sum\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+COMMIT_TOTAL = re.compile(r'^livestock_storage_commit_seconds_total (\S+)$', re.MULTILINE)
+
+
+def stage_seconds(client):
+    """Cumulative seconds per scoring stage, plus the storage writer's commits, as reported by /metrics."""
+    status, body = client.get('/metrics')
+    if status != 200:
+        raise RuntimeError(f"/metrics returned {status}")
+    text = body.decode()
+    seconds = {stage: float(value) for stage, value in STAGE_SUM.findall(text)}
+    commit = COMMIT_TOTAL.search(text)
+    if commit:
+        seconds['storage_commit'] = float(commit.group(1))
+    return seconds
+
+
+# --- Modes ---
+def percentiles(samples_seconds):
+    samples = np.asarray(samples_seconds) * 1000
+    if not len(samples):
+        return {}
+    return {
+        "p50": round(float(np.percentile(samples, 50)), 3), "p95": round(float(np.percentile(samples, 95)), 3),
+        "p99": round(float(np.percentile(samples, 99)), 3), "mean": round(float(samples.mean()), 3),
+        "max": round(float(samples.max()), 3),
+    }
+
+
+def run_requests(make_client, requests, threads=1):
+    """Sends (path, body, content_type, readings) requests from `threads` clients; returns (latencies, wall seconds, errors)."""
+    latencies = [None] * len(requests)
+    errors = []
+
+    def worker(k):
+        client = make_client()
+        for i in range(k, len(requests), threads):
+            path, body, content_type, _ = requests[i]
+            start = time.perf_counter()
+            status, _ = client.post(path, body, content_type)
+            latencies[i] = time.perf_counter() - start
+            if status != 200:
+                errors.append(status)
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.perf_counter() - start, errors
+
+
+def build_requests(mode, readings, batch_size, stream_size):
+    if mode in ('single', 'concurrent'):
+        return [('/predict', json.dumps(data).encode(), 'application/json', 1) for data in readings]
+    if mode == 'batch':
+        return [
+            ('/predict/batch', json.dumps(readings[i:i + batch_size]).encode(), 'application/json', len(readings[i:i + batch_size]))
+            for i in range(0, len(readings), batch_size)
+        ]
+    return [
+        ('/predict/stream', "".join(json.dumps(data) + "\n" for data in readings[i:i + stream_size]).encode(), 'application/x-ndjson', len(readings[i:i + stream_size]))
+        for i in range(0, len(readings), stream_size)
+    ]
+
+
+def run_mode(mode, readings, warm_up_readings, make_client, stage_client, options):
+    threads = options.threads if mode == 'concurrent' else 1
+    # Warm-up requests (connection setup, first-call allocations) use other animals and are not measured
+    run_requests(make_client, build_requests(mode, warm_up_readings, options.batch_size, options.stream_size), threads)
+    requests = build_requests(mode, readings, options.batch_size, options.stream_size)
+
+    stages_before = stage_seconds(stage_client) if stage_client else None
+    latencies, elapsed, errors = run_requests(make_client, requests, threads)
+    n_readings = sum(request[3] for request in requests)
+    result = {
+        "threads": threads,
+        "requests": len(requests),
+        "readings": n_readings,
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(requests) / elapsed, 1),
+        "readings_per_s": round(n_readings / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "errors": len(errors),
+    }
+    if stage_client:
+        stages_after = stage_seconds(stage_client)
+        stages = {stage: seconds - stages_before.get(stage, 0.0) for stage, seconds in stages_after.items()}
+        result["stages_us_per_reading"] = {stage: round(seconds / n_readings * 1e6, 2) for stage, seconds in sorted(stages.items())}
+        # Everything else on the request path: HTTP handling, validation, caches, the micro-batch window
+        on_path = sum(seconds for stage, seconds in stages.items() if stage != 'storage_commit')
+        result["stages_us_per_reading"]["other"] = round(max(sum(latencies) - on_path, 0.0) / n_readings * 1e6, 2)
+    return result
+
+
+def run_suite(modes, options):
+    meta = {
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "target": options.url or 'in-process',
+        "animals": options.animals, "rounds": options.rounds, "seed": options.seed,
+        "python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform(),
+    }
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        meta["commit"] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+
+    stage_client = None
+    if options.url:
+        def make_client():
+            return HTTPClient(options.url)
+    else:
+        storage_dir = tempfile.mkdtemp(prefix='loadtest-')
+        os.environ.setdefault('STORAGE_BACKEND', 'sqlite')
+        os.environ.setdefault('SQLITE_PATH', os.path.join(storage_dir, 'telemetry.db'))
+        os.environ.setdefault('PARQUET_HISTORY_DIR', os.path.join(storage_dir, 'history'))
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        import app as flask_app
+        if not flask_app.serving_ready.wait(120):
+            raise RuntimeError(f"The app did not become ready: {flask_app.startup_status}")
+        meta["model_version"] = flask_app.serving_model.version
+        meta["storage"] = type(flask_app.storage_backend).__name__ if flask_app.storage_backend else None
+
+        def make_client():
+            return InProcessClient(flask_app)
+        stage_client = make_client()
+
+    results = {"meta": meta, "modes": {}}
+    for mode in modes:
+        # Each mode gets its own herd (same size and drift, different animals), so no mode
+        # is served from predictions cached or kept per animal by an earlier one
+        herd = make_herd(options.animals, options.rounds, seed=options.seed + MODES.index(mode), prefix=f'{mode.upper()}-')
+        readings = herd[:options.readings] if mode in ('single', 'concurrent') else herd
+        warm_up = make_herd(max(len(readings) // 20, options.threads), 1, seed=options.seed + 100 + MODES.index(mode), prefix=f'WARMUP-{mode.upper()}-')
+        results["modes"][mode] = run_mode(mode, readings, warm_up, make_client, stage_client, options)
+        print_mode(mode, results["modes"][mode])
+    return results
+
+
+# --- Output ---
+def print_mode(mode, result):
+    latency = result["latency_ms"]
+    print(f"{mode:<11} {result['requests']:>7} req  {result['requests_per_s']:>9,.1f} req/s  {result['readings_per_s']:>10,.0f} readings/s   "
+          f"p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  p99 {latency['p99']:8.2f} ms   errors {result['errors']}")
+    if "stages_us_per_reading" in result:
+        print(" " * 11 + "  us/reading: " + "  ".join(f"{stage} {value:.1f}" for stage, value in result["stages_us_per_reading"].items()))
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """Prints metric changes per mode; returns the list of regressions beyond `tolerance`."""
+    regressions = []
+    print(f"{'mode':<11} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>8}")
+    for mode, new in current["modes"].items():
+        old = baseline["modes"].get(mode)
+        if not old:
+            continue
+        metrics = [(f"latency {name}", old["latency_ms"].get(name), new["latency_ms"].get(name), True) for name in ('p50', 'p95', 'p99')]
+        metrics.append(("readings/s", old["readings_per_s"], new["readings_per_s"], False))
+        for name, before, after, lower_is_better in metrics:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change > tolerance if lower_is_better else change < -tolerance
+            print(f"{mode:<11} {name:<16} {before:>12,.2f} {after:>12,.2f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append((mode, name, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and throughput suite for the prediction service.")
+    parser.add_argument('modes', nargs='*', help=f"Modes to run (default: all of {', '.join(MODES)})")
+    parser.add_argument('--url', help="Benchmark a running server instead of the app in-process")
+    parser.add_argument('--json', metavar='PATH', help="Write the results as JSON")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="Compare two result files instead of running")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f"Allowed relative slowdown (default {DEFAULT_TOLERANCE})")
+    parser.add_argument('--animals', type=int, default=500, help="Herd size (default 500)")
+    parser.add_argument('--rounds', type=int, default=20, help="Readings per animal (default 20)")
+    parser.add_argument('--readings', type=int, default=2000, help="Readings sent one per request in single / concurrent mode (default 2000)")
+    parser.add_argument('--threads', type=int, default=8, help="Client threads in concurrent mode (default 8)")
+    parser.add_argument('--batch-size', type=int, default=250, help="Readings per /predict/batch request (default 250)")
+    parser.add_argument('--stream-size', type=int, default=2500, help="Readings per /predict/stream request (default 2500)")
+    parser.add_argument('--seed', type=int, default=42)
+    options = parser.parse_args(argv)
+
+    if options.compare:
+        with open(options.compare[0]) as f:
+            baseline = json.load(f)
+        with open(options.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, options.tolerance)
+        print(f"{len(regressions)} regression(s) beyond {options.tolerance:.0%}.")
+        return 1 if regressions else 0
+
+    unknown = [mode for mode in options.modes if mode not in MODES]
+    if unknown:
+        print(f"Unknown mode(s) {', '.join(unknown)}. Choose from: {', '.join(MODES)}")
+        return 1
+    results = run_suite(options.modes or MODES, options)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {options.json}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
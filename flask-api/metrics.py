@@ -0,0 +1,182 @@
+# metrics.py
+# In-process counters and histograms, exposed in the Prometheus text format (version 0.0.4).
+#
+# Counters and histograms are updated on the request path, so an update is one lock acquisition
+# and a few additions; histogram buckets are fixed when the metric is created and only made
+# cumulative when /metrics is scraped. Numbers other components already keep (cache hits, storage
+# commits, ...) are read at scrape time through callbacks instead of being counted twice.
+#
+# Metrics live in the process that recorded them: under serve.py every worker has its own, and a
+# scrape reports the worker that answered it (the pid label tells them apart).
+
+import bisect
+import math
+import threading
+
+# Seconds, 5 us .. 10 s: in-process stages take microseconds, whole batch requests up to seconds
+DEFAULT_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per label combination, plus their sum and count.
+
+    Args:
+        name (str): Metric name (should end in the unit, e.g. _seconds).
+        documentation (str): HELP text.
+        labels (tuple): Label names.
+        buckets (tuple): Ascending upper bounds; +Inf is added.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self):
+        """Returns {label values: (count, sum)}."""
+        with self._lock:
+            return {label_values: (sum(counts), total) for label_values, (counts, total) in self.series.items()}
+
+    def samples(self):
+        with self._lock:
+            series = {label_values: (list(counts), total) for label_values, (counts, total) in self.series.items()}
+        label_names = self.labels + ('le',)
+        for label_values, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield self.name + '_bucket', format_labels(label_names, label_values + (format_value(bound),)), cumulative
+            yield self.name + '_sum', format_labels(self.labels, label_values), total
+            yield self.name + '_count', format_labels(self.labels, label_values), cumulative
+
+
+class CallbackMetric:
+    """
+    A counter or gauge whose value is read when /metrics is scraped.
+
+    `collect` returns a number, a dict of label values (tuple) -> number, or None to skip
+    the metric (e.g. the component it reads is disabled).
+    """
+
+    def __init__(self, name, documentation, kind, collect, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.collect = collect
+        self.labels = tuple(labels)
+
+    def samples(self):
+        values = self.collect()
+        if values is None:
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            if value is not None:
+                yield self.name, format_labels(self.labels, label_values), value
+
+
+class MetricsRegistry:
+    """Creates named metrics (all prefixed with `namespace`) and renders them for /metrics."""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.metrics = []
+
+    def _add(self, metric):
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(f'{self.namespace}_{name}', documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(f'{self.namespace}_{name}', documentation, labels, buckets))
+
+    def gauge_callback(self, name, documentation, collect, labels=()):
+        return self._add(CallbackMetric(f'{self.namespace}_{name}', documentation, 'gauge', collect, labels))
+
+    def counter_callback(self, name, documentation, collect, labels=()):
+        return self._add(CallbackMetric(f'{self.namespace}_{name}', documentation, 'counter', collect, labels))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                lines.append(f'# {metric.name} unavailable: {e}')
+                continue
+            documentation = metric.documentation.replace('\\', '\\\\').replace('\n', '\\n')
+            lines.append(f'# HELP {metric.name} {documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {format_value(value)}' for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
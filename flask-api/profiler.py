@@ -0,0 +1,257 @@
+# profiler.py
+# Opt-in sampling profiler for live requests.
+#
+# While a profiled request runs, one sampler thread reads the stacks of the thread handling it
+# (sys._current_frames(), every `interval_seconds`) and folds them into collapsed stacks
+# ("thread;outer (file:line);...;inner (file:line) count"), the input format of flamegraph.pl,
+# speedscope and inferno. Background threads that do work for requests (the /predict inference
+# thread, the storage writers) are sampled too while they are busy, under their own root frame;
+# their samples include work done for other requests in the same window.
+#
+# Unlike cProfile nothing is hooked into the profiled thread, so a profiled request runs at
+# (nearly) full speed: the cost is the sampler thread, bounded by the interval, the number of
+# requests profiled at once and the number of distinct stacks kept.
+
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+# A background thread whose innermost frame is in one of these modules is blocked waiting for work
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py')
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def is_idle(frame):
+    return frame.f_code.co_filename.endswith(IDLE_MODULES)
+
+
+class StackSampler:
+    """
+    Samples the stacks of registered threads into collapsed-stack counts.
+
+    Args:
+        interval_seconds (float): Time between samples.
+        max_depth (int): Innermost frames kept per stack.
+        max_stacks (int): Distinct stacks kept; samples of further stacks are counted as dropped.
+        background_threads (iterable): Names of threads sampled (when not idle) while any
+            request is being profiled.
+    """
+
+    def __init__(self, interval_seconds=0.002, max_depth=64, max_stacks=5000, background_threads=()):
+        self.interval_seconds = interval_seconds
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.background_threads = set(background_threads)
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self._active = {}  # thread id -> number of profiled requests running on it
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # --- Request side ---
+    def begin(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = self._active.get(thread_id, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return thread_id
+
+    def end(self, thread_id):
+        with self._lock:
+            remaining = self._active.get(thread_id, 0) - 1
+            if remaining > 0:
+                self._active[thread_id] = remaining
+            else:
+                self._active.pop(thread_id, None)
+            if not self._active:
+                self._wake.clear()
+
+    @property
+    def active(self):
+        return len(self._active)
+
+    # --- Sampler thread ---
+    def _run(self):
+        names = {}
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval_seconds)
+            with self._lock:
+                request_threads = list(self._active)
+            if not request_threads:
+                continue
+            if self.background_threads:
+                names = {thread.ident: thread.name for thread in threading.enumerate() if thread.name in self.background_threads}
+            frames = sys._current_frames()
+            collapsed = []
+            for thread_id in request_threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    collapsed.append(self._collapse('request', frame))
+            for thread_id, name in names.items():
+                frame = frames.get(thread_id)
+                if frame is not None and not is_idle(frame):
+                    collapsed.append(self._collapse(name, frame))
+            del frames
+            self._record(collapsed)
+
+    def _collapse(self, root, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.append(root)
+        return ';'.join(reversed(labels))
+
+    def _record(self, collapsed):
+        with self._lock:
+            for stack in collapsed:
+                self.samples += 1
+                if stack in self.stacks:
+                    self.stacks[stack] += 1
+                elif len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] = 1
+                else:
+                    self.dropped += 1
+
+    # --- Output ---
+    def collapsed(self):
+        """Returns the samples so far in collapsed-stack format (one "stack count" line per stack)."""
+        with self._lock:
+            stacks = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def reset(self):
+        with self._lock:
+            self.stacks = {}
+            self.samples = 0
+            self.dropped = 0
+
+
+class RequestProfiler:
+    """
+    Decides which requests are profiled and writes the collected stacks to disk.
+
+    A request is profiled when it carries `X-Profile: 1` with the right token, or at random
+    with probability `sample_rate` while a profiling window is open (see start()). At most
+    `max_concurrent` requests are profiled at a time; the rest run untouched.
+
+    Args:
+        token (str): Shared secret required by the header and the admin endpoints.
+        sampler (StackSampler): Where samples go.
+        output_dir (str): Collapsed-stack files are written here, one per process.
+        sample_rate (float): Fraction of requests profiled from startup (0 = only on demand).
+        max_concurrent (int): Requests profiled at the same time.
+        flush_seconds (float): How often a changed profile is rewritten to disk.
+    """
+
+    def __init__(self, token, sampler, output_dir='profiles', sample_rate=0.0, max_concurrent=2, flush_seconds=60.0):
+        self.token = token
+        self.sampler = sampler
+        self.output_dir = output_dir
+        self.max_concurrent = max_concurrent
+        self.flush_seconds = flush_seconds
+        self.sample_rate = 0.0
+        self.deadline = None
+        self.profiled = 0
+        self.skipped = 0
+        self._written_samples = 0
+        self._next_flush = time.monotonic() + flush_seconds
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        if sample_rate > 0:
+            self.start(sample_rate)
+
+    @property
+    def path(self):
+        return os.path.join(self.output_dir, f"profile-{os.getpid()}.collapsed")
+
+    def authorized(self, token):
+        return bool(self.token) and token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+
+    # --- Profiling window ---
+    def start(self, sample_rate, seconds=None):
+        with self._lock:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            self.deadline = time.monotonic() + seconds if seconds else None
+
+    def stop(self):
+        with self._lock:
+            self.sample_rate = 0.0
+            self.deadline = None
+        return self.write()
+
+    @property
+    def sampling(self):
+        if self.sample_rate and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stop()
+        return self.sample_rate > 0
+
+    # --- Per request ---
+    def begin(self, profile_header, token):
+        """Returns a handle to pass to end() if this request is profiled, else None."""
+        if profile_header == '1':
+            if not self.authorized(token):
+                return None
+        elif not (self.sampling and random.random() < self.sample_rate):
+            return None
+        with self._lock:
+            if self.sampler.active >= self.max_concurrent:
+                self.skipped += 1
+                return None
+            self.profiled += 1
+            return self.sampler.begin()
+
+    def end(self, handle):
+        self.sampler.end(handle)
+        if time.monotonic() >= self._next_flush:
+            self._next_flush = time.monotonic() + self.flush_seconds
+            self.write()
+
+    # --- Output ---
+    def write(self):
+        """Rewrites this process's collapsed-stack file if there are new samples; returns its path (or None)."""
+        with self._write_lock:
+            samples = self.sampler.samples
+            if samples == self._written_samples:
+                return self.path if samples else None
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self.sampler.collapsed())
+            os.replace(tmp_path, self.path)
+            self._written_samples = samples
+            return self.path
+
+    def reset(self):
+        self.sampler.reset()
+        self._written_samples = 0
+
+    def stats(self):
+        sampling = self.sampling
+        return {
+            "sampling": sampling,
+            "sample_rate": self.sample_rate,
+            "seconds_left": round(self.deadline - time.monotonic(), 1) if sampling and self.deadline is not None else None,
+            "interval_ms": self.sampler.interval_seconds * 1000,
+            "max_concurrent": self.max_concurrent,
+            "active": self.sampler.active,
+            "profiled_requests": self.profiled,
+            "skipped_requests": self.skipped,
+            "samples": self.sampler.samples,
+            "stacks": len(self.sampler.stacks),
+            "dropped_samples": self.sampler.dropped,
+            "path": self.path,
+            "pid": os.getpid(),
+        }
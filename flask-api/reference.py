@@ -0,0 +1,348 @@
+# reference.py
+# Shared by the tests and benchmark.py: the trained artifacts, synthetic readings, a fake
+# Firestore client, and the reference implementations each fast path replaced (the tests
+# check the fast paths give the same output, the benchmarks time both).
+# Like the service, it loads the .joblib files from the working directory (flask-api).
+
+import threading
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from features import MODEL_FEATURES
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+training_features_for_model = list(MODEL_FEATURES)
+
+model = joblib.load('model.joblib')
+scaler = joblib.load('scaler.joblib')
+le_health = joblib.load('le_health.joblib')
+le_breed = joblib.load('le_breed.joblib')
+le_faecal = joblib.load('le_faecal.joblib')
+
+
+# --- Synthetic readings spanning the ranges seen in cattle_dataset.xlsx ---
+def make_readings(n, seed=42):
+    rng = np.random.default_rng(seed)
+    breeds = list(le_breed.classes_) + ['Holstein']
+    faecal = list(le_faecal.classes_) + ['watery']
+    readings = []
+    for i in range(n):
+        readings.append({
+            'body_temperature': round(float(rng.uniform(37.5, 40.8)), 1),
+            'breed_type': breeds[rng.integers(len(breeds))],
+            'milk_production': round(float(rng.uniform(5.0, 27.0)), 1),
+            'respiratory_rate': int(rng.integers(15, 50)),
+            'walking_capacity': int(rng.integers(4000, 13500)),
+            'sleeping_duration': round(float(rng.uniform(2.0, 7.5)), 1),
+            'body_condition_score': int(rng.integers(1, 6)),
+            'heart_rate': int(rng.integers(40, 90)),
+            'eating_duration': round(float(rng.uniform(1.0, 5.0)), 1),
+            'lying_down_duration': round(float(rng.uniform(9.0, 17.0)), 1),
+            'ruminating': round(float(rng.uniform(2.0, 7.0)), 1),
+            'rumen_fill': int(rng.integers(1, 6)),
+            'faecal_consistency': faecal[rng.integers(len(faecal))],
+            'cattle_id': f'BENCH{i:05d}',
+        })
+    return readings
+
+
+# --- Reference: the original per-request pandas preprocessing from predict() ---
+def legacy_preprocess(data):
+    input_df = pd.DataFrame([data])
+
+    epsilon = 1e-6
+    input_df['activity_ratio'] = input_df['walking_capacity'] / (input_df['sleeping_duration'] + epsilon)
+    input_df['eating_efficiency'] = input_df['milk_production'] / (input_df['eating_duration'] + epsilon)
+    input_df['vital_sign_index'] = (input_df['heart_rate'] + input_df['respiratory_rate'] + input_df['body_temperature']) / 3
+
+    breed_type_val = input_df['breed_type'].iloc[0]
+    if breed_type_val in le_breed.classes_:
+        input_df['breed_type_enc'] = le_breed.transform([breed_type_val])[0]
+    else:
+        input_df['breed_type_enc'] = 0
+
+    faecal_consistency_val = input_df['faecal_consistency'].iloc[0]
+    if faecal_consistency_val in le_faecal.classes_:
+        input_df['faecal_consistency_enc'] = le_faecal.transform([faecal_consistency_val])[0]
+    else:
+        input_df['faecal_consistency_enc'] = 0
+
+    input_df = input_df.drop(columns=['breed_type', 'faecal_consistency'])
+
+    final_input_df_for_model = pd.DataFrame(0, index=input_df.index, columns=training_features_for_model)
+    for col in training_features_for_model:
+        if col in input_df.columns:
+            final_input_df_for_model[col] = input_df[col]
+
+    for col in final_input_df_for_model.columns:
+        final_input_df_for_model[col] = pd.to_numeric(final_input_df_for_model[col], errors='coerce')
+        if final_input_df_for_model[col].isnull().any():
+            final_input_df_for_model[col] = final_input_df_for_model[col].fillna(0)
+
+    return scaler.transform(final_input_df_for_model)
+
+
+# --- Reference: the training script's original pandas feature engineering ---
+def legacy_training_features(df):
+    df = df.copy()
+    df['breed_type_enc'] = le_breed.transform(df['breed_type'])
+    df['faecal_consistency_enc'] = le_faecal.transform(df['faecal_consistency'])
+    df['activity_ratio'] = df['walking_capacity'] / (df['sleeping_duration'] + 1e-6)
+    df['eating_efficiency'] = df['milk_production'] / (df['eating_duration'] + 1e-6)
+    df['vital_sign_index'] = (df['heart_rate'] + df['respiratory_rate'] + df['body_temperature']) / 3
+    return scaler.transform(df[training_features_for_model])
+
+
+# --- Reference: the original predict() + predict_proba() + per-class inverse_transform ---
+def legacy_inference(X_row):
+    prediction = model.predict(X_row)
+    predicted_health_status = le_health.inverse_transform([prediction[0]])[0]
+    probabilities = model.predict_proba(X_row)[0]
+    probability_dict = {
+        le_health.inverse_transform([i])[0]: round(probabilities[i]*100, 2)
+        for i in range(len(le_health.classes_))
+    }
+    return predicted_health_status, probabilities, probability_dict
+
+
+# --- Reference: the original if-chain get_rule_based_alerts() from app.py ---
+def legacy_rule_alerts(data):
+    detected_diseases = []
+    generated_alerts = []
+    abnormal_indicator_count = 0
+
+    THRESHOLDS = {
+        'body_temperature_high_respiratory': 39.5,
+        'respiratory_rate_high_respiratory': 40,
+        'faecal_consistency_abnormal': ['watery', 'black faece', 'fresh blood in faeces', 'very liquid faeces'],
+        'milk_production_low': 8.0,
+        'body_condition_score_low_reproductive': 2.5,
+        'heart_rate_high_reproductive': 80,
+        'walking_capacity_low': 9000,
+        'body_temperature_high_systemic': 39.8,
+        'heart_rate_high_systemic': 80,
+        'respiratory_rate_high_systemic': 42,
+    }
+
+    # Respiratory Disease
+    if data.get('body_temperature', 0) > THRESHOLDS['body_temperature_high_respiratory'] and \
+       data.get('respiratory_rate', 0) > THRESHOLDS['respiratory_rate_high_respiratory']:
+        detected_diseases.append('Respiratory Disease')
+        generated_alerts.append({
+            'symptom': 'body_temperature',
+            'value': data.get('body_temperature'),
+            'message': f"High body temperature detected ({data.get('body_temperature')}°C)!",
+            'severity': 'Medium',
+            'rule_triggered': 'Respiratory_Temp'
+        })
+        generated_alerts.append({
+            'symptom': 'respiratory_rate',
+            'value': data.get('respiratory_rate'),
+            'message': f"High respiratory rate detected ({data.get('respiratory_rate')} breaths/min)!",
+            'severity': 'Medium',
+            'rule_triggered': 'Respiratory_Rate'
+        })
+        abnormal_indicator_count += 2
+
+    # GI Disease
+    faecal_consistency = data.get('faecal_consistency', '').lower()
+    if faecal_consistency in THRESHOLDS['faecal_consistency_abnormal']:
+        detected_diseases.append('Gastrointestinal Disease')
+        generated_alerts.append({
+            'symptom': 'faecal_consistency',
+            'value': data.get('faecal_consistency'),
+            'message': f"Abnormal faecal consistency detected ({data.get('faecal_consistency')})!",
+            'severity': 'High',
+            'rule_triggered': 'GI_Feces'
+        })
+        abnormal_indicator_count += 1
+
+    # Udder Health Issue
+    if data.get('milk_production', 0) < THRESHOLDS['milk_production_low']:
+        detected_diseases.append('Udder Health Issue')
+        generated_alerts.append({
+            'symptom': 'milk_production',
+            'value': data.get('milk_production'),
+            'message': f"Very low milk production detected ({data.get('milk_production')} L/day)!",
+            'severity': 'Medium',
+            'rule_triggered': 'Udder_MilkProd'
+        })
+        abnormal_indicator_count += 1
+
+    # Reproductive Disease
+    if data.get('body_condition_score', 0) < THRESHOLDS['body_condition_score_low_reproductive'] and \
+       data.get('heart_rate', 0) > THRESHOLDS['heart_rate_high_reproductive']:
+        detected_diseases.append('Reproductive Disease')
+        generated_alerts.append({
+            'symptom': 'body_condition_score',
+            'value': data.get('body_condition_score'),
+            'message': f"Low body condition score detected ({data.get('body_condition_score')})!",
+            'severity': 'Medium',
+            'rule_triggered': 'Reproductive_BCS'
+        })
+        generated_alerts.append({
+            'symptom': 'heart_rate',
+            'value': data.get('heart_rate'),
+            'message': f"High heart rate detected ({data.get('heart_rate')} bpm)!",
+            'severity': 'Medium',
+            'rule_triggered': 'Reproductive_HR'
+        })
+        abnormal_indicator_count += 2
+
+    # Musculoskeletal Issue
+    if data.get('walking_capacity', 0) < THRESHOLDS['walking_capacity_low']:
+        detected_diseases.append('Lameness / Musculoskeletal Issue')
+        generated_alerts.append({
+            'symptom': 'walking_capacity',
+            'value': data.get('walking_capacity'),
+            'message': f"Low walking capacity detected ({data.get('walking_capacity')} steps/day)!",
+            'severity': 'High',
+            'rule_triggered': 'Musculoskeletal_Walking'
+        })
+        abnormal_indicator_count += 1
+
+    # Systemic Infection
+    if data.get('body_temperature', 0) > THRESHOLDS['body_temperature_high_systemic'] and \
+       data.get('heart_rate', 0) > THRESHOLDS['heart_rate_high_systemic'] and \
+       data.get('respiratory_rate', 0) > THRESHOLDS['respiratory_rate_high_systemic']:
+        detected_diseases.append('Systemic Infection')
+        generated_alerts.append({
+            'symptom': 'body_temperature',
+            'value': data.get('body_temperature'),
+            'message': f"Critically high body temperature detected ({data.get('body_temperature')}°C)!",
+            'severity': 'Critical',
+            'rule_triggered': 'Systemic_Temp'
+        })
+        generated_alerts.append({
+            'symptom': 'heart_rate',
+            'value': data.get('heart_rate'),
+            'message': f"Critically high heart rate detected ({data.get('heart_rate')} bpm)!",
+            'severity': 'Critical',
+            'rule_triggered': 'Systemic_HR'
+        })
+        generated_alerts.append({
+            'symptom': 'respiratory_rate',
+            'value': data.get('respiratory_rate'),
+            'message': f"Critically high respiratory rate detected ({data.get('respiratory_rate')} breaths/min)!",
+            'severity': 'Critical',
+            'rule_triggered': 'Systemic_RR'
+        })
+        abnormal_indicator_count += 3
+
+    # Remove duplicate alert messages and sort by severity
+    unique_alerts_by_message = {}
+    for alert in generated_alerts:
+        unique_alerts_by_message[alert['message']] = alert
+    final_alerts_list = list(unique_alerts_by_message.values())
+
+    severity_order = {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1}
+    final_alerts_list.sort(key=lambda x: severity_order.get(x.get('severity', 'Low'), 0), reverse=True)
+
+    return list(set(detected_diseases)), final_alerts_list, abnormal_indicator_count
+
+
+# --- Reference: temporal features rebuilt from an animal's full stored history with pandas ---
+def recompute_temporal_features(history, signals, windows, ewma_span=6, baseline_span=96):
+    """One TemporalFeatureEngine feature row from `history`, a list of [epoch seconds, *values] in arrival order."""
+    frame = pd.DataFrame(history, columns=['t'] + list(signals))
+    hours = (frame['t'] - frame['t'].iloc[0]) / 3600.0
+    beta = 2.0 / (baseline_span + 1.0)
+    row = []
+    for signal in signals:
+        column = frame[signal]
+        row.append(column.ewm(span=ewma_span, adjust=False).mean().iloc[-1])
+        for w in windows:
+            recent, recent_hours = column.iloc[-w:], hours.iloc[-w:]
+            slope = np.polyfit(recent_hours, recent, 1)[0] if len(recent) > 1 else 0.0
+            row += [recent.mean(), recent.std(ddof=0), slope]
+        # Deviation from the slow baseline as it stood before the latest reading
+        base_mean, base_var = column.iloc[0], 0.0
+        for value in column.iloc[1:-1]:
+            diff = value - base_mean
+            base_mean += beta * diff
+            base_var = (1.0 - beta) * (base_var + diff * beta * diff)
+        base_std = np.sqrt(base_var)
+        row.append((column.iloc[-1] - base_mean) / base_std if len(column) > 1 and base_std > 0 else 0.0)
+    return row
+
+
+# --- Local fake Firestore client (collection().document(), batch().set()/commit(), get_all()) ---
+def merge_into(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_into(target[key], value)
+        else:
+            target[key] = value
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class FakeFirestore:
+    def __init__(self, round_trip_seconds=0.005, fail_commits=0):
+        self.documents = {}
+        self.round_trip_seconds = round_trip_seconds
+        self.fail_commits = fail_commits
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def collection(self, path):
+        return FakeCollection(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, documents):
+        return [FakeSnapshot(self.documents.get(document.path)) for document in documents]
+
+    def _round_trip(self):
+        time.sleep(self.round_trip_seconds)
+        with self._lock:
+            self.commits += 1
+            if self.fail_commits > 0:
+                self.fail_commits -= 1
+                raise ConnectionError("simulated Firestore outage")
+
+
+class FakeCollection:
+    def __init__(self, client, path):
+        self.client, self.path = client, path
+
+    def document(self, document_id):
+        return FakeDocument(self.client, f"{self.path}/{document_id}")
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self.client, self.path = client, path
+
+    def set(self, data):
+        self.client._round_trip()
+        self.client.documents[self.path] = data
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client, self.writes = client, []
+
+    def set(self, document, data, merge=False):
+        self.writes.append((document.path, data, merge))
+
+    def commit(self):
+        self.client._round_trip()
+        for path, data, merge in self.writes:
+            if merge and path in self.client.documents:
+                merge_into(self.client.documents[path], data)
+            else:
+                self.client.documents[path] = data
@@ -0,0 +1,228 @@
+# registry.py
+# Local model registry: a directory of immutable, versioned serving bundles.
+#
+#     <registry>/
+#         registry.json                 {"live": "v3", "candidate": "v4"}  (replaced atomically)
+#         v3/manifest.json              version, creation time, sha256 + size of every file, metadata
+#         v3/serving_bundle.joblib
+#         v3/golden_vectors.json
+#
+# A version directory is never modified after it is published, so a running server can keep
+# its memory-mapped bundle open while the pointer moves on. The API (MODEL_REGISTRY_DIR) serves
+# the live version, checks the pointer for changes and, with MODEL_SHADOW=1, also scores
+# traffic with the candidate in the background.
+#
+#     python registry.py list <registry>
+#     python registry.py publish <registry> <artifact dir> [--version V] [--live | --candidate]
+#     python registry.py promote <registry> V          # make V live
+#     python registry.py candidate <registry> [V]      # shadow V (no version: clear the candidate)
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+POINTER_FILE = 'registry.json'
+MANIFEST_FILE = 'manifest.json'
+BUNDLE_FILE = 'serving_bundle.joblib'
+GOLDEN_FILE = 'golden_vectors.json'
+VERSION_FILES = [BUNDLE_FILE, GOLDEN_FILE]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+class ModelRegistry:
+    """
+    Versioned model bundles with checksummed manifests and a live / candidate pointer.
+
+    Args:
+        root (str): Registry directory (created on first publish).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.pointer_path = os.path.join(root, POINTER_FILE)
+
+    # --- Pointer ---
+    def pointer(self):
+        try:
+            with open(self.pointer_path) as f:
+                pointer = json.load(f)
+        except FileNotFoundError:
+            pointer = {}
+        return {"live": pointer.get("live"), "candidate": pointer.get("candidate")}
+
+    def live_version(self):
+        return self.pointer()["live"]
+
+    def candidate_version(self):
+        return self.pointer()["candidate"]
+
+    def _set_pointer(self, **changes):
+        pointer = self.pointer()
+        pointer.update(changes)
+        for version in filter(None, pointer.values()):
+            self.manifest(version)  # refuse to point at a version that does not exist
+        write_json_atomic(self.pointer_path, dict(pointer, updated=datetime.datetime.now().isoformat(timespec='seconds')))
+
+    def promote(self, version):
+        """Makes `version` live (and stops shadowing it if it was the candidate)."""
+        pointer = self.pointer()
+        self._set_pointer(live=version, candidate=None if pointer["candidate"] == version else pointer["candidate"])
+
+    def set_candidate(self, version):
+        self._set_pointer(candidate=version)
+
+    # --- Versions ---
+    def version_dir(self, version):
+        return os.path.join(self.root, version)
+
+    def manifest(self, version):
+        try:
+            with open(os.path.join(self.version_dir(version), MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"Model version '{version}' is not in the registry at {self.root}")
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        names = [name for name in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, name, MANIFEST_FILE))]
+        return sorted(names, key=lambda name: self.manifest(name).get('created', ''))
+
+    def verify(self, version):
+        """
+        Checks every file of a version against its manifest.
+
+        Returns:
+            tuple: (version directory, manifest)
+
+        Raises:
+            ValueError: If the version is unknown or a file is missing or altered.
+        """
+        manifest = self.manifest(version)
+        directory = self.version_dir(version)
+        for name, expected in manifest['files'].items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                raise ValueError(f"Model version '{version}' is missing {name}")
+            if os.path.getsize(path) != expected['bytes'] or file_sha256(path) != expected['sha256']:
+                raise ValueError(f"Model version '{version}': checksum mismatch for {name}")
+        return directory, manifest
+
+    def next_version(self):
+        numbers = [int(match.group(1)) for match in map(re.compile(r'v(\d+)$').match, self.versions()) if match]
+        return f"v{max(numbers, default=0) + 1}"
+
+    def publish(self, artifact_dir, version=None, metadata=None):
+        """
+        Copies a trained model's serving bundle and golden vectors into a new version.
+
+        The version is assembled in a hidden directory and renamed into place, so a
+        half-written version is never visible.
+
+        Returns:
+            str: The published version.
+        """
+        version = version or self.next_version()
+        if not re.fullmatch(r'[A-Za-z0-9][A-Za-z0-9._-]*', version):
+            raise ValueError(f"Invalid version name '{version}'")
+        if os.path.exists(self.version_dir(version)):
+            raise ValueError(f"Model version '{version}' already exists")
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f'.staging-{version}-{os.getpid()}')
+        os.makedirs(staging)
+        try:
+            files = {}
+            for name in VERSION_FILES:
+                source = os.path.join(artifact_dir, name)
+                shutil.copyfile(source, os.path.join(staging, name))
+                files[name] = {"sha256": file_sha256(os.path.join(staging, name)), "bytes": os.path.getsize(os.path.join(staging, name))}
+            manifest = {
+                "version": version,
+                "created": datetime.datetime.now().isoformat(timespec='seconds'),
+                "files": files,
+                "metadata": metadata or {},
+            }
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(staging, self.version_dir(version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+
+# --- Command line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local model registry.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    listing = commands.add_parser('list', help="List versions and the live / candidate pointer")
+    listing.add_argument('registry')
+
+    publish = commands.add_parser('publish', help="Publish serving_bundle.joblib + golden_vectors.json as a new version")
+    publish.add_argument('registry')
+    publish.add_argument('artifact_dir')
+    publish.add_argument('--version')
+    stage = publish.add_mutually_exclusive_group()
+    stage.add_argument('--live', action='store_true', help="Serve it right away")
+    stage.add_argument('--candidate', action='store_true', help="Shadow-score it against the live version")
+
+    promote = commands.add_parser('promote', help="Make a version live")
+    promote.add_argument('registry')
+    promote.add_argument('version')
+
+    candidate = commands.add_parser('candidate', help="Set (or, without a version, clear) the shadow candidate")
+    candidate.add_argument('registry')
+    candidate.add_argument('version', nargs='?')
+
+    args = parser.parse_args(argv)
+    registry = ModelRegistry(args.registry)
+    try:
+        if args.command == 'list':
+            pointer = registry.pointer()
+            for version in registry.versions():
+                manifest = registry.manifest(version)
+                role = 'live' if version == pointer['live'] else 'candidate' if version == pointer['candidate'] else ''
+                print(f"{version:<12} {manifest['created']:<20} {role:<10} {json.dumps(manifest.get('metadata', {}))}")
+        elif args.command == 'publish':
+            version = registry.publish(args.artifact_dir, args.version)
+            if args.live or registry.live_version() is None:
+                registry.promote(version)
+            elif args.candidate:
+                registry.set_candidate(version)
+            print(f"Published {version}; live: {registry.live_version()}, candidate: {registry.candidate_version()}")
+        elif args.command == 'promote':
+            registry.promote(args.version)
+            print(f"{args.version} is now live.")
+        elif args.command == 'candidate':
+            registry.set_candidate(args.version)
+            print(f"Candidate: {args.version or 'none'}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
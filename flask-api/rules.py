@@ -0,0 +1,423 @@
+# rules.py
+# Rule-based disease detection, shared by the API and the training script.
+# Rules (conditions, severities, messages, disease labels) live in a versioned
+# JSON/YAML file (rules.json). They are validated and compiled once into a
+# RuleEngine, which evaluates them for one reading dict or column-wise over many
+# readings; RuleBook swaps in a recompiled engine when the file changes.
+
+import json
+import logging
+import operator
+import os
+import string
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# --- Default rule file (next to this module) ---
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+COMPARISONS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+CATEGORY_OPS = ('in', 'not_in')
+_NUMBER_TYPES = (int, float, bool)
+
+
+def load_rule_config(path=DEFAULT_RULES_PATH):
+    """
+    Reads a rule file (.json, or .yaml/.yml when PyYAML is installed) and validates it.
+
+    Returns:
+        dict: The parsed config (version, severity_order, rules).
+
+    Raises:
+        ValueError: If the file cannot be parsed or a rule is malformed.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"{path} is YAML but PyYAML is not installed")
+            config = yaml.safe_load(f)
+        else:
+            try:
+                config = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} is not valid JSON: {e}")
+    validate_rule_config(config)
+    return config
+
+
+def validate_rule_config(config):
+    if not isinstance(config, dict) or not isinstance(config.get('rules'), list):
+        raise ValueError("Rule config must be an object with a 'rules' list")
+    severity_order = config.get('severity_order', {})
+    if not isinstance(severity_order, dict):
+        raise ValueError("'severity_order' must map severity names to ranks")
+
+    for position, rule in enumerate(config['rules']):
+        where = f"rule {position} ({rule.get('disease', '?') if isinstance(rule, dict) else '?'})"
+        if not isinstance(rule, dict) or not isinstance(rule.get('disease'), str):
+            raise ValueError(f"{where}: needs a 'disease' name")
+        if not rule.get('conditions') or not rule.get('alerts'):
+            raise ValueError(f"{where}: needs at least one condition and one alert")
+        if not isinstance(rule['conditions'], list) or not isinstance(rule['alerts'], list) or \
+           not all(isinstance(item, dict) for item in rule['conditions'] + rule['alerts']):
+            raise ValueError(f"{where}: 'conditions' and 'alerts' must be lists of objects")
+        for condition in rule['conditions']:
+            op, value = condition.get('op'), condition.get('value')
+            if not isinstance(condition.get('field'), str):
+                raise ValueError(f"{where}: condition without a 'field'")
+            if op in CATEGORY_OPS:
+                if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                    raise ValueError(f"{where}: '{op}' needs a list of strings")
+            elif op in COMPARISONS:
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"{where}: '{op}' needs a numeric value")
+            else:
+                raise ValueError(f"{where}: unknown op {op!r}")
+        for alert in rule['alerts']:
+            missing = [key for key in ('symptom', 'message', 'severity', 'rule_triggered') if not isinstance(alert.get(key), str)]
+            if missing:
+                raise ValueError(f"{where}: alert missing {', '.join(missing)}")
+            if severity_order and alert['severity'] not in severity_order:
+                raise ValueError(f"{where}: unknown severity {alert['severity']!r}")
+            try:
+                # (attribute or index lookups such as {value.__class__} would run on reading values)
+                if any(field not in (None, 'value') for _, field, _, _ in string.Formatter().parse(alert['message'])):
+                    raise ValueError("only {value} can be filled in")
+                alert['message'].format(value=0)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"{where}: bad message template {alert['message']!r} ({e})")
+
+
+def finalize_alerts(detected_diseases, generated_alerts, abnormal_indicator_count, severity_order):
+    """Removes duplicate alert messages and sorts by severity (stable, most severe first)."""
+    unique_alerts_by_message = {}
+    for alert in generated_alerts:
+        unique_alerts_by_message[alert['message']] = alert
+    final_alerts_list = list(unique_alerts_by_message.values())
+    final_alerts_list.sort(key=lambda x: severity_order.get(x.get('severity', 'Low'), 0), reverse=True)
+    return list(set(detected_diseases)), final_alerts_list, abnormal_indicator_count
+
+
+class RuleEngine:
+    """
+    Compiled, immutable evaluator for one version of the rule config.
+
+    evaluate() runs a function generated from the rules at load time that follows the
+    original chain of if-statements exactly (same defaults, same short-circuiting, same
+    errors on malformed values); the result for each combination of fired rules
+    (diseases, severity-sorted alert templates) is worked out once. evaluate_many() computes
+    every condition as a NumPy boolean mask over the batch and only materializes
+    alerts for rows that fire; rows holding values NumPy cannot compare the same way
+    (strings, None, ...) are handed to evaluate() so results match row for row.
+
+    Args:
+        config (dict): Validated rule config, as returned by load_rule_config().
+    """
+
+    def __init__(self, config):
+        self.version = config.get('version')
+        self.severity_order = dict(config.get('severity_order') or {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1})
+        self.rules = []
+        for rule in config['rules']:
+            conditions = []
+            for condition in rule['conditions']:
+                field, op, threshold = condition['field'], condition['op'], condition['value']
+                if op in CATEGORY_OPS:
+                    threshold = frozenset(value.lower() for value in threshold)
+                conditions.append((field, op, threshold))
+            alerts = [
+                {key: alert[key] for key in ('symptom', 'message', 'severity', 'rule_triggered')}
+                for alert in rule['alerts']
+            ]
+            self.rules.append((rule['disease'], conditions, alerts))
+
+        self.numeric_fields = sorted({field for _, conditions, _ in self.rules for field, op, _ in conditions if op in COMPARISONS})
+        self._plans = {}
+        self._evaluate = self._compile_evaluate()
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RULES_PATH):
+        return cls(load_rule_config(path))
+
+    # --- Single reading ---
+    def _compile_evaluate(self):
+        """
+        Generates a straight-line function that tests every rule's conditions in order
+        (with the original defaults and short-circuiting) and sets one bit per fired rule.
+
+        Only operators and generated names go into the source; field names and thresholds
+        are bound through the function's namespace, never pasted in.
+        """
+        namespace = {'materialize': self._materialize}
+        lines = ["def evaluate(data):", "    get = data.get", "    fired = 0"]
+        for r, (_, conditions, _) in enumerate(self.rules):
+            tests = []
+            for c, (field, op, threshold) in enumerate(conditions):
+                namespace[f'F{r}_{c}'], namespace[f'T{r}_{c}'] = field, threshold
+                if op in CATEGORY_OPS:
+                    tests.append(f"get(F{r}_{c}, '').lower() {'in' if op == 'in' else 'not in'} T{r}_{c}")
+                else:
+                    tests.append(f"get(F{r}_{c}, 0) {op} T{r}_{c}")
+            lines.append(f"    if {' and '.join(tests)}:")
+            lines.append(f"        fired |= {1 << r}")
+        lines.append("    return materialize(data, fired)")
+
+        exec(compile("\n".join(lines), f"<rules v{self.version}>", 'exec'), namespace)
+        return namespace['evaluate']
+
+    def _fire(self, data, alerts):
+        return [
+            {
+                'symptom': alert['symptom'],
+                'value': data.get(alert['symptom']),
+                'message': alert['message'].format(value=data.get(alert['symptom'])),
+                'severity': alert['severity'],
+                'rule_triggered': alert['rule_triggered'],
+            }
+            for alert in alerts
+        ]
+
+    def evaluate(self, data):
+        """
+        Detects specific cattle diseases and generates structured alerts for one reading.
+
+        Returns:
+            tuple: (detected disease names, structured alerts sorted by severity,
+                    count of abnormal indicators that triggered alerts)
+
+        Raises:
+            ValueError: If a field holds a value the rules cannot compare (e.g. text where a
+                rule compares numbers).
+        """
+        try:
+            return self._evaluate(data)
+        except (TypeError, AttributeError, ValueError) as e:
+            raise ValueError(f"Rules could not evaluate the reading: {e}") from e
+
+    def _materialize(self, data, fired):
+        """Builds the result for one reading from the bitmask of rules it fired."""
+        if not fired:
+            return [], [], 0
+        plan = self._plans.get(fired)
+        if plan is None:
+            plan = self._plans[fired] = self._plan(fired)
+        detected_diseases, templates, rule_order_diseases, rule_order_alerts, abnormal_indicator_count = plan
+        if templates is None:
+            # Messages in this plan could coincide: build and dedupe like the original code
+            return finalize_alerts(rule_order_diseases, self._fire(data, rule_order_alerts), abnormal_indicator_count, self.severity_order)
+        alerts_list = []
+        for symptom, prefix, suffix, severity, rule_triggered in templates:
+            value = data.get(symptom)
+            alerts_list.append({'symptom': symptom, 'value': value, 'message': f"{prefix}{value}{suffix}",
+                                'severity': severity, 'rule_triggered': rule_triggered})
+        return list(detected_diseases), alerts_list, abnormal_indicator_count
+
+    # --- Many readings ---
+    def _numeric_column(self, records, field, fallback, column=None):
+        if column is None:
+            column = list(map(operator.methodcaller('get', field, 0), records))
+        try:
+            # Fast path: every value numeric, converted in one C-level pass
+            values = np.array(column)
+            if values.ndim == 1 and values.dtype.kind in 'biuf':
+                return values
+        except ValueError:
+            pass
+        # Mixed column: compare the numbers, send everything else through evaluate()
+        values = np.zeros(len(column), dtype=np.float64)
+        for i, value in enumerate(column):
+            if isinstance(value, _NUMBER_TYPES):
+                values[i] = value
+            else:
+                fallback[i] = True
+        return values
+
+    def _category_column(self, records, field, allowed, fallback):
+        column = list(map(operator.methodcaller('get', field, ''), records))
+        try:
+            distinct = set(column)
+        except TypeError:
+            distinct = None
+        if distinct is not None and all(isinstance(value, str) for value in distinct):
+            # Few distinct categories: lower-case and look each one up once
+            matches = {value: value.lower() in allowed for value in distinct}
+            return np.fromiter(map(matches.__getitem__, column), dtype=bool, count=len(column))
+
+        mask = np.zeros(len(column), dtype=bool)
+        for i, value in enumerate(column):
+            if isinstance(value, str):
+                mask[i] = value.lower() in allowed
+            else:
+                fallback[i] = True
+        return mask
+
+    def evaluate_many(self, records, raw_columns=None):
+        """
+        Vectorized evaluate() over a list of reading dicts; returns one result tuple per reading,
+        or, for a reading evaluate() cannot handle, the ValueError it raised (so one bad reading
+        does not fail the rest).
+
+        Args:
+            records (list): Reading dicts.
+            raw_columns (dict, optional): field -> list of record.get(field) values already
+                pulled out by FeatureBuilder.build_matrix(), so they are not read twice.
+        """
+        n = len(records)
+        raw_columns = raw_columns or {}
+        fallback = np.zeros(n, dtype=bool)
+        columns = {field: self._numeric_column(records, field, fallback, raw_columns.get(field)) for field in self.numeric_fields}
+
+        fired = []
+        for _, conditions, _ in self.rules:
+            mask = np.ones(n, dtype=bool)
+            for field, op, threshold in conditions:
+                if op in CATEGORY_OPS:
+                    matches = self._category_column(records, field, threshold, fallback)
+                    mask &= matches if op == 'in' else ~matches
+                else:
+                    mask &= COMPARISONS[op](columns[field], threshold)
+            fired.append(mask)
+
+        fired = np.array(fired, dtype=bool).reshape(len(self.rules), n)
+        fired[:, fallback] = False
+
+        # One bitmask per row (bit r set when rule r fired); rows sharing a bitmask share a plan
+        if len(self.rules) < 63:
+            codes = ((np.int64(1) << np.arange(len(self.rules), dtype=np.int64)) @ fired.astype(np.int64)).tolist()
+        else:
+            weights = [1 << r for r in range(len(self.rules))]
+            codes = [sum(weight for weight, hit in zip(weights, column) if hit) for column in fired.T.tolist()]
+
+        # Rows where nothing fired get the empty result without touching the record
+        materialize = self._materialize
+        results = [materialize(records[i], code) if code else ([], [], 0) for i, code in enumerate(codes)]
+
+        for i in np.flatnonzero(fallback):
+            try:
+                results[i] = self.evaluate(records[i])
+            except ValueError as e:
+                results[i] = e
+        return results
+
+    def _plan(self, fired):
+        """
+        Precomputes the outcome shared by every reading that fires the rules in bitmask `fired`.
+
+        Alert templates come back pre-sorted by severity as (symptom, prefix, suffix, ...)
+        tuples, or None when two messages in the plan could format to the same text
+        and need the dedupe step.
+        """
+        detected_diseases = []
+        rule_order_alerts = []
+        for r, (disease, _, alerts) in enumerate(self.rules):
+            if fired >> r & 1:
+                detected_diseases.append(disease)
+                rule_order_alerts.extend(alerts)
+        ordered_alerts = sorted(rule_order_alerts, key=lambda x: self.severity_order.get(x.get('severity', 'Low'), 0), reverse=True)
+
+        templates = []
+        for alert in ordered_alerts:
+            prefix, placeholder, suffix = alert['message'].partition('{value}')
+            if not placeholder or '{' in prefix + suffix or '}' in prefix + suffix:
+                templates = None
+                break
+            templates.append((alert['symptom'], prefix, suffix, alert['severity'], alert['rule_triggered']))
+        if templates is not None:
+            # Messages are distinct whatever the values if no prefix starts another
+            prefixes = [template[1] for template in templates]
+            if any(a.startswith(b) for i, a in enumerate(prefixes) for j, b in enumerate(prefixes) if i != j):
+                templates = None
+        return list(set(detected_diseases)), templates, detected_diseases, rule_order_alerts, len(rule_order_alerts)
+
+
+class RuleBook:
+    """
+    Holds the live RuleEngine for a rule file and hot-reloads it when the file changes.
+
+    On access the file's mtime is checked at most every check_interval seconds. A changed
+    file is validated and compiled to the side, then swapped in with a single reference
+    assignment, so in-flight requests finish on the engine they started with. A file that
+    fails to load leaves the previous engine serving.
+
+    Args:
+        path (str): Rule file (.json or .yaml/.yml).
+        check_interval (float, optional): Seconds between mtime checks; None disables
+            automatic reloads (reload() still works).
+
+    Raises:
+        ValueError: If the initial load fails.
+    """
+
+    def __init__(self, path=DEFAULT_RULES_PATH, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.engine = None
+        self.loaded_at = None
+        self.last_error = None
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        if not self.reload():
+            raise ValueError(self.last_error)
+
+    def current(self):
+        """Returns the engine to use for this request, picking up file edits when due."""
+        if self.check_interval is not None and time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            # Only one request pays for the stat(); the others keep using the current engine
+            try:
+                self._next_check = time.monotonic() + self.check_interval
+                if self._file_mtime() != self._mtime:
+                    self._load()
+            finally:
+                self._lock.release()
+        return self.engine
+
+    def reload(self):
+        """Reloads the file now. Returns True if a new engine was swapped in."""
+        with self._lock:
+            return self._load()
+
+    def stats(self):
+        engine = self.engine
+        return {
+            "path": self.path,
+            "version": engine.version if engine else None,
+            "rules": len(engine.rules) if engine else 0,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+    def _file_mtime(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        mtime = self._file_mtime()
+        try:
+            engine = RuleEngine.from_file(self.path)
+        except (OSError, ValueError) as e:
+            # Remember the broken file so it is not re-parsed on every check
+            self._mtime = mtime
+            self.last_error = str(e)
+            if self.engine is not None:
+                log.warning("Failed to reload rules from %s (%s). Keeping version %s.", self.path, e, self.engine.version)
+            return False
+
+        self.engine = engine
+        self._mtime = mtime
+        self.last_error = None
+        self.loaded_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.reloads += 1
+        log.info("Loaded rules version %s (%d rules) from %s.", engine.version, len(engine.rules), self.path)
+        return True
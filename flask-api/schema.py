@@ -0,0 +1,211 @@
+# schema.py
+# Input schema for sensor readings, compiled once at startup.
+#
+# A reading must carry every input field; numeric fields must be numbers (numeric strings such as
+# "38.5" are accepted and replaced by their float value) within the range a sensor can actually
+# report, and category fields must be non-empty strings (unseen categories are still allowed, the
+# encoders map them to class 0). Values outside this schema used to reach the model as 0 (NaN fill)
+# or fail later in the rules, so they are reported here, per field, instead.
+#
+# The schema is compiled once into a straight-line check (like the rule engine in rules.py); only
+# readings it rejects go through the per-field path that normalizes values and reports what is
+# wrong. A well-formed reading costs ~1 us, about 0.2 us more than the old presence check: on top
+# of the same 13 lookups it compares 11 ranges and tests the categories' (and some bools') types.
+
+import math
+
+# Plausible sensor limits (inclusive), much wider than the training data so only broken or
+# mis-scaled readings fall outside. Override per field with INPUT_RANGES.
+NUMERIC_RANGES = {
+    'body_temperature': (30.0, 50.0),      # degrees Celsius
+    'milk_production': (0.0, 100.0),       # litres per day
+    'respiratory_rate': (5.0, 200.0),      # breaths per minute
+    'walking_capacity': (0.0, 100000.0),   # steps per day
+    'sleeping_duration': (0.0, 24.0),      # hours per day
+    'body_condition_score': (1.0, 5.0),    # 1-5 scale
+    'heart_rate': (20.0, 300.0),           # beats per minute
+    'eating_duration': (0.0, 24.0),        # hours per day
+    'lying_down_duration': (0.0, 24.0),    # hours per day
+    'ruminating': (0.0, 24.0),             # hours per day
+    'rumen_fill': (1.0, 5.0),              # 1-5 scale
+}
+
+CATEGORY_INPUT_FEATURES = ('breed_type', 'faecal_consistency')
+
+NUMBER_TYPES = (int, float)
+
+
+def parse_ranges(spec):
+    """
+    Parses a per-field range spec such as "body_temperature:30:45,heart_rate:20:300".
+
+    Returns:
+        dict: field -> (lower, upper) bounds.
+    """
+    ranges = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        field, _, bounds = item.partition(':')
+        lower, _, upper = bounds.partition(':')
+        if not upper:
+            raise ValueError(f"Range entry '{item}' must look like field:min:max")
+        ranges[field.strip()] = (float(lower), float(upper))
+    return ranges
+
+
+def parse_number(value):
+    """Returns a numeric string's float value, or None if it is not one."""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def as_float(value):
+    """Returns float(value), or NaN for an integer too large for a float."""
+    try:
+        return float(value)
+    except OverflowError:
+        return math.nan
+
+
+class InputSchema:
+    """
+    Required fields, numeric ranges and category fields of a reading, checked in one pass.
+
+    Args:
+        fields (list): Every required input field; those not in `categories` are numeric.
+        ranges (dict): field -> (lower, upper); merged over NUMERIC_RANGES. Numeric fields
+            without a range are only type-checked.
+        categories (tuple): Fields that must be non-empty strings.
+    """
+
+    def __init__(self, fields, ranges=None, categories=CATEGORY_INPUT_FEATURES):
+        unknown = set(ranges or ()) - set(fields)
+        if unknown:
+            raise ValueError(f"Ranges given for unknown fields: {', '.join(sorted(unknown))}")
+        ranges = dict(NUMERIC_RANGES, **(ranges or {}))
+        self.fields = tuple(fields)
+        self.required = frozenset(fields)
+        self.categories = tuple(field for field in fields if field in categories)
+        self.numeric = []  # (field, lower, upper)
+        for field in fields:
+            if field not in categories:
+                lower, upper = ranges.get(field, (-math.inf, math.inf))
+                self.numeric.append((field, float(lower), float(upper)))
+        self.numeric = tuple(self.numeric)
+        self.check = self._compile_check()
+
+    def _compile_check(self):
+        """
+        Generates a straight-line function that returns True when a reading has every field,
+        each numeric field a number within its range and each category a non-empty string.
+
+        Field names and bounds are bound as default arguments (fast locals), never pasted in.
+        Every range is compared first: a value that is not a number raises TypeError there
+        (strings, None, lists) or fails the comparison (NaN), so only bools, which compare
+        like 0 and 1, need a type test, and only for ranges that contain 0 or 1.
+        """
+        names = {}
+        fetch, in_range, not_bool, tests = [], [], [], []
+        for k, (field, lower, upper) in enumerate(self.numeric):
+            names[f'F{k}'], names[f'L{k}'], names[f'U{k}'] = field, lower, upper
+            fetch.append(f"        n{k} = data[F{k}]")
+            in_range.append(f"L{k} <= n{k} <= U{k}")
+            if lower <= 1 and upper >= 0:
+                not_bool.append(f"type(n{k}) is not bool")
+        for k, field in enumerate(self.categories):
+            names[f'C{k}'] = field
+            fetch.append(f"        c{k} = data[C{k}]")
+            tests.append(f"type(c{k}) is str and c{k} != ''")
+        lines = [f"def check(data, {', '.join(f'{name}={name}' for name in names)}):", "    try:", *fetch]
+        if in_range:
+            lines += [f"        if not ({' and '.join(in_range)}):", "            return False"]
+        lines += ["    except (KeyError, TypeError):", "        return False", f"    return {' and '.join(tests + not_bool) or 'True'}"]
+
+        namespace = dict(names)
+        exec(compile("\n".join(lines), "<input schema>", 'exec'), namespace)
+        return namespace['check']
+
+    # --- One reading ---
+    def validate(self, data, check_values=True, coerce_invalid=False):
+        """
+        Checks one reading in place: numeric strings are replaced by their float value, and with
+        `coerce_invalid` values that are not numbers at all become NaN (scored like a missing value)
+        and invalid categories become '' (encoded like an unseen category, matched by no rule).
+
+        Returns:
+            tuple: (missing fields, or None; problems as {"field", "value", "error"} dicts, or None)
+        """
+        if check_values and self.check(data):
+            return None, None
+        if not self.required <= data.keys():
+            return [field for field in self.fields if field not in data], None
+        if not check_values:
+            return None, None
+
+        problems = None
+        for field, lower, upper in self.numeric:
+            value = data[field]
+            if type(value) in NUMBER_TYPES:
+                if lower <= value <= upper:
+                    continue
+                problem = self._range_problem(field, value, lower, upper)
+                if coerce_invalid and type(value) is int:
+                    data[field] = as_float(value)
+            else:
+                number = parse_number(value)
+                if number is not None:
+                    data[field] = number
+                    if lower <= number <= upper:
+                        continue
+                    problem = self._range_problem(field, value, lower, upper)
+                else:
+                    problem = {"field": field, "value": value, "error": "not a number"}
+                    if coerce_invalid:
+                        data[field] = math.nan
+            if problems is None:
+                problems = []
+            problems.append(problem)
+
+        for field in self.categories:
+            value = data[field]
+            if type(value) is not str or not value:
+                if problems is None:
+                    problems = []
+                problems.append({"field": field, "value": value, "error": "not a non-empty string"})
+                if coerce_invalid:
+                    data[field] = ''
+        return None, problems
+
+    @staticmethod
+    def _range_problem(field, value, lower, upper):
+        # NaN (a JSON NaN literal) fails both comparisons
+        error = "out of range" if value == value else "not a number"
+        if type(value) is int and not -2**63 <= value < 2**64:
+            value = str(value)  # (echoed back as a string: JSON encoders stop at 64-bit integers)
+        return {"field": field, "value": value, "error": error, "range": [lower, upper]}
+
+    # --- Many readings ---
+    def validate_many(self, records, check_values=True, coerce_invalid=False):
+        """
+        Checks a list of readings (dicts) like validate(); only the readings failing the
+        compiled check go through the per-field path.
+
+        Returns:
+            dict: index -> (missing, problems) for the readings that are not valid.
+        """
+        if check_values:
+            check = self.check
+            suspects = [i for i, data in enumerate(records) if not check(data)]
+        else:
+            required = self.required
+            suspects = [i for i, data in enumerate(records) if not required <= data.keys()]
+
+        invalid = {}
+        for i in suspects:
+            missing, problems = self.validate(records[i], check_values, coerce_invalid)
+            if missing or problems:
+                invalid[i] = (missing, problems)
+        return invalid
@@ -0,0 +1,302 @@
+# serve.py
+# Production entry point for app.py: a prefork server.
+# The master process loads and warms up the model once, then forks SERVE_WORKERS
+# workers that share it copy-on-write and accept from one listening socket, each
+# handling up to SERVE_THREADS requests at a time. When the model files change (with
+# MODEL_REGISTRY_DIR: when the registry's live / candidate pointer moves), or on
+# SIGHUP, the master loads the new model, forks a fresh set of workers from it and
+# lets the old ones finish their in-flight requests before they exit.
+#
+#     SERVE_WORKERS=4 SERVE_THREADS=8 python serve.py
+#
+# Settings (environment):
+#     SERVE_BIND               host:port to listen on (default 0.0.0.0:5000)
+#     SERVE_WORKERS            worker processes (default: one per CPU core)
+#     SERVE_THREADS            concurrent requests per worker (default 8)
+#     SERVE_KEEPALIVE_SECONDS  idle seconds before a client connection is closed (default 30)
+#     GRACEFUL_TIMEOUT         seconds a stopping worker gets to finish its requests (default 30)
+#     MODEL_RELOAD_SECONDS     how often the model files are checked for changes (default 10; 0 disables)
+#     LOG_SAMPLE_RATE          fraction of requests that get an access-log line (default 0.01; see app.py)
+# STARTUP_MODE defaults to lazy here, so every worker maps the same serving bundle pages.
+# Signals to the master: SIGHUP reloads the model, SIGTERM / SIGINT shut down gracefully.
+
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+log = logging.getLogger('serve')
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+class RequestHandler(WSGIRequestHandler):
+    # Keep-alive connections and chunked responses for /predict/stream
+    protocol_version = 'HTTP/1.1'
+    timeout = float(os.environ.get('SERVE_KEEPALIVE_SECONDS', 30))
+
+    def log_request(self, code='-', size='-'):
+        # Request counts and latencies are on /metrics; the access log only keeps a sample
+        if ACCESS_LOG_SAMPLE_RATE >= 1.0 or random.random() < ACCESS_LOG_SAMPLE_RATE:
+            super().log_request(code, size)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    werkzeug WSGI server that handles connections on a fixed-size thread pool.
+
+    A connection is only accepted once a thread is free, so a saturated worker
+    leaves new connections on the shared socket for its siblings instead of
+    queueing them behind its own requests.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self.free_threads = threading.BoundedSemaphore(threads)
+
+    def get_request(self):
+        self.free_threads.acquire()
+        try:
+            return super().get_request()
+        except BaseException:
+            # Includes losing the accept() race to another worker (non-blocking listener)
+            self.free_threads.release()
+            raise
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.free_threads.release()
+
+
+def open_listener(bind):
+    host, _, port = bind.rpartition(':')
+    listener = socket.create_server((host.strip('[]') or '0.0.0.0', int(port)), backlog=2048)
+    # Every worker polls this socket; a worker that loses the accept() race must not block in it
+    listener.setblocking(False)
+    return listener
+
+
+def model_files_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def run_worker(flask_app, listener, threads):
+    """Serves requests in a forked worker until SIGTERM, then drains in-flight requests."""
+    # Ctrl+C reaches the whole process group; only the master decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    flask_app.open_storage_backend()
+    host, port = listener.getsockname()[:2]
+    server = PooledWSGIServer(host, port, flask_app.app, threads, listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on this (the serving) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    log.info("Worker %d serving on %s:%s with %d thread(s).", os.getpid(), host, port, threads)
+    try:
+        server.serve_forever()
+    finally:
+        server.pool.shutdown(wait=True)
+        if flask_app.storage_backend:
+            flask_app.storage_backend.close()
+        if flask_app.request_profiler:
+            flask_app.request_profiler.write()
+        log.info("Worker %d stopped.", os.getpid())
+
+
+class Master:
+    """
+    Forks and supervises the workers: replaces workers that die, rolls a new
+    generation of workers after a model reload, and stops them gracefully.
+    """
+
+    def __init__(self, flask_app, listener, workers, threads, reload_seconds, graceful_timeout):
+        self.flask_app = flask_app
+        self.listener = listener
+        self.worker_count = workers
+        self.threads = threads
+        self.reload_seconds = reload_seconds
+        self.graceful_timeout = graceful_timeout
+        self.model_files = flask_app.model_files()
+
+        self.generation = 0
+        self.workers = {}  # pid -> (generation, started)
+        self.draining = {}  # pid -> kill deadline
+        self.stopping = False
+        self.reload_requested = False
+        self.model_signature = model_files_signature(self.model_files)
+        self.pending_signature = None
+        self.next_check = time.monotonic() + reload_seconds
+
+    # --- Workers ---
+    def spawn(self):
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                run_worker(self.flask_app, self.listener, self.threads)
+            except BaseException as e:
+                log.error("Worker %d failed: %s", os.getpid(), e)
+                status = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        self.workers[pid] = (self.generation, time.monotonic())
+
+    def stop_workers(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            if pid in self.workers and pid not in self.draining:
+                self.draining[pid] = deadline
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def kill_stragglers(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.draining.items()):
+            if now >= deadline and pid in self.workers:
+                log.warning("Worker %d did not stop within %.0fs; killing it.", pid, self.graceful_timeout)
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.draining[pid] = float('inf')
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation, started = self.workers.pop(pid, (None, 0.0))
+            expected = self.draining.pop(pid, None) is not None
+            if generation == self.generation and not expected and not self.stopping:
+                log.warning("Worker %d exited unexpectedly (status %s); starting a replacement.", pid, status)
+                # Don't spin if workers die straight after starting
+                if time.monotonic() - started < 1.0:
+                    time.sleep(1.0)
+                self.spawn()
+
+    # --- Model reload ---
+    def model_files_changed(self):
+        if self.reload_seconds <= 0 or time.monotonic() < self.next_check:
+            return False
+        self.next_check = time.monotonic() + self.reload_seconds
+        signature = model_files_signature(self.model_files)
+        if signature == self.model_signature:
+            self.pending_signature = None
+            return False
+        # Training rewrites several files; reload once they have stopped changing for one interval
+        changed = signature == self.pending_signature
+        self.pending_signature = signature
+        return changed
+
+    def reload(self):
+        self.reload_requested = False
+        self.model_signature = model_files_signature(self.model_files)
+        self.pending_signature = None
+        log.info("Reloading the model in the master.")
+
+        gc.unfreeze()
+        reloaded = self.flask_app.reload_model()
+        gc.collect()
+        gc.freeze()
+        if not reloaded:
+            return
+
+        # The new generation is forked already warm; the old one drains its requests and exits
+        previous = [pid for pid, (generation, _) in self.workers.items() if generation == self.generation]
+        self.generation += 1
+        for _ in range(self.worker_count):
+            self.spawn()
+        self.stop_workers(previous)
+        log.info("Started %d worker(s) on the new model; %d old worker(s) draining.", self.worker_count, len(previous))
+
+    # --- Main loop ---
+    def run(self):
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        # Objects loaded so far are never collected in the workers, so the collector
+        # does not write to (and un-share) their pages
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.worker_count):
+            self.spawn()
+
+        while not self.stopping:
+            self.reap()
+            self.kill_stragglers()
+            if self.reload_requested or self.model_files_changed():
+                self.reload()
+            time.sleep(0.2)
+
+        log.info("Shutting down %d worker(s).", len(self.workers))
+        self.stop_workers(list(self.workers))
+        while self.workers:
+            self.reap()
+            self.kill_stragglers()
+            time.sleep(0.1)
+
+
+def main():
+    os.environ.setdefault('STARTUP_MODE', 'lazy')
+    os.environ['SERVE_PREFORK'] = '1'
+    import app as flask_app
+
+    listener = open_listener(os.environ.get('SERVE_BIND', '0.0.0.0:5000'))
+    master = Master(
+        flask_app,
+        listener,
+        workers=max(int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 1)), 1),
+        threads=max(int(os.environ.get('SERVE_THREADS', 8)), 1),
+        reload_seconds=float(os.environ.get('MODEL_RELOAD_SECONDS', 10)),
+        graceful_timeout=float(os.environ.get('GRACEFUL_TIMEOUT', 30)),
+    )
+    host, port = listener.getsockname()[:2]
+    log.info("Master %d listening on %s:%s with %d worker(s) x %d thread(s).", os.getpid(), host, port, master.worker_count, master.threads)
+    master.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# shadow.py
+# Shadow scoring: a candidate model version scores the same readings as the live one on a
+# background thread, and the two are compared. Responses always come from the live version;
+# the candidate only costs spare CPU, and batches are dropped rather than queued when it
+# falls behind.
+
+import collections
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+
+class ShadowScorer:
+    """
+    Compares a candidate ServingModel against the live one on sampled traffic.
+
+    Reported per candidate: how often its predicted label differs from the live one (and in
+    which direction), how far its probabilities are from the live ones, and its scoring time
+    per reading next to the live model's. Live time is measured on the request path and the
+    candidate's on this thread, so under load the comparison favours neither side exactly.
+
+    Args:
+        candidate (ServingModel): The version being evaluated.
+        sample_rate (float): Fraction of scored batches that are shadowed.
+        max_pending (int): Batches waiting for the candidate before new ones are dropped.
+    """
+
+    def __init__(self, candidate, sample_rate=1.0, max_pending=64):
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        # --- Metrics ---
+        self.batches = 0
+        self.rows = 0
+        self.disagreements = 0
+        self.transitions = collections.Counter()  # "live->candidate" label pairs that differ
+        self.probability_delta_sum = 0.0
+        self.probability_delta_max = 0.0
+        self.live_seconds = 0.0
+        self.candidate_seconds = 0.0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+
+    def _ensure_started(self):
+        # Started on first use, and again in a forked worker (threads do not survive fork())
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+            self._thread.start()
+
+    def submit(self, records, live_labels, live_probabilities, live_seconds, live_version=None):
+        """Queues readings the live model just scored (with its outputs and time taken); never blocks."""
+        if self._closed or not records or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return
+        with self._lock:
+            self._ensure_started()
+        try:
+            self._queue.put_nowait((records, list(live_labels), np.asarray(live_probabilities), live_seconds, live_version))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            records, live_labels, live_probabilities, live_seconds, live_version = item
+            try:
+                start = time.perf_counter()
+                labels, probabilities = self.candidate.predict_records(records)
+                candidate_seconds = time.perf_counter() - start
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+                continue
+
+            delta = np.abs(probabilities - live_probabilities).max(axis=1) if probabilities.shape == live_probabilities.shape else None
+            with self._lock:
+                self.batches += 1
+                self.rows += len(records)
+                for live_label, label in zip(live_labels, labels):
+                    if live_label != label:
+                        self.disagreements += 1
+                        self.transitions[f"{live_label}->{label}"] += 1
+                if delta is not None:
+                    self.probability_delta_sum += float(delta.sum())
+                    self.probability_delta_max = max(self.probability_delta_max, float(delta.max()))
+                self.live_seconds += live_seconds
+                self.candidate_seconds += candidate_seconds
+
+    def close(self):
+        """Stops the thread after the queued batches (e.g. when the candidate is replaced)."""
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+
+    def stats(self):
+        with self._lock:
+            rows = self.rows
+            live_us = self.live_seconds / rows * 1e6 if rows else None
+            candidate_us = self.candidate_seconds / rows * 1e6 if rows else None
+            return {
+                "candidate": self.candidate.version,
+                "sample_rate": self.sample_rate,
+                "batches": self.batches,
+                "rows": rows,
+                "disagreements": self.disagreements,
+                "disagreement_rate": round(self.disagreements / rows, 4) if rows else 0.0,
+                "transitions": dict(self.transitions),
+                "mean_probability_delta": round(self.probability_delta_sum / rows, 6) if rows else 0.0,
+                "max_probability_delta": round(self.probability_delta_max, 6),
+                "live_us_per_reading": round(live_us, 2) if live_us is not None else None,
+                "candidate_us_per_reading": round(candidate_us, 2) if candidate_us is not None else None,
+                "latency_ratio": round(candidate_us / live_us, 3) if rows and live_us else None,
+                "pending": self._queue.qsize(),
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
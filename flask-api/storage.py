@@ -0,0 +1,662 @@
+# storage.py
+# Storage backends for prediction results.
+#
+# - WriteBehindQueue moves Firestore writes off the request path. Requests enqueue
+#   (collection path, document id, data) and return at once; a single worker thread
+#   drains the queue in Firestore write batches, retries failed commits with
+#   exponential backoff, and spills to a local JSONL file when the queue is full or a
+#   batch keeps failing. Spilled writes are replayed once Firestore is healthy again.
+# - FirestoreBackend / SQLiteBackend share one small interface (save_predictions,
+#   query_history, stats, close) so app.py can run against Firestore or, offline, an
+#   embedded SQLite store with Parquet rollover for older history.
+
+import abc
+import datetime
+import glob
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Firestore caps a write batch at 500 operations
+FIRESTORE_MAX_BATCH = 500
+
+
+def create_firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+
+
+class LazyFirestoreClient:
+    """
+    Stands in for a Firestore client until it is first used, so startup skips the
+    google.cloud import and the credential lookup. The real client is created by the
+    first write (on the write-behind thread) or history query; if creation fails the
+    error surfaces there (retry / spill) and the next use tries again.
+    """
+
+    def __init__(self, factory=create_firestore_client):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self):
+        return self._client is not None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                    log.info("Firestore client initialized on first use.")
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class WriteBehindQueue:
+    """
+    Bounded, batching write-behind queue for a Firestore-compatible client.
+
+    Args:
+        client: Object exposing collection(path).document(id) and batch() (google.cloud.firestore.Client or a fake).
+        max_queue_size (int): Writes held in memory before new ones spill to disk.
+        batch_size (int): Maximum writes per commit (capped at Firestore's 500).
+        linger_seconds (float): How long the worker waits to fill a batch after the first write arrives.
+        max_retries (int): Commit attempts per batch before it is spilled.
+        backoff_seconds (float): First retry delay; doubles on each failure up to max_backoff_seconds.
+        spill_path (str): JSONL file receiving writes that could not be queued or committed.
+    """
+
+    def __init__(self, client, max_queue_size=10000, batch_size=FIRESTORE_MAX_BATCH, linger_seconds=0.05,
+                 max_retries=5, backoff_seconds=0.5, max_backoff_seconds=30.0, spill_path='firestore_spill.jsonl'):
+        self.client = client
+        self.batch_size = min(batch_size, FIRESTORE_MAX_BATCH)
+        self.linger_seconds = linger_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.spill_path = spill_path
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._overflowing = False
+
+        # --- Metrics ---
+        self.enqueued = 0
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.commit_failures = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='firestore-write-behind', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Drains what is queued (up to timeout), then stops the worker. Anything left is spilled."""
+        self.flush(timeout)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        if leftovers:
+            self._spill(leftovers)
+
+    def flush(self, timeout=None):
+        """Blocks until every queued write has been committed or spilled. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    # --- Producer side (request threads) ---
+    def enqueue(self, collection_path, document_id, data, merge=False):
+        """
+        Queues one document write (merge=True merges into an existing document, e.g. history buckets).
+        Returns False if the queue was full and the write went to the spill file.
+        """
+        item = (collection_path, document_id, data, merge)
+        with self._stats_lock:
+            self.enqueued += 1
+        try:
+            self._queue.put_nowait(item)
+            self._overflowing = False
+            return True
+        except queue.Full:
+            # Warn once per overflow episode rather than once per spilled write
+            if not self._overflowing:
+                self._overflowing = True
+                log.warning("Firestore write queue full (%d); spilling new writes to %s.", self._queue.maxsize, self.spill_path)
+            self._spill([item], quiet=True)
+            return False
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'spilled': self.spilled,
+                'replayed': self.replayed,
+                'commit_failures': self.commit_failures,
+                'flushes': self.flushes,
+                'last_flush_ms': round(self.last_flush_seconds * 1000, 3),
+                'avg_flush_ms': round(self.total_flush_seconds / self.flushes * 1000, 3) if self.flushes else 0.0,
+                'total_flush_ms': round(self.total_flush_seconds * 1000, 3),
+                'max_flush_ms': round(self.max_flush_seconds * 1000, 3),
+                'spill_pending': os.path.exists(self.spill_path),
+            }
+
+    # --- Worker side ---
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+
+            items = [first]
+            deadline = time.monotonic() + self.linger_seconds
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if not self._commit_with_retry(items):
+                    self._spill(items)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _commit(self, items):
+        batch = self.client.batch()
+        for collection_path, document_id, data, merge in items:
+            batch.set(self.client.collection(collection_path).document(document_id), data, merge=merge)
+        batch.commit()
+
+    def _commit_with_retry(self, items):
+        delay = self.backoff_seconds
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self._commit(items)
+            except Exception as e:
+                with self._stats_lock:
+                    self.commit_failures += 1
+                log.error("Firestore batch commit failed (attempt %d/%d): %s", attempt, self.max_retries, e)
+                if attempt == self.max_retries or self._stop.wait(delay):
+                    return False
+                delay = min(delay * 2, self.max_backoff_seconds)
+                continue
+
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.written += len(items)
+                self.flushes += 1
+                self.last_flush_seconds = elapsed
+                self.total_flush_seconds += elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            return True
+        return False
+
+    # --- Spill file ---
+    def _spill(self, items, quiet=False):
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for collection_path, document_id, data, merge in items:
+                    f.write(json.dumps({'collection': collection_path, 'document': document_id, 'data': data, 'merge': merge}) + "\n")
+        with self._stats_lock:
+            self.spilled += len(items)
+        if not quiet:
+            log.warning("%d Firestore write(s) spilled to %s.", len(items), self.spill_path)
+
+    def _replay_spill(self):
+        replay_path = self.spill_path + '.replay'
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+
+        with open(replay_path, encoding='utf-8') as f:
+            items = [(entry['collection'], entry['document'], entry['data'], entry.get('merge', False)) for entry in map(json.loads, filter(str.strip, f))]
+
+        for start in range(0, len(items), self.batch_size):
+            chunk = items[start:start + self.batch_size]
+            if not self._commit_with_retry(chunk):
+                # Still failing: put the unwritten remainder back and try again on the next idle tick
+                self._spill(items[start:])
+                break
+            with self._stats_lock:
+                self.replayed += len(chunk)
+        os.remove(replay_path)
+
+
+# --- Append-only per-animal history ---
+# Each prediction is appended to one bucket document per animal per hour (or day),
+# holding compact value rows keyed by time of day. The full latest result keeps
+# living in cattle_data/<cattle_id>, which is what dashboards subscribe to; reports
+# fetch only the bucket documents for the dates they need. Hour buckets are the
+# default: at one reading every 5 seconds a day bucket would hold ~17k rows, past
+# Firestore's 1 MiB document size and its index-entry limit; an hour holds ~720.
+
+# Column order of every history row; written into each bucket so rows stay self-describing
+HISTORY_COLUMNS = [
+    'body_temperature', 'milk_production', 'respiratory_rate', 'walking_capacity',
+    'sleeping_duration', 'body_condition_score', 'heart_rate', 'eating_duration',
+    'lying_down_duration', 'ruminating', 'rumen_fill', 'breed_type', 'faecal_consistency',
+    'health_status', 'risk_level', 'confidence', 'alert_count'
+]
+
+
+def history_collection_path(app_id, user_id, cattle_id):
+    return f'artifacts/{app_id}/users/{user_id}/cattle_history/{cattle_id}/buckets'
+
+
+def history_bucket_id(timestamp, granularity='day'):
+    """'2024-05-01 13:45:10' -> '2024-05-01' (day) or '2024-05-01T13' (hour)."""
+    if granularity == 'hour':
+        return f"{timestamp[:10]}T{timestamp[11:13]}"
+    return timestamp[:10]
+
+
+def build_history_row(response_data):
+    snapshot = response_data.get('input_data_snapshot', {})
+    monitoring = response_data.get('monitoring_results', {})
+    confidence = monitoring.get('confidence')
+    if isinstance(confidence, str):
+        confidence = float(confidence.rstrip('%'))
+
+    row = [snapshot.get(col) for col in HISTORY_COLUMNS[:13]]
+    row += [monitoring.get('health_status'), monitoring.get('risk_level'), confidence, len(response_data.get('alerts', []))]
+    return row
+
+
+# Sub-second part of history row keys: microseconds of the wall clock, kept strictly increasing
+# within the process so readings stamped with the same second (e.g. one batch) never share a key
+_row_clock_lock = threading.Lock()
+_row_clock_last = 0
+
+
+def history_row_key(timestamp):
+    """'2024-05-01 13:45:10' -> 't134510_123456': time of day, then a unique sub-second part."""
+    global _row_clock_last
+    with _row_clock_lock:
+        now = _row_clock_last = max(time.time_ns() // 1000, _row_clock_last + 1)
+    return f"t{timestamp[11:19].replace(':', '')}_{now % 1000000:06d}"
+
+
+def build_history_write(response_data, app_id, user_id, granularity='hour'):
+    """
+    Returns (collection_path, document_id, data) for a merge-write appending this
+    result to its bucket. The row key (history_row_key) is fixed here, so a retried
+    or replayed write lands on the same key instead of duplicating the reading.
+    """
+    timestamp = response_data['timestamp']
+    cattle_id = response_data['cattle_id']
+    data = {
+        'cattle_id': cattle_id,
+        'bucket': history_bucket_id(timestamp, granularity),
+        'columns': HISTORY_COLUMNS,
+        'last_timestamp': timestamp,
+        'readings': {history_row_key(timestamp): build_history_row(response_data)},
+    }
+    return history_collection_path(app_id, user_id, cattle_id), data['bucket'], data
+
+
+def decode_history_bucket(bucket):
+    """
+    Expands a bucket document into a time-ordered list of {column: value} readings.
+    (Keys are 't' + HHMMSS, plus '_' and a sub-second part since that was added.)
+    """
+    columns = bucket.get('columns', HISTORY_COLUMNS)
+    date = bucket.get('bucket', '')[:10]
+    readings = []
+    for key in sorted(bucket.get('readings', {})):
+        clock = f"{key[1:3]}:{key[3:5]}:{key[5:7]}"
+        reading = dict(zip(columns, bucket['readings'][key]))
+        reading['timestamp'] = f"{date} {clock}"
+        readings.append(reading)
+    return readings
+
+
+def history_bucket_ids(start, end, granularity='day'):
+    """
+    Bucket document ids covering the dates start..end (datetime.date, inclusive). With
+    'hour', each date's day bucket is included too, so history written with day buckets
+    (the earlier default) still shows up.
+    """
+    bucket_ids = []
+    for offset in range((end - start).days + 1):
+        day = (start + datetime.timedelta(days=offset)).isoformat()
+        bucket_ids += [day] + [f"{day}T{hour:02d}" for hour in range(24)] if granularity == 'hour' else [day]
+    return bucket_ids
+
+
+# --- Storage backend interface ---
+class StorageBackend(abc.ABC):
+    """
+    What app.py needs from a store of prediction results. Subclasses must implement
+    save_predictions() and query_history(); stats(), flush() and close() have defaults.
+
+    save_predictions() must not block on the network and appends every result to
+    its animal's history; `latest` (one bool per result, None for all True) says
+    which results also replace the animal's latest full result. query_history()
+    returns time-ordered readings shaped like decode_history_bucket() output.
+    """
+
+    name = 'none'
+
+    @abc.abstractmethod
+    def save_predictions(self, user_id, results, latest=None):
+        pass
+
+    @abc.abstractmethod
+    def query_history(self, user_id, cattle_id, start, end):
+        pass
+
+    def stats(self):
+        return {'backend': self.name}
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+
+class FirestoreBackend(StorageBackend):
+    """
+    Latest-state documents plus hour/day history buckets in Firestore, written
+    through a WriteBehindQueue.
+    """
+
+    name = 'firestore'
+
+    def __init__(self, db, app_id, granularity='hour', **queue_options):
+        self.db = db
+        self.app_id = app_id
+        self.granularity = granularity
+        self.writer = WriteBehindQueue(db, **queue_options).start()
+
+    def save_predictions(self, user_id, results, latest=None):
+        collection_path = f'artifacts/{self.app_id}/users/{user_id}/cattle_data'
+        # Each result is appended to the animal's history bucket and, unless unchanged, overwrites its latest-state document
+        for i, response_data in enumerate(results):
+            if latest is None or latest[i]:
+                self.writer.enqueue(collection_path, response_data['cattle_id'], response_data)
+            self.writer.enqueue(*build_history_write(response_data, self.app_id, user_id, self.granularity), merge=True)
+
+    def query_history(self, user_id, cattle_id, start, end):
+        collection_ref = self.db.collection(history_collection_path(self.app_id, user_id, cattle_id))
+        references = [collection_ref.document(bucket_id) for bucket_id in history_bucket_ids(start, end, self.granularity)]
+        readings = []
+        for snapshot in self.db.get_all(references):
+            if snapshot.exists:
+                readings += decode_history_bucket(snapshot.to_dict())
+        readings.sort(key=lambda reading: reading['timestamp'])
+        return readings
+
+    def stats(self):
+        return dict(self.writer.stats(), backend=self.name)
+
+    def flush(self, timeout=None):
+        return self.writer.flush(timeout)
+
+    def close(self):
+        self.writer.stop()
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded telemetry store for offline farms.
+
+    Recent results live in a SQLite database in WAL mode (readers never block the
+    writer), indexed on (user_id, cattle_id, timestamp) for fast per-animal range
+    queries. Inserts are queued and written by one thread with executemany() in a
+    single transaction per batch; every statement is a fixed SQL string, so the
+    connection's prepared-statement cache (cached_statements) reuses compiled plans.
+    Rows older than rollover_days are moved to one Parquet file per day under
+    parquet_dir (requires pyarrow; without it rows simply stay in SQLite).
+
+    Args:
+        path (str): SQLite database file.
+        parquet_dir (str): Directory receiving rolled-over history.
+        rollover_days (int): Age after which rows move to Parquet (0 disables rollover).
+        batch_size (int): Maximum rows per insert transaction.
+        linger_seconds (float): How long the writer waits to fill a batch.
+        max_queue_size (int): Pending rows before save_predictions() blocks (backpressure).
+    """
+
+    name = 'sqlite'
+
+    COLUMNS = ['user_id', 'cattle_id', 'timestamp'] + HISTORY_COLUMNS + ['result']
+    INSERT_SQL = f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    RANGE_SQL = (f"SELECT timestamp, {', '.join(HISTORY_COLUMNS)} FROM predictions "
+                 "WHERE user_id = ? AND cattle_id = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp")
+    SCHEMA_SQL = [
+        "CREATE TABLE IF NOT EXISTS predictions ("
+        "user_id TEXT NOT NULL, cattle_id TEXT NOT NULL, timestamp TEXT NOT NULL, "
+        "body_temperature REAL, milk_production REAL, respiratory_rate REAL, walking_capacity REAL, "
+        "sleeping_duration REAL, body_condition_score REAL, heart_rate REAL, eating_duration REAL, "
+        "lying_down_duration REAL, ruminating REAL, rumen_fill REAL, breed_type TEXT, faecal_consistency TEXT, "
+        "health_status TEXT, risk_level TEXT, confidence REAL, alert_count INTEGER, result TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_predictions_user_cattle_ts ON predictions (user_id, cattle_id, timestamp)",
+    ]
+
+    def __init__(self, path='telemetry.db', parquet_dir='telemetry_history', rollover_days=30,
+                 batch_size=500, linger_seconds=0.05, max_queue_size=100000):
+        self.path = path
+        self.parquet_dir = parquet_dir
+        self.rollover_days = rollover_days
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._rollover_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # --- Metrics ---
+        self.inserted = 0
+        self.insert_batches = 0
+        self.last_insert_seconds = 0.0
+        self.total_insert_seconds = 0.0
+        self.write_failures = 0
+        self.rolled_over = 0
+        self.last_rollover_check = 0.0
+
+        connection = self._connection()
+        for statement in self.SCHEMA_SQL:
+            connection.execute(statement)
+        connection.commit()
+
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def _connection(self):
+        # One connection per thread; WAL lets request threads read while the writer thread writes
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, cached_statements=256, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # --- Writes ---
+    def save_predictions(self, user_id, results, latest=None):
+        for i, response_data in enumerate(results):
+            row = [user_id, response_data['cattle_id'], response_data['timestamp']]
+            row += build_history_row(response_data)
+            # (the full result is only kept when it changed; unchanged readings keep their history values)
+            row.append(json.dumps(response_data) if latest is None or latest[i] else None)
+            self._queue.put(row)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._maybe_rollover()
+                continue
+
+            rows = [first]
+            deadline = time.monotonic() + self.linger_seconds
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    rows.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._insert(rows)
+            except Exception as e:
+                with self._stats_lock:
+                    self.write_failures += 1
+                log.error("Failed to write %d row(s) to SQLite: %s", len(rows), e)
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def _insert(self, rows):
+        start = time.perf_counter()
+        connection = self._connection()
+        with connection:
+            connection.executemany(self.INSERT_SQL, rows)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.inserted += len(rows)
+            self.insert_batches += 1
+            self.last_insert_seconds = elapsed
+            self.total_insert_seconds += elapsed
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    # --- Reads ---
+    def query_history(self, user_id, cattle_id, start, end):
+        readings = self._read_parquet(user_id, cattle_id, start, end)
+        cursor = self._connection().execute(self.RANGE_SQL, (user_id, cattle_id, f"{start.isoformat()} 00:00:00", f"{end.isoformat()} 23:59:59"))
+        names = ['timestamp'] + HISTORY_COLUMNS
+        readings += [dict(zip(names, row)) for row in cursor]
+        readings.sort(key=lambda reading: reading['timestamp'])
+        return readings
+
+    def _read_parquet(self, user_id, cattle_id, start, end):
+        paths = []
+        for bucket_id in history_bucket_ids(start, end):
+            paths += glob.glob(os.path.join(self.parquet_dir, f"{bucket_id}*.parquet"))
+        if not paths:
+            return []
+
+        import pyarrow.parquet as pq
+
+        readings = []
+        for path in sorted(paths):
+            table = pq.read_table(path, columns=['timestamp'] + HISTORY_COLUMNS,
+                                  filters=[('user_id', '=', user_id), ('cattle_id', '=', cattle_id)])
+            readings += table.to_pylist()
+        return readings
+
+    # --- Parquet rollover ---
+    def _maybe_rollover(self):
+        if self.rollover_days and time.monotonic() - self.last_rollover_check > 3600:
+            self.last_rollover_check = time.monotonic()
+            self.rollover()
+
+    def rollover(self, before=None):
+        """Moves rows older than `before` (default: now - rollover_days) into per-day Parquet files."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            log.warning("pyarrow not installed; keeping old telemetry in SQLite.")
+            return 0
+
+        if before is None:
+            before = datetime.date.today() - datetime.timedelta(days=self.rollover_days)
+        cutoff = f"{before.isoformat()} 00:00:00"
+
+        with self._rollover_lock:
+            connection = self._connection()
+            names = [name for name in self.COLUMNS if name != 'result']
+            rows = connection.execute(
+                f"SELECT {', '.join(names)} FROM predictions WHERE timestamp < ? ORDER BY timestamp", (cutoff,)
+            ).fetchall()
+            if not rows:
+                return 0
+
+            os.makedirs(self.parquet_dir, exist_ok=True)
+            by_day = {}
+            for row in rows:
+                by_day.setdefault(row[2][:10], []).append(dict(zip(names, row)))
+            for day, day_rows in by_day.items():
+                # Later rollovers of the same day get their own part file
+                part = len(glob.glob(os.path.join(self.parquet_dir, f"{day}*.parquet")))
+                pq.write_table(pa.Table.from_pylist(day_rows), os.path.join(self.parquet_dir, f"{day}-part{part:03d}.parquet"))
+
+            with connection:
+                connection.execute("DELETE FROM predictions WHERE timestamp < ?", (cutoff,))
+        with self._stats_lock:
+            self.rolled_over += len(rows)
+        log.info("Rolled %d telemetry row(s) older than %s into %s.", len(rows), before.isoformat(), self.parquet_dir)
+        return len(rows)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'backend': self.name,
+                'path': self.path,
+                'queue_depth': self._queue.qsize(),
+                'inserted': self.inserted,
+                'insert_batches': self.insert_batches,
+                'last_insert_ms': round(self.last_insert_seconds * 1000, 3),
+                'total_insert_ms': round(self.total_insert_seconds * 1000, 3),
+                'write_failures': self.write_failures,
+                'rolled_over': self.rolled_over,
+            }
+
+    def close(self):
+        self.flush(10.0)
+        self._stop.set()
+        self._thread.join(10.0)
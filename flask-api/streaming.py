@@ -0,0 +1,275 @@
+# streaming.py
+# Micro-batching for the API.
+# - MicroBatcher: for the long-lived /predict/stream ingestion endpoint. A reader thread
+#   parses NDJSON lines from the request body into a bounded buffer; the response
+#   generator drains that queue in windows closed by size or time, so the model always
+#   sees batches while results stream back continuously.
+# - InferenceBatcher: for concurrent /predict requests. Handlers hand their reading to one
+#   inference thread and wait on a future; the thread scores whatever has gathered in one
+#   vectorized pass, instead of every request thread running the forest for one row.
+
+import collections
+import contextlib
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Upper bound on bytes requested per readline() (long lines are reassembled)
+READ_SIZE = 64 * 1024
+
+
+def iter_body_lines(environ):
+    """
+    Yields the request body line by line as it arrives.
+
+    Reads wsgi.input directly: werkzeug's request.stream wrappers either read one byte per
+    readline() or block until a whole buffer is filled, which stalls incremental delivery.
+    Never reads past Content-Length; bodies without one (chunked) are read to the end only
+    when the server marks the input as terminated.
+    """
+    stream = environ['wsgi.input']
+    content_length = environ.get('CONTENT_LENGTH')
+    if content_length:
+        remaining = int(content_length)
+    elif environ.get('wsgi.input_terminated'):
+        remaining = None
+    else:
+        return
+
+    pending = b''
+    while remaining is None or remaining > 0:
+        piece = stream.readline(READ_SIZE if remaining is None else min(remaining, READ_SIZE))
+        if not piece:
+            break
+        if remaining is not None:
+            remaining -= len(piece)
+        if piece.endswith(b'\n'):
+            yield pending + piece
+            pending = b''
+        else:
+            pending += piece
+    if pending:
+        yield pending
+
+
+def iter_ndjson(lines):
+    """
+    Yields (line_number, reading) for each non-empty line.
+    Lines that are not valid JSON yield a ValueError in place of the reading.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON on line {line_number}: {e}")
+
+
+class MicroBatcher:
+    """
+    Groups a stream of items into windows of at most max_batch_size items, closing a
+    window early once max_wait_seconds have passed since its first item arrived.
+
+    Backpressure is explicit: the reader thread stops pulling from the source once
+    max_pending items are waiting, which stops reads from the socket and lets TCP
+    flow control slow the sender down.
+
+    Args:
+        source (iterable): Items to batch (consumed on a background thread).
+        max_batch_size (int): Largest window handed to the model.
+        max_wait_seconds (float): Longest a reading waits for its window to fill.
+        max_pending (int): Items buffered between the socket and the model.
+    """
+
+    def __init__(self, source, max_batch_size=256, max_wait_seconds=0.05, max_pending=4096):
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_pending = max(max_pending, max_batch_size)
+        # Readings are handed over in bulk under one condition, not one queue.get() per reading:
+        # per-item wakeups cost a GIL handoff each and dominated the stream's CPU time
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._finished = False
+        self._stopped = False
+        self._error = None
+        self._thread = threading.Thread(target=self._read, args=(source,), name='stream-reader', daemon=True)
+        self._thread.start()
+
+    def _read(self, source):
+        items, cond = self._items, self._cond
+        try:
+            for item in source:
+                with cond:
+                    # Backpressure: stop reading the socket while the buffer is full
+                    while len(items) >= self.max_pending and not self._stopped:
+                        cond.wait(0.5)
+                    if self._stopped:
+                        return
+                    items.append(item)
+                    # Wake the consumer only when a window can start or is full
+                    if len(items) == 1 or len(items) >= self.max_batch_size:
+                        cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with cond:
+                self._finished = True
+                cond.notify_all()
+
+    def __iter__(self):
+        items, cond = self._items, self._cond
+        while True:
+            with cond:
+                while not items and not self._finished:
+                    cond.wait()
+                if not items:
+                    break
+
+                # Window opened: wait until it fills, the input ends, or max_wait_seconds pass
+                deadline = time.monotonic() + self.max_wait_seconds
+                while len(items) < self.max_batch_size and not self._finished:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    cond.wait(remaining)
+
+                window = [items.popleft() for _ in range(min(len(items), self.max_batch_size))]
+                cond.notify_all()
+            yield window
+
+        if self._error is not None:
+            raise self._error
+
+    def pending(self):
+        return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class InferenceBatcher:
+    """
+    Coalesces single-reading requests from many threads into micro-batches scored
+    on one dedicated thread.
+
+    A window opens when the first reading arrives and closes when it holds
+    max_batch_size readings, when its oldest reading has waited max_wait_seconds,
+    or as soon as no announced request (see reserve()) is still on its way. A lone
+    request is therefore scored at once, and queueing adds at most max_wait_seconds
+    to any request's latency.
+
+    Args:
+        score_batch (callable): Takes a list of readings, returns one result per reading.
+        max_batch_size (int): Largest window handed to score_batch.
+        max_wait_seconds (float): Longest a reading waits for its window to fill.
+        max_pending (int): Readings queued before submit() refuses new ones (queue.Full).
+    """
+
+    def __init__(self, score_batch, max_batch_size=64, max_wait_seconds=0.002, max_pending=1024):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_pending = max(max_pending, max_batch_size)
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._incoming = 0
+        self._thread = None
+
+        # --- Metrics ---
+        self.batches = 0
+        self.scored = 0
+        self.max_window = 0
+
+    def _ensure_started(self):
+        # Started on first use, so a prefork master never forks with this thread running
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+            self._thread.start()
+
+    @contextlib.contextmanager
+    def reserve(self):
+        """
+        Announces a request that will submit a reading shortly (e.g. while its body is still
+        being parsed), so an open window waits for it rather than closing without it.
+        Yields the submit function to use; leaving the block without submitting is fine.
+        """
+        reservation = {'open': True}
+        with self._cond:
+            self._incoming += 1
+
+        def submit(item):
+            return self.submit(item, reservation)
+
+        try:
+            yield submit
+        finally:
+            with self._cond:
+                if reservation['open']:
+                    reservation['open'] = False
+                    self._incoming -= 1
+                    self._cond.notify_all()
+
+    def submit(self, item, reservation=None):
+        """
+        Queues one reading for scoring.
+
+        Returns:
+            concurrent.futures.Future: Resolves to score_batch's result for the reading.
+
+        Raises:
+            queue.Full: If max_pending readings are already waiting.
+        """
+        future = Future()
+        with self._cond:
+            if reservation is not None and reservation['open']:
+                reservation['open'] = False
+                self._incoming -= 1
+            if len(self._items) >= self.max_pending:
+                raise queue.Full
+            self._ensure_started()
+            self._items.append((item, future, time.monotonic()))
+            self._cond.notify_all()
+        return future
+
+    def _run(self):
+        items, cond = self._items, self._cond
+        while True:
+            with cond:
+                while not items:
+                    cond.wait()
+                deadline = items[0][2] + self.max_wait_seconds
+                while len(items) < self.max_batch_size and self._incoming > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    cond.wait(remaining)
+                window = [items.popleft() for _ in range(min(len(items), self.max_batch_size))]
+
+            try:
+                results = self.score_batch([item for item, _, _ in window])
+            except Exception as e:
+                for _, future, _ in window:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(window, results):
+                future.set_result(result)
+
+            self.batches += 1
+            self.scored += len(window)
+            self.max_window = max(self.max_window, len(window))
+
+    def stats(self):
+        return {
+            "pending": len(self._items),
+            "batches": self.batches,
+            "scored": self.scored,
+            "mean_batch_size": round(self.scored / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size_seen": self.max_window,
+        }
@@ -0,0 +1,268 @@
+# temporal.py
+# Incremental rolling-window features per animal, shared by the API (app.py) and the
+# training script. Each reading updates running sums for its animal in O(1): the value
+# leaving each window is subtracted and the new one added, so the cost per reading is
+# constant no matter how much history an animal has.
+#
+# Per tracked signal (e.g. body_temperature) the engine produces:
+#     <signal>_ewma            exponentially weighted mean (span ewma_span readings)
+#     <signal>_mean_<w>        rolling mean over the last w readings
+#     <signal>_std_<w>         rolling (population) standard deviation
+#     <signal>_slope_<w>       least-squares trend over the window, per hour
+#     <signal>_baseline_z      deviation from the animal's own slow baseline, in baseline std units
+
+import datetime
+import threading
+import time
+
+import numpy as np
+
+from features import to_float
+
+# Signals whose trends precede illness (fever, rumination and milk drops, tachycardia, inactivity)
+DEFAULT_SIGNALS = [
+    'body_temperature', 'ruminating', 'milk_production', 'heart_rate',
+    'respiratory_rate', 'walking_capacity', 'eating_duration'
+]
+DEFAULT_WINDOWS = (6, 24)
+
+# Running sums are rebuilt from the ring buffer every this many windows' worth of readings,
+# so floating-point drift from add/subtract updates never accumulates (amortised O(1))
+REFRESH_EVERY_WINDOWS = 8
+
+
+def parse_windows(spec):
+    windows = sorted({int(part) for part in (spec or '').split(',') if part.strip()})
+    if not windows or windows[0] < 2:
+        raise ValueError("Rolling windows must be integers >= 2, e.g. '6,24'")
+    return windows
+
+
+def reading_time(data, default):
+    """Epoch seconds of a reading's 'timestamp' (epoch number or ISO string), else `default`."""
+    value = data.get('timestamp')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return default
+
+
+class TemporalFeatureEngine:
+    """
+    Array-backed rolling statistics per animal.
+
+    State per animal is a ring buffer of its last max(windows) readings plus running
+    sums per window, an EWMA and an exponentially weighted baseline mean/variance. Batches
+    are updated vectorised across animals (an animal appearing several times in one batch
+    is applied in order).
+
+    Missing or unparsable values are carried forward from the animal's EWMA (0.0 before
+    its first valid reading), so one bad reading cannot poison the running sums.
+
+    Args:
+        signals (list): Numeric reading fields to track.
+        windows (iterable): Rolling window lengths, in readings.
+        ewma_span (float): Span of the EWMA (alpha = 2 / (span + 1)).
+        baseline_span (float): Span of the slow per-animal baseline.
+        max_animals (int): Animals tracked; readings for others get NaN features.
+    """
+
+    def __init__(self, signals=None, windows=DEFAULT_WINDOWS, ewma_span=6, baseline_span=96,
+                 max_animals=100000, initial_capacity=1024):
+        self.signals = list(signals or DEFAULT_SIGNALS)
+        self.windows = sorted(set(int(w) for w in windows))
+        self.depth = self.windows[-1]
+        self.alpha = 2.0 / (ewma_span + 1.0)
+        self.beta = 2.0 / (baseline_span + 1.0)
+        self.max_animals = max_animals
+        self._lock = threading.Lock()
+
+        self.feature_names = []
+        for signal in self.signals:
+            self.feature_names.append(f'{signal}_ewma')
+            for w in self.windows:
+                self.feature_names += [f'{signal}_mean_{w}', f'{signal}_std_{w}', f'{signal}_slope_{w}']
+            self.feature_names.append(f'{signal}_baseline_z')
+
+        self.index = {}
+        self._allocate(max(min(initial_capacity, max_animals), 1))
+
+    # --- Storage ---
+    def _allocate(self, capacity, previous=None):
+        n_signals = len(self.signals)
+        shapes = {
+            'values': (capacity, self.depth, n_signals), 'times': (capacity, self.depth),
+            'count': (capacity,), 't0': (capacity,),
+            'ewma': (capacity, n_signals), 'base_mean': (capacity, n_signals), 'base_var': (capacity, n_signals),
+        }
+        for w in self.windows:
+            shapes.update({
+                f'sum_y_{w}': (capacity, n_signals), f'sum_yy_{w}': (capacity, n_signals), f'sum_ty_{w}': (capacity, n_signals),
+                f'sum_t_{w}': (capacity,), f'sum_tt_{w}': (capacity,),
+            })
+        self.state = {}
+        for name, shape in shapes.items():
+            array = np.zeros(shape, dtype=np.int64 if name == 'count' else np.float64)
+            if previous is not None:
+                array[:len(previous[name])] = previous[name]
+            self.state[name] = array
+        self.capacity = capacity
+
+    def _rows(self, cattle_ids):
+        rows = np.empty(len(cattle_ids), dtype=np.intp)
+        for i, cattle_id in enumerate(cattle_ids):
+            row = self.index.get(cattle_id)
+            if row is None:
+                if len(self.index) >= self.max_animals or cattle_id is None:
+                    rows[i] = -1
+                    continue
+                row = len(self.index)
+                if row == self.capacity:
+                    self._allocate(min(self.capacity * 2, self.max_animals), self.state)
+                self.index[cattle_id] = row
+            rows[i] = row
+        return rows
+
+    # --- Updates ---
+    def update_many(self, records, now=None):
+        """
+        Feeds reading dicts (in arrival order) and returns their (n, len(feature_names)) features.
+        Readings without a 'timestamp' are stamped with `now` (default: the current time).
+        """
+        now = time.time() if now is None else now
+        cattle_ids = [data.get('cattle_id') if isinstance(data.get('cattle_id'), (str, int, float)) else None for data in records]
+        timestamps = np.array([reading_time(data, now) for data in records], dtype=np.float64)
+        values = np.array([[to_float(data.get(signal)) for signal in self.signals] for data in records], dtype=np.float64).reshape(len(records), len(self.signals))
+        return self.update_arrays(cattle_ids, timestamps, values)
+
+    def update_arrays(self, cattle_ids, timestamps, values):
+        """Same as update_many() over parallel arrays (ids, epoch seconds, (n, signals) values)."""
+        features = np.full((len(cattle_ids), len(self.feature_names)), np.nan)
+        with self._lock:
+            rows = self._rows(cattle_ids)
+            # An animal seen k times in this batch is applied in k passes, each vectorised over distinct animals
+            occurrence = np.zeros(len(rows), dtype=np.intp)
+            seen = {}
+            for i, row in enumerate(rows):
+                if row >= 0:
+                    occurrence[i] = seen.get(row, 0)
+                    seen[row] = occurrence[i] + 1
+            for level in range(max(seen.values(), default=0)):
+                selected = np.flatnonzero((occurrence == level) & (rows >= 0))
+                features[selected] = self._update(rows[selected], timestamps[selected], values[selected])
+        return features
+
+    def _update(self, rows, timestamps, values):
+        state = self.state
+        count = state['count'][rows]
+        first = count == 0
+        state['t0'][rows[first]] = timestamps[first]
+
+        # Missing values carry the EWMA forward (0.0 before the first valid reading)
+        missing = np.isnan(values)
+        if missing.any():
+            values = np.where(missing, np.where(first[:, None], 0.0, state['ewma'][rows]), values)
+
+        hours = (timestamps - state['t0'][rows]) / 3600.0
+        position = count % self.depth
+        for w in self.windows:
+            # The reading leaving this window was written w updates ago (read before it is overwritten)
+            leaving = count >= w
+            old_position = (count - w) % self.depth
+            old_y = np.where(leaving[:, None], state['values'][rows, old_position], 0.0)
+            old_t = np.where(leaving, state['times'][rows, old_position], 0.0)
+            state[f'sum_y_{w}'][rows] += values - old_y
+            state[f'sum_yy_{w}'][rows] += values * values - old_y * old_y
+            state[f'sum_ty_{w}'][rows] += hours[:, None] * values - old_t[:, None] * old_y
+            state[f'sum_t_{w}'][rows] += hours - old_t
+            state[f'sum_tt_{w}'][rows] += hours * hours - old_t * old_t
+        state['values'][rows, position] = values
+        state['times'][rows, position] = hours
+        count = count + 1
+        state['count'][rows] = count
+
+        stale = count % (self.depth * REFRESH_EVERY_WINDOWS) == 0
+        if stale.any():
+            self._refresh(rows[stale])
+
+        # Baseline deviation is measured against the baseline *before* this reading joins it
+        base_mean, base_var = state['base_mean'][rows], state['base_var'][rows]
+        base_std = np.sqrt(base_var)
+        baseline_z = np.divide(values - base_mean, base_std, out=np.zeros_like(values), where=base_std > 0)
+        diff = values - base_mean
+        increment = self.beta * diff
+        state['base_mean'][rows] = np.where(first[:, None], values, base_mean + increment)
+        state['base_var'][rows] = np.where(first[:, None], 0.0, (1.0 - self.beta) * (base_var + diff * increment))
+        ewma = np.where(first[:, None], values, state['ewma'][rows] + self.alpha * (values - state['ewma'][rows]))
+        state['ewma'][rows] = ewma
+
+        columns = []
+        for s in range(len(self.signals)):
+            columns.append(ewma[:, s])
+            for w in self.windows:
+                n = np.minimum(count, w).astype(np.float64)
+                sum_y, sum_t = state[f'sum_y_{w}'][rows, s], state[f'sum_t_{w}'][rows]
+                mean = sum_y / n
+                variance = np.maximum(state[f'sum_yy_{w}'][rows, s] / n - mean * mean, 0.0)
+                denominator = n * state[f'sum_tt_{w}'][rows] - sum_t * sum_t
+                numerator = n * state[f'sum_ty_{w}'][rows, s] - sum_t * sum_y
+                slope = np.divide(numerator, denominator, out=np.zeros_like(mean), where=denominator > 1e-12 * np.maximum(n * state[f'sum_tt_{w}'][rows], 1.0))
+                columns += [mean, np.sqrt(variance), slope]
+            columns.append(baseline_z[:, s])
+        return np.column_stack(columns)
+
+    def _refresh(self, rows):
+        """Recomputes the running sums of `rows` exactly from their ring buffers."""
+        state = self.state
+        count = state['count'][rows]
+        for w in self.windows:
+            lag = np.arange(w)
+            positions = (count[:, None] - 1 - lag[None, :]) % self.depth
+            present = lag[None, :] < np.minimum(count, w)[:, None]
+            y = np.where(present[:, :, None], state['values'][rows[:, None], positions], 0.0)
+            t = np.where(present, state['times'][rows[:, None], positions], 0.0)
+            state[f'sum_y_{w}'][rows] = y.sum(axis=1)
+            state[f'sum_yy_{w}'][rows] = (y * y).sum(axis=1)
+            state[f'sum_ty_{w}'][rows] = (t[:, :, None] * y).sum(axis=1)
+            state[f'sum_t_{w}'][rows] = t.sum(axis=1)
+            state[f'sum_tt_{w}'][rows] = (t * t).sum(axis=1)
+
+    # --- Output ---
+    def as_dicts(self, features, digits=6):
+        """Feature rows as JSON-ready dicts (NaN -> None)."""
+        names = self.feature_names
+        return [
+            {name: (None if value != value else round(value, digits)) for name, value in zip(names, row)}
+            for row in features.tolist()
+        ]
+
+    def stats(self):
+        return {
+            "animals": len(self.index),
+            "max_animals": self.max_animals,
+            "signals": self.signals,
+            "windows": self.windows,
+            "features": len(self.feature_names),
+        }
+
+
+def temporal_feature_frame(df, engine=None, id_column='cattle_id', time_column='timestamp'):
+    """
+    Training-side replay: feeds a DataFrame of readings through a TemporalFeatureEngine in
+    time order and returns the features as a DataFrame aligned with df's index, so the model
+    is trained on exactly the values the API computes while serving.
+    """
+    import pandas as pd
+
+    engine = engine or TemporalFeatureEngine()
+    times = pd.to_datetime(df[time_column])
+    order = np.argsort(times.to_numpy(), kind='stable')
+    ordered = df.iloc[order]
+    timestamps = (times.iloc[order] - pd.Timestamp(0, tz=times.dt.tz)) / pd.Timedelta(seconds=1)
+    values = ordered[engine.signals].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    features = engine.update_arrays(ordered[id_column].tolist(), timestamps.to_numpy(dtype=np.float64), values)
+    return pd.DataFrame(features, index=ordered.index, columns=engine.feature_names).reindex(df.index)
@@ -0,0 +1,62 @@
+# test_animal_state.py
+# Per-animal reuse of the last prediction, and which results rewrite an animal's
+# latest state: history rows are appended for every result either way.
+
+from animal_state import AnimalStateTable
+from reference import make_readings
+
+
+class RecordingBackend:
+    def __init__(self):
+        self.calls = []
+
+    def save_predictions(self, user_id, results, latest=None):
+        self.calls.append((user_id, list(results), latest))
+
+
+def result(cattle_id, status='Healthy', risk='Low', alerts=()):
+    return {'cattle_id': cattle_id, 'timestamp': '2026-01-01 08:00:00',
+            'monitoring_results': {'health_status': status, 'risk_level': risk, 'confidence': '90.00%'},
+            'alerts': [{'rule_triggered': name} for name in alerts]}
+
+
+def test_latest_changes_flags_only_changed_results():
+    state = AnimalStateTable(heartbeat_seconds=60)
+    assert state.latest_changes('u', [result('A'), result('B')], now=0.0) == [True, True]
+    assert state.latest_changes('u', [result('A'), result('B', risk='High')], now=1.0) == [False, True]
+    assert state.latest_changes('u', [result('A', alerts=['GI_Feces'])], now=2.0) == [True]
+    assert state.latest_changes('other', [result('A', alerts=['GI_Feces'])], now=3.0) == [True]
+    # (a quiet animal is rewritten once per heartbeat)
+    assert state.latest_changes('other', [result('A', alerts=['GI_Feces'])], now=70.0) == [True]
+    stats = state.stats()
+    assert stats['writes'] == 6 and stats['skipped_writes'] == 1
+
+
+def test_unchanged_results_still_reach_the_backend(flask_app, monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(flask_app, 'storage_backend', backend)
+    monkeypatch.setattr(flask_app, 'animal_state', AnimalStateTable())
+    monkeypatch.setattr(flask_app, 'prediction_cache', None)
+    monkeypatch.setattr(flask_app, 'WRITE_ON_CHANGE', True)
+    readings = make_readings(20)
+    for _ in range(3):
+        flask_app.save_predictions(flask_app.score_valid_records([dict(data) for data in readings]), 'u')
+
+    assert [len(results) for _, results, _ in backend.calls] == [20, 20, 20]
+    assert [latest.count(True) for _, _, latest in backend.calls] == [20, 0, 0]
+
+
+def test_reused_outputs_match_a_fresh_score(flask_app, monkeypatch):
+    monkeypatch.setattr(flask_app, 'prediction_cache', None)
+    readings = make_readings(50)
+
+    def scrub(results):
+        return [{key: value for key, value in r.items() if key != 'timestamp'} for r in results]
+
+    monkeypatch.setattr(flask_app, 'animal_state', None)
+    expected = scrub(flask_app.score_valid_records([dict(data) for data in readings]))
+    monkeypatch.setattr(flask_app, 'animal_state', AnimalStateTable())
+    flask_app.score_valid_records([dict(data) for data in readings])
+    assert scrub(flask_app.score_valid_records([dict(data) for data in readings])) == expected
+    assert scrub([flask_app.score_reading(dict(data)) for data in readings]) == expected
+    assert flask_app.animal_state.stats()['reused'] == 2 * len(readings)
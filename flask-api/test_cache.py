@@ -0,0 +1,112 @@
+# test_cache.py
+# PredictionCache keys, expiry and invalidation, and the app answering a cache hit
+# exactly as it answers a fresh score.
+
+import pytest
+
+import cache
+from cache import PredictionCache, parse_rounding
+from reference import make_readings
+
+FIELDS = ['body_temperature', 'heart_rate', 'walking_capacity', 'breed_type']
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_readings_quantize_into_buckets():
+    prediction_cache = PredictionCache(FIELDS, rounding=parse_rounding("body_temperature:1,walking_capacity:-2"))
+    reading = {'body_temperature': 38.64, 'heart_rate': 70, 'walking_capacity': 9840, 'breed_type': 'Jersey'}
+    key = prediction_cache.key(reading)
+    assert key == (38.6, 70, 9800, 'Jersey')
+    assert prediction_cache.key(dict(reading, body_temperature=38.61, walking_capacity=9751)) == key
+    assert prediction_cache.key(dict(reading, body_temperature=38.66)) != key
+    assert prediction_cache.key(dict(reading, walking_capacity=9851)) != key
+    # (unrounded fields match exactly; 70 and 70.0 are the same model input)
+    assert prediction_cache.key(dict(reading, heart_rate=70.0)) == key
+    assert prediction_cache.key(dict(reading, heart_rate=71)) != key
+    assert prediction_cache.key({name: value for name, value in reading.items() if name != 'heart_rate'}) is None
+    assert prediction_cache.key(dict(reading, breed_type=['Jersey'])) is None
+
+
+def test_bad_rounding_specs_are_rejected():
+    with pytest.raises(ValueError, match="feature:digits"):
+        parse_rounding("body_temperature")
+    with pytest.raises(ValueError, match="unknown feature"):
+        PredictionCache(FIELDS, rounding={'hoof_angle': 1})
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    prediction_cache = PredictionCache(FIELDS, ttl_seconds=60)
+    prediction_cache.put(('k',), 'output')
+    clock.now += 59
+    assert prediction_cache.get(('k',)) == 'output'
+    clock.now += 2
+    assert prediction_cache.get(('k',)) is None
+    stats = prediction_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['entries']) == (1, 1, 1, 0)
+
+
+def test_least_recently_used_entry_is_evicted():
+    prediction_cache = PredictionCache(FIELDS, max_entries=2)
+    prediction_cache.put(('a',), 1)
+    prediction_cache.put(('b',), 2)
+    prediction_cache.get(('a',))
+    prediction_cache.put(('c',), 3)
+    assert [prediction_cache.get(key) for key in (('a',), ('b',), ('c',))] == [1, None, 3]
+    assert prediction_cache.stats()['evictions'] == 1
+
+
+def test_clear_drops_entries_and_late_results():
+    prediction_cache = PredictionCache(FIELDS)
+    prediction_cache.put(('a',), 1)
+    generation = prediction_cache.generation
+    prediction_cache.clear()
+    # (a result computed by the previous model, stored after the clear)
+    prediction_cache.put(('b',), 2, generation)
+    assert prediction_cache.get(('a',)) is None and prediction_cache.get(('b',)) is None
+    prediction_cache.put(('b',), 2, prediction_cache.generation)
+    assert prediction_cache.get(('b',)) == 2
+
+
+def scrub(results):
+    return [{key: value for key, value in result.items() if key != 'timestamp'} for result in results]
+
+
+def test_cache_hits_match_fresh_scores(flask_app, monkeypatch):
+    herd = make_readings(100)
+    resent = [dict(herd[i % len(herd)], cattle_id=f'RESEND{i:04d}') for i in range(300)]
+    monkeypatch.setattr(flask_app, 'animal_state', None)
+    monkeypatch.setattr(flask_app, 'prediction_cache', None)
+    expected = scrub(flask_app.score_valid_records([dict(data) for data in resent]))
+
+    prediction_cache = PredictionCache(flask_app.required_input_features)
+    monkeypatch.setattr(flask_app, 'prediction_cache', prediction_cache)
+    # (lookups come before the forest pass, so a batch only hits entries stored by earlier calls)
+    assert scrub(flask_app.score_valid_records([dict(data) for data in resent])) == expected
+    assert scrub(flask_app.score_valid_records([dict(data) for data in resent])) == expected
+    assert prediction_cache.stats()['hits'] == 300
+    assert scrub([flask_app.score_reading(dict(data)) for data in resent]) == expected
+    assert prediction_cache.stats()['hits'] == 600
+
+
+def test_model_reload_invalidates_the_cache(flask_app, monkeypatch):
+    prediction_cache = PredictionCache(flask_app.required_input_features)
+    monkeypatch.setattr(flask_app, 'prediction_cache', prediction_cache)
+    monkeypatch.setattr(flask_app, 'animal_state', None)
+    readings = make_readings(20)
+    expected = scrub(flask_app.score_valid_records([dict(data) for data in readings]))
+    assert prediction_cache.stats()['entries'] == 20
+
+    assert flask_app.reload_model()
+    stats = prediction_cache.stats()
+    assert (stats['entries'], stats['invalidations'], stats['generation']) == (0, 1, 1)
+    assert scrub(flask_app.score_valid_records([dict(data) for data in readings])) == expected
+    assert prediction_cache.stats()['misses'] == 40
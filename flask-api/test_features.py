@@ -0,0 +1,52 @@
+# test_features.py
+# The shared feature pipeline must reproduce the recorded golden vectors and the
+# matrix the model was originally trained on, bit for bit.
+
+import copy
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from reference import le_breed, le_faecal, legacy_preprocess, legacy_training_features, scaler, training_features_for_model
+from features import DEFAULT_GOLDEN_VECTORS_PATH, GOLDEN_READINGS, NUMERIC_INPUT_FEATURES, FeatureBuilder, check_golden_vectors
+
+DATASET_PATH = os.path.join('..', 'cattle_dataset.xlsx')
+
+
+@pytest.fixture(scope='module')
+def builder():
+    return FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+
+
+@pytest.fixture(scope='module')
+def golden():
+    with open(DEFAULT_GOLDEN_VECTORS_PATH) as f:
+        return json.load(f)
+
+
+def test_golden_vectors_replay_exactly(builder, golden):
+    assert golden['readings'] == GOLDEN_READINGS, "golden_vectors.json was recorded from different golden readings"
+    check_golden_vectors(builder, golden)
+
+
+def test_golden_vectors_match_the_pandas_reference(golden):
+    # (the pandas path cannot engineer numeric strings, so only well-formed readings are compared)
+    well_formed = [i for i, data in enumerate(golden['readings']) if all(isinstance(data.get(name), (int, float)) for name in NUMERIC_INPUT_FEATURES)]
+    assert well_formed
+    expected = np.vstack([legacy_preprocess(golden['readings'][i]) for i in well_formed])
+    assert expected.tobytes() == np.array(golden['scaled'])[well_formed].tobytes()
+
+
+def test_changed_golden_vector_is_reported(builder, golden):
+    tampered = copy.deepcopy(golden)
+    tampered['features'][0][0] += 1e-9
+    with pytest.raises(ValueError, match="Golden vector mismatch"):
+        check_golden_vectors(builder, tampered)
+
+
+def test_training_matrix_matches_the_original_engineering(builder):
+    df = pd.read_excel(DATASET_PATH)
+    assert legacy_training_features(df).tobytes() == builder.build_scaled_matrix(df.to_dict('records')).tobytes()
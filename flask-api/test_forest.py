@@ -0,0 +1,86 @@
+# test_forest.py
+# FlatForest (scaler folded into the thresholds) must give exactly
+# RandomForestClassifier.predict_proba on the scaled rows, on every path.
+
+import numpy as np
+import pytest
+
+from features import FeatureBuilder
+from inference import FOREST_ARRAYS, FlatForest, flatten_forest, load_serving_bundle, save_serving_bundle
+from reference import le_breed, le_faecal, le_health, make_readings, model, scaler, training_features_for_model
+
+
+@pytest.fixture(scope='module')
+def forest():
+    return FlatForest.from_sklearn(model, scaler)
+
+
+@pytest.fixture(scope='module')
+def raw_rows(forest):
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+    X_raw = builder.build_matrix(make_readings(1000))
+    # Rows sitting exactly on, just above and just below every folded split threshold
+    split = np.isfinite(forest.threshold)
+    edge_rows = np.repeat(X_raw[:1], 3 * split.sum(), axis=0)
+    for k, (feature, threshold) in enumerate(zip(forest.feature[split], forest.threshold[split])):
+        edge_rows[3 * k, feature] = threshold
+        edge_rows[3 * k + 1, feature] = np.nextafter(threshold, np.inf)
+        edge_rows[3 * k + 2, feature] = np.nextafter(threshold, -np.inf)
+    return np.vstack([X_raw, edge_rows])
+
+
+@pytest.fixture(scope='module')
+def expected(raw_rows):
+    return model.predict_proba(scaler.transform(raw_rows))
+
+
+def test_batch_matches_sklearn(forest, raw_rows, expected):
+    assert forest.predict_proba(raw_rows).tobytes() == expected.tobytes()
+
+
+def test_single_rows_match_sklearn(forest, raw_rows, expected):
+    single = np.vstack([forest.predict_proba(raw_rows[i:i + 1]) for i in range(len(raw_rows))])
+    assert single.tobytes() == expected.tobytes()
+
+
+def test_legacy_layout_is_renumbered(raw_rows, expected):
+    # Exports from before leaves were numbered last, with int32 index arrays
+    arrays = flatten_forest(model, scaler)
+    order = np.arange(len(arrays['feature']))[::-1]
+    new_id = np.empty(len(order), dtype=np.int32)
+    new_id[order] = np.arange(len(order))
+    legacy = dict(arrays, feature=arrays['feature'][order].astype(np.int32), threshold=arrays['threshold'][order],
+                  left=new_id[arrays['left'][order]], right=new_id[arrays['right'][order]], value=arrays['value'][order],
+                  roots=new_id[arrays['roots']])
+    assert not np.isfinite(legacy['threshold'][0])
+    assert FlatForest(**legacy).predict_proba(raw_rows).tobytes() == expected.tobytes()
+
+
+def test_serving_bundle_round_trip(tmp_path, raw_rows, expected):
+    path = str(tmp_path / 'serving_bundle.joblib')
+    save_serving_bundle(path, model, scaler, le_health, le_breed, le_faecal, training_features_for_model)
+    bundle = load_serving_bundle(path)
+    forest = bundle['forest']
+    assert forest.predict_proba(raw_rows).tobytes() == expected.tobytes()
+    # (index arrays are views of the mapped file, not private copies)
+    assert not forest.left.flags.owndata and not forest.feature.flags.owndata
+    assert bundle['feature_names'] == list(training_features_for_model)
+    assert list(bundle['le_health'].inverse_transform([0, 1])) == list(le_health.inverse_transform([0, 1]))
+    assert np.array_equal(bundle['scaler'].transform(raw_rows[:10].copy()), scaler.transform(raw_rows[:10]))
+
+
+def test_serving_bundle_self_check_rejects_a_different_forest(tmp_path):
+    import joblib
+
+    path = str(tmp_path / 'serving_bundle.joblib')
+    save_serving_bundle(path, model, scaler, le_health, le_breed, le_faecal, training_features_for_model)
+    bundle = joblib.load(path)
+    bundle['threshold'] = np.where(np.isfinite(bundle['threshold']), bundle['threshold'] + 1.0, bundle['threshold'])
+    joblib.dump(bundle, path)
+    with pytest.raises(ValueError, match="self-check"):
+        load_serving_bundle(path)
+
+
+def test_shipped_forest_matches_the_model(raw_rows, expected):
+    assert set(FOREST_ARRAYS) <= set(np.load('forest.npz').files)
+    assert FlatForest.load('forest.npz').predict_proba(raw_rows).tobytes() == expected.tobytes()
@@ -0,0 +1,33 @@
+# test_inference.py
+# The fused HealthPredictor call must give exactly what the original
+# predict() + predict_proba() + per-class inverse_transform gave.
+
+import numpy as np
+
+from reference import le_breed, le_faecal, le_health, legacy_inference, make_readings, model, scaler, training_features_for_model
+from features import FeatureBuilder
+from inference import HealthPredictor
+
+
+def test_predict_one_matches_legacy_inference():
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+    predictor = HealthPredictor(model, le_health)
+    for data in make_readings(300):
+        X_row = builder.build_scaled_row(data)
+        expected_label, expected_probabilities, expected_dict = legacy_inference(X_row)
+        label, probabilities = predictor.predict_one(X_row)
+        assert label == expected_label
+        assert probabilities.tobytes() == expected_probabilities.tobytes()
+        # (the response rounds every class in one numpy call, as score_reading does)
+        assert dict(zip(predictor.class_names, np.multiply(probabilities, 100).round(2).tolist())) == expected_dict
+
+
+def test_batch_predict_matches_predict_one():
+    builder = FeatureBuilder(training_features_for_model, le_breed, le_faecal, scaler)
+    predictor = HealthPredictor(model, le_health)
+    X = builder.build_scaled_matrix(make_readings(300, seed=7))
+    labels, probabilities = predictor.predict(X)
+    for i in range(len(X)):
+        label, row = predictor.predict_one(X[i:i + 1])
+        assert labels[i] == label
+        assert np.array_equal(probabilities[i], row)
@@ -0,0 +1,188 @@
+# test_rules.py
+# The compiled RuleEngine must give exactly what the original if-chain gave, one
+# reading at a time and column-wise, and a reading the rules cannot compare must
+# come back as an error entry rather than fail its request. Rule files are validated
+# before they are compiled, and a broken edit keeps the previous rules serving.
+
+import json
+import os
+
+import pytest
+
+from features import FeatureBuilder
+from reference import le_breed, le_faecal, legacy_rule_alerts, make_readings, training_features_for_model
+from rules import RuleBook, RuleEngine, validate_rule_config
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return RuleEngine.from_file()
+
+
+@pytest.fixture(scope='module')
+def readings():
+    readings = make_readings(3000)
+    # The synthetic readings alert on most rows; in a typical herd only a few animals are off-range
+    return readings + [dict(data, walking_capacity=max(data['walking_capacity'], 9500), milk_production=max(data['milk_production'], 8.5),
+                            faecal_consistency='ideal') for data in make_readings(2000, seed=3)]
+
+
+def test_evaluate_matches_the_if_chain(engine, readings):
+    assert [engine.evaluate(data) for data in readings] == [legacy_rule_alerts(data) for data in readings]
+
+
+def test_evaluate_many_matches_the_if_chain(engine, readings):
+    expected = [legacy_rule_alerts(data) for data in readings]
+    assert engine.evaluate_many(readings) == expected
+    # (the numeric columns /predict/batch already pulled out while featurizing)
+    raw_columns = {}
+    FeatureBuilder(training_features_for_model, le_breed, le_faecal).build_matrix(readings, raw_columns=raw_columns)
+    assert engine.evaluate_many(readings, raw_columns) == expected
+
+
+def test_mixed_types_fall_back_to_evaluate(engine):
+    readings = make_readings(4)
+    odd = [dict(readings[0], heart_rate='85', body_condition_score=4, body_temperature=38.0),
+           dict(readings[1], body_temperature=38.2, respiratory_rate=None),
+           dict(readings[2], milk_production=True, faecal_consistency='Watery'),
+           dict(readings[3], walking_capacity=2 ** 70)]
+    batch = readings + odd
+    assert engine.evaluate_many(batch) == [legacy_rule_alerts(data) for data in batch]
+
+
+def test_uncomparable_value_is_returned_in_its_slot(engine):
+    readings = make_readings(3)
+    # (the heart-rate test only runs when the body condition score is low)
+    bad = dict(readings[1], body_condition_score=2, heart_rate='abc')
+    with pytest.raises(TypeError):
+        legacy_rule_alerts(bad)
+    with pytest.raises(ValueError, match="Rules could not evaluate the reading"):
+        engine.evaluate(bad)
+    results = engine.evaluate_many([readings[0], bad, readings[2]])
+    assert isinstance(results[1], ValueError)
+    assert [results[0], results[2]] == [legacy_rule_alerts(readings[0]), legacy_rule_alerts(readings[2])]
+
+
+def test_batch_row_the_rules_cannot_evaluate_gets_an_error_entry(flask_app, monkeypatch):
+    monkeypatch.setattr(flask_app, 'INPUT_VALIDATION', 'off')
+    client = flask_app.app.test_client()
+    readings = make_readings(3)
+    readings[1].update(body_condition_score=2, heart_rate='abc')
+    response = client.post('/predict/batch', json=readings)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['scored'] == 2
+    assert body['results'][1]['index'] == 1
+    assert body['results'][1]['error'].startswith("Rules could not evaluate the reading")
+    assert 'monitoring_results' in body['results'][0] and 'monitoring_results' in body['results'][2]
+
+    response = client.post('/predict', json=readings[1])
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith("Rules could not evaluate the reading")
+
+
+def test_batch_row_with_text_heart_rate_is_rejected_by_default(flask_app):
+    readings = make_readings(2)
+    readings[0]['heart_rate'] = 'abc'
+    response = flask_app.app.test_client().post('/predict/batch', json=readings)
+    assert response.status_code == 200
+    result = response.get_json()['results'][0]
+    assert result['error'] == "Invalid input values"
+    assert result['invalid'] == [{'field': 'heart_rate', 'value': 'abc', 'error': 'not a number'}]
+
+
+# --- Rule file: validation, compiled evaluator and hot reload ---
+def write_rules(path, config):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    # (a distinct mtime even on file systems with coarse timestamps)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9 * (1 + write_rules.edits)))
+    write_rules.edits += 1
+
+
+write_rules.edits = 0
+
+
+def udder_rules(threshold, version=1):
+    return {'version': version, 'rules': [{
+        'disease': 'Udder Health Issue',
+        'conditions': [{'field': 'milk_production', 'op': '<', 'value': threshold}],
+        'alerts': [{'symptom': 'milk_production', 'message': "Low milk ({value} L/day)", 'severity': 'Medium', 'rule_triggered': 'Udder_MilkProd'}],
+    }]}
+
+
+@pytest.mark.parametrize('change, error', [
+    (lambda rule: rule['conditions'][0].update(op='=='), "unknown op"),
+    (lambda rule: rule['conditions'][0].update(op='< 0 or __import__("os") or 1 <'), "unknown op"),
+    (lambda rule: rule['conditions'][0].update(value='8; import os'), "needs a numeric value"),
+    (lambda rule: rule['conditions'][0].update(value=True), "needs a numeric value"),
+    (lambda rule: rule['conditions'][0].update(op='in', value='watery'), "needs a list of strings"),
+    (lambda rule: rule['conditions'][0].update(field=['milk_production']), "condition without a 'field'"),
+    (lambda rule: rule.update(conditions=[]), "at least one condition"),
+    (lambda rule: rule.update(conditions='milk_production < 8'), "must be lists of objects"),
+    (lambda rule: rule.update(alerts=['Low milk']), "must be lists of objects"),
+    (lambda rule: rule.pop('disease'), "needs a 'disease' name"),
+    (lambda rule: rule['alerts'][0].pop('severity'), "alert missing severity"),
+    (lambda rule: rule['alerts'][0].update(message="Low milk ({value.__class__})"), "only {value} can be filled in"),
+    (lambda rule: rule['alerts'][0].update(message="Low milk ({value[0]})"), "only {value} can be filled in"),
+    (lambda rule: rule['alerts'][0].update(message="Low milk ({amount})"), "bad message template"),
+])
+def test_bad_rule_specs_are_rejected(change, error):
+    config = udder_rules(8.0)
+    change(config['rules'][0])
+    with pytest.raises(ValueError, match=error):
+        validate_rule_config(config)
+
+
+def test_field_names_are_data_not_code():
+    # Field names are bound into the generated function, never pasted into its source
+    field = "x') or __import__('os').getpid() or ('"
+    config = udder_rules(8.0)
+    config['rules'][0]['conditions'][0]['field'] = field
+    config['rules'][0]['alerts'][0]['symptom'] = field
+    validate_rule_config(config)
+    engine = RuleEngine(config)
+    assert engine.evaluate({field: 5.0}) == (['Udder Health Issue'], [
+        {'symptom': field, 'value': 5.0, 'message': "Low milk (5.0 L/day)", 'severity': 'Medium', 'rule_triggered': 'Udder_MilkProd'}], 1)
+    assert engine.evaluate({field: 9.0, 'milk_production': 5.0}) == ([], [], 0)
+
+
+def test_edited_rule_file_changes_the_alerts(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_rules(path, udder_rules(8.0))
+    book = RuleBook(path, check_interval=0)
+    reading = {'milk_production': 10.0}
+    assert book.current().evaluate(reading) == ([], [], 0)
+
+    write_rules(path, udder_rules(12.0, version=2))
+    engine = book.current()
+    assert engine.version == 2
+    assert engine.evaluate(reading)[0] == ['Udder Health Issue']
+    assert engine.evaluate_many([reading, {'milk_production': 13.0}])[0][0] == ['Udder Health Issue']
+    assert book.stats()['reloads'] == 2 and book.stats()['last_error'] is None
+
+
+@pytest.mark.parametrize('broken', ['{"version": 3, "rules": [', json.dumps(dict(udder_rules(1.0, version=3), severity_order=[]))])
+def test_broken_rule_file_keeps_the_previous_rules(tmp_path, broken):
+    path = str(tmp_path / 'rules.json')
+    write_rules(path, udder_rules(12.0))
+    book = RuleBook(path, check_interval=0)
+    engine = book.current()
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(broken)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert book.current() is engine
+    assert not book.reload()
+    assert book.current() is engine
+    assert book.current().evaluate({'milk_production': 10.0})[0] == ['Udder Health Issue']
+    assert book.stats()['version'] == 1 and book.stats()['last_error']
+
+
+def test_broken_rule_file_fails_the_first_load(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{}')
+    with pytest.raises(ValueError, match="'rules' list"):
+        RuleBook(path)
@@ -0,0 +1,134 @@
+# test_schema.py
+# The compiled input schema: which readings it flags, how it normalizes them, and
+# what each INPUT_VALIDATION mode answers on /predict, /predict/batch and /predict/stream.
+
+import json
+
+import pandas as pd
+import pytest
+
+from reference import make_readings
+from schema import InputSchema
+
+REQUIRED_INPUT_FEATURES = [
+    'body_temperature', 'breed_type', 'milk_production', 'respiratory_rate', 'walking_capacity', 'sleeping_duration',
+    'body_condition_score', 'heart_rate', 'eating_duration', 'lying_down_duration', 'ruminating', 'rumen_fill', 'faecal_consistency'
+]
+
+
+@pytest.fixture(scope='module')
+def schema():
+    return InputSchema(REQUIRED_INPUT_FEATURES)
+
+
+def odd_readings():
+    readings = make_readings(7, seed=5)
+    return [dict(readings[0], heart_rate='85'), dict(readings[1], body_temperature='n/a'), dict(readings[2], rumen_fill=9),
+            dict(readings[3], milk_production=True), dict(readings[4], walking_capacity=2 ** 70), dict(readings[5], breed_type=None),
+            {name: value for name, value in readings[6].items() if name != 'heart_rate'}]
+
+
+def test_valid_readings_pass(schema):
+    assert all(schema.validate(data) == (None, None) for data in make_readings(2000))
+
+
+def test_every_dataset_row_passes(schema):
+    rows = json.loads(pd.read_excel('../cattle_dataset.xlsx').to_json(orient='records'))
+    assert len(rows) == 178
+    assert schema.validate_many(rows) == {}
+
+
+def test_batch_and_single_validation_agree(schema):
+    sample = make_readings(200) + odd_readings()
+    one_by_one = {}
+    for i, data in enumerate(sample):
+        missing, problems = schema.validate(dict(data))
+        if missing or problems:
+            one_by_one[i] = (missing, problems)
+    assert schema.validate_many([dict(data) for data in sample]) == one_by_one
+    assert sorted(one_by_one) == list(range(201, 207))
+
+
+def test_problems_are_reported_per_field(schema):
+    readings = odd_readings()
+    assert schema.validate(readings[1])[1] == [{'field': 'body_temperature', 'value': 'n/a', 'error': 'not a number'}]
+    assert schema.validate(readings[2])[1] == [{'field': 'rumen_fill', 'value': 9, 'error': 'out of range', 'range': [1.0, 5.0]}]
+    assert schema.validate(readings[3])[1][0]['error'] == 'not a number'
+    assert schema.validate(readings[4])[1] == [
+        {'field': 'walking_capacity', 'value': str(2 ** 70), 'error': 'out of range', 'range': [0.0, 100000.0]}]
+    assert schema.validate(readings[5])[1] == [{'field': 'breed_type', 'value': None, 'error': 'not a non-empty string'}]
+    assert schema.validate(readings[6]) == (['heart_rate'], None)
+
+
+def test_numeric_strings_are_normalized(schema):
+    data = dict(make_readings(1)[0], heart_rate='85', body_temperature=' 38.5')
+    assert schema.validate(data) == (None, None)
+    assert data['heart_rate'] == 85.0 and data['body_temperature'] == 38.5
+
+
+def test_flag_mode_coerces_invalid_values(schema):
+    data = dict(make_readings(1)[0], heart_rate='abc', breed_type=7)
+    missing, problems = schema.validate(data, coerce_invalid=True)
+    assert missing is None and [problem['field'] for problem in problems] == ['heart_rate', 'breed_type']
+    assert data['heart_rate'] != data['heart_rate'] and data['breed_type'] == ''
+
+
+def test_ranges_can_be_overridden():
+    schema = InputSchema(REQUIRED_INPUT_FEATURES, {'heart_rate': (40.0, 120.0)})
+    assert schema.validate(dict(make_readings(1)[0], heart_rate=150))[1][0]['range'] == [40.0, 120.0]
+    with pytest.raises(ValueError, match="unknown fields"):
+        InputSchema(REQUIRED_INPUT_FEATURES, {'hoof_angle': (0.0, 90.0)})
+
+
+# --- INPUT_VALIDATION on the endpoints ---
+def test_predict_rejects_invalid_values_with_a_400(flask_app):
+    client = flask_app.app.test_client()
+    response = client.post('/predict', json=dict(make_readings(1)[0], body_temperature=60.0))
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid input values", "invalid": [
+        {'field': 'body_temperature', 'value': 60.0, 'error': 'out of range', 'range': [30.0, 50.0]}]}
+
+    response = client.post('/predict', json=dict(make_readings(1)[0], heart_rate='fast'))
+    assert response.status_code == 400
+    assert response.get_json()['invalid'] == [{'field': 'heart_rate', 'value': 'fast', 'error': 'not a number'}]
+
+
+def test_predict_accepts_numeric_strings(flask_app):
+    response = flask_app.app.test_client().post('/predict', json=dict(make_readings(1)[0], heart_rate='85'))
+    assert response.status_code == 200
+    assert response.get_json()['input_data_snapshot']['heart_rate'] == 85.0
+
+
+def test_batch_and_stream_get_error_entries(flask_app):
+    client = flask_app.app.test_client()
+    readings = make_readings(3)
+    readings[1]['rumen_fill'] = 9
+    body = client.post('/predict/batch', json=readings).get_json()
+    assert body['scored'] == 2
+    assert body['results'][1] == {"error": "Invalid input values", "index": 1,
+                                  "invalid": [{'field': 'rumen_fill', 'value': 9, 'error': 'out of range', 'range': [1.0, 5.0]}]}
+
+    lines = "".join(json.dumps(data) + "\n" for data in readings) + "not json\n"
+    response = client.post('/predict/stream', data=lines.encode(), content_type='application/x-ndjson')
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert 'monitoring_results' in results[0] and 'monitoring_results' in results[2]
+    assert results[1]['error'] == "Invalid input values" and results[1]['line'] == 2
+    assert results[1]['invalid'][0]['field'] == 'rumen_fill'
+    assert results[3]['error'].startswith("Invalid JSON on line 4") and results[3]['line'] == 4
+
+
+def test_flag_mode_scores_with_input_warnings(flask_app, monkeypatch):
+    monkeypatch.setattr(flask_app, 'INPUT_VALIDATION', 'flag')
+    client = flask_app.app.test_client()
+    response = client.post('/predict', json=dict(make_readings(1)[0], rumen_fill=9, breed_type=None))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [warning['field'] for warning in body['input_warnings']] == ['rumen_fill', 'breed_type']
+    assert body['input_data_snapshot']['breed_type'] == ''
+
+    readings = make_readings(2)
+    readings[0]['faecal_consistency'] = ['watery']
+    body = client.post('/predict/batch', json=readings).get_json()
+    assert body['scored'] == 2
+    assert body['results'][0]['input_warnings'] == [{'field': 'faecal_consistency', 'value': ['watery'], 'error': 'not a non-empty string'}]
+    assert body['results'][0]['input_data_snapshot']['faecal_consistency'] == ''
@@ -0,0 +1,118 @@
+# test_storage.py
+# WriteBehindQueue against the fake Firestore client from reference.py: every write lands
+# through commit failures and a full queue, and merge writes merge like Firestore's.
+# The backends append a history row for every result, changed or not, and an incomplete
+# backend fails when it is created.
+
+import datetime
+import os
+import sqlite3
+import time
+
+import pytest
+
+from reference import FakeFirestore, make_readings
+from storage import FirestoreBackend, SQLiteBackend, StorageBackend, WriteBehindQueue, history_collection_path
+
+COLLECTION_PATH = 'artifacts/test/users/test/cattle_data'
+
+
+def enqueue_readings(writer, n):
+    readings = make_readings(n)
+    for data in readings:
+        writer.enqueue(COLLECTION_PATH, data['cattle_id'], {'cattle_id': data['cattle_id'], 'reading': data})
+    return readings
+
+
+def test_writes_survive_commit_failures(tmp_path):
+    client = FakeFirestore(round_trip_seconds=0, fail_commits=3)
+    writer = WriteBehindQueue(client, backoff_seconds=0.01, spill_path=str(tmp_path / 'spill.jsonl')).start()
+    readings = enqueue_readings(writer, 2000)
+    writer.stop()
+    assert len(client.documents) == len(readings)
+    stats = writer.stats()
+    assert stats['commit_failures'] == 3
+    assert stats['written'] == len(readings) and stats['spilled'] == 0
+
+
+def test_full_queue_spills_and_replays(tmp_path):
+    client = FakeFirestore(round_trip_seconds=0.02)
+    writer = WriteBehindQueue(client, max_queue_size=100, spill_path=str(tmp_path / 'spill.jsonl')).start()
+    readings = enqueue_readings(writer, 2000)
+    assert writer.stats()['spilled'] > 0
+    # (the spill file is replayed once the worker has been idle for a moment)
+    deadline = time.monotonic() + 30
+    while len(client.documents) < len(readings) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    writer.stop()
+    assert len(client.documents) == len(readings)
+    assert writer.stats()['replayed'] == writer.stats()['spilled']
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_commits_that_keep_failing_are_spilled(tmp_path):
+    client = FakeFirestore(round_trip_seconds=0, fail_commits=1000)
+    writer = WriteBehindQueue(client, max_retries=2, backoff_seconds=0.001, spill_path=str(tmp_path / 'spill.jsonl')).start()
+    readings = enqueue_readings(writer, 50)
+    writer.stop()
+    assert not client.documents
+    with open(writer.spill_path, encoding='utf-8') as f:
+        assert sum(1 for _ in f) == len(readings)
+
+
+def test_merge_writes_merge_into_existing_documents(tmp_path):
+    client = FakeFirestore(round_trip_seconds=0)
+    writer = WriteBehindQueue(client, spill_path=str(tmp_path / 'spill.jsonl')).start()
+    writer.enqueue(COLLECTION_PATH, 'bucket', {'rows': {'t080000': [1]}, 'day': '2026-01-01'})
+    writer.flush()
+    writer.enqueue(COLLECTION_PATH, 'bucket', {'rows': {'t090000': [2]}}, merge=True)
+    writer.stop()
+    assert client.documents[f'{COLLECTION_PATH}/bucket'] == {'rows': {'t080000': [1], 't090000': [2]}, 'day': '2026-01-01'}
+
+
+def prediction_results(n, timestamp='2026-01-01 08:00:00'):
+    return [{'cattle_id': data['cattle_id'], 'timestamp': timestamp, 'input_data_snapshot': data,
+             'monitoring_results': {'health_status': 'Healthy', 'risk_level': 'Low', 'confidence': '90.00%'}, 'alerts': []}
+            for data in make_readings(n)]
+
+
+def test_firestore_backend_appends_history_for_unchanged_results(tmp_path):
+    client = FakeFirestore(round_trip_seconds=0)
+    backend = FirestoreBackend(client, 'app', spill_path=str(tmp_path / 'spill.jsonl'))
+    results = prediction_results(4)
+    backend.save_predictions('u', results)
+    changed = [dict(result, alerts=[{'rule_triggered': 'GI_Feces'}]) for result in results]
+    backend.save_predictions('u', changed, latest=[False, True, False, False])
+    backend.close()
+
+    latest = [client.documents[f"artifacts/app/users/u/cattle_data/{result['cattle_id']}"] for result in results]
+    assert [len(document['alerts']) for document in latest] == [0, 1, 0, 0]
+    for result in results:
+        bucket = client.documents[f"{history_collection_path('app', 'u', result['cattle_id'])}/2026-01-01T08"]
+        assert len(bucket['readings']) == 2
+    history = backend.query_history('u', results[0]['cattle_id'], datetime.date(2026, 1, 1), datetime.date(2026, 1, 1))
+    assert [reading['alert_count'] for reading in history] == [0, 1]
+
+
+def test_sqlite_backend_stores_every_reading(tmp_path):
+    backend = SQLiteBackend(path=str(tmp_path / 'telemetry.db'), rollover_days=0)
+    results = prediction_results(3)
+    backend.save_predictions('u', results)
+    backend.save_predictions('u', results, latest=[False, False, True])
+    backend.flush()
+    day = datetime.date(2026, 1, 1)
+    assert [len(backend.query_history('u', result['cattle_id'], day, day)) for result in results] == [2, 2, 2]
+    backend.close()
+    with sqlite3.connect(str(tmp_path / 'telemetry.db')) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM predictions WHERE result IS NULL").fetchone()[0] == 2
+
+
+def test_incomplete_backend_fails_when_created():
+    class WriteOnlyBackend(StorageBackend):
+        def save_predictions(self, user_id, results, latest=None):
+            pass
+
+    with pytest.raises(TypeError, match='query_history'):
+        WriteOnlyBackend()
+    with pytest.raises(TypeError):
+        StorageBackend()
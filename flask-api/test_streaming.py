@@ -0,0 +1,155 @@
+# test_streaming.py
+# /predict/stream must answer every NDJSON line exactly as /predict/batch answers the
+# same readings, in order, and give its stream slot back however the stream ends.
+# Micro-batched /predict must answer exactly as inline scoring does, and a reading whose
+# caller timed out is still scored.
+
+import concurrent.futures
+import io
+import json
+import queue
+import threading
+import time
+
+import pytest
+
+from reference import make_readings
+from streaming import InferenceBatcher, MicroBatcher, iter_ndjson
+
+
+def ndjson(readings):
+    return "".join(json.dumps(data) + "\n" for data in readings).encode()
+
+
+def without_timestamps(results):
+    return [{key: value for key, value in result.items() if key != 'timestamp'} for result in results]
+
+
+def test_micro_batcher_windows_keep_order():
+    windows = list(MicroBatcher(iter(range(1000)), max_batch_size=64, max_wait_seconds=1.0))
+    assert [item for window in windows for item in window] == list(range(1000))
+    assert max(len(window) for window in windows) == 64
+
+
+def test_iter_ndjson_numbers_lines_and_reports_bad_json():
+    items = list(iter_ndjson([b'{"a": 1}\n', b'\n', b'{"a": \n', b'{"a": 3}']))
+    assert [line_number for line_number, _ in items] == [1, 3, 4]
+    assert items[0][1] == {'a': 1} and items[2][1] == {'a': 3}
+    assert isinstance(items[1][1], ValueError) and str(items[1][1]).startswith("Invalid JSON on line 3")
+
+
+def test_stream_matches_batch(flask_app):
+    client = flask_app.app.test_client()
+    readings = make_readings(500)
+    batch = client.post('/predict/batch', json=readings).get_json()['results']
+    response = client.post('/predict/stream?max_batch=64', data=ndjson(readings), content_type='application/x-ndjson')
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    streamed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert without_timestamps(streamed) == without_timestamps(batch)
+
+
+def test_stream_reports_errors_by_line(flask_app):
+    client = flask_app.app.test_client()
+    readings = make_readings(3)
+    del readings[1]['heart_rate']
+    body = ndjson(readings[:2]) + b"\n[1, 2]\n" + ndjson(readings[2:])
+    results = [json.loads(line) for line in client.post('/predict/stream', data=body, content_type='application/x-ndjson').get_data(as_text=True).splitlines()]
+    assert [result.get('line') for result in results] == [None, 2, 4, None]
+    assert results[1] == {"error": "Missing features in input", "missing": ['heart_rate'], "line": 2}
+    assert results[2] == {"error": "Reading must be a JSON object", "line": 4}
+    assert 'monitoring_results' in results[3]
+
+
+def test_stream_slots_are_released(flask_app, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(flask_app, 'stream_slots', slots)
+    client = flask_app.app.test_client()
+    readings = make_readings(5)
+
+    response = client.post('/predict/stream', data=ndjson(readings), content_type='application/x-ndjson')
+    assert len(response.get_data().splitlines()) == 5
+    # (a client gone before reading anything: the server only closes the response)
+    response = client.post('/predict/stream', input_stream=io.BytesIO(ndjson(readings)), content_type='application/x-ndjson', buffered=False)
+    held = client.post('/predict/stream', data=ndjson(readings), content_type='application/x-ndjson')
+    assert held.status_code == 503 and held.headers['Retry-After'] == '1'
+    response.close()
+    assert slots.acquire(blocking=False)
+    slots.release()
+
+
+def gated_batcher(**kwargs):
+    """An InferenceBatcher whose scoring thread blocks inside score_batch until the gate opens."""
+    started, gate, scored = threading.Event(), threading.Event(), []
+
+    def score_batch(items):
+        started.set()
+        gate.wait(5)
+        scored.extend(items)
+        return [{'scored': item} for item in items]
+
+    return InferenceBatcher(score_batch, **kwargs), started, gate, scored
+
+
+def test_micro_batched_predict_matches_inline(flask_app, monkeypatch):
+    readings = make_readings(400)
+    clients = 8
+
+    def run(batcher):
+        monkeypatch.setattr(flask_app, 'inference_batcher', batcher)
+        outputs = [None] * len(readings)
+
+        def client(k):
+            test_client = flask_app.app.test_client()
+            for i in range(k, len(readings), clients):
+                outputs[i] = test_client.post('/predict', json=readings[i]).get_json()
+
+        threads = [threading.Thread(target=client, args=(k,)) for k in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return without_timestamps(outputs)
+
+    batcher = InferenceBatcher(flask_app.score_readings, max_batch_size=16, max_wait_seconds=0.005)
+    assert run(batcher) == run(None)
+    assert batcher.stats()['scored'] == len(readings)
+    assert batcher.stats()['batches'] < len(readings)
+
+
+def test_timed_out_reading_is_still_scored():
+    batcher, started, gate, scored = gated_batcher()
+    future = batcher.submit('late')
+    with pytest.raises(concurrent.futures.TimeoutError):
+        future.result(timeout=0.05)
+    gate.set()
+    assert future.result(timeout=5) == {'scored': 'late'}
+    assert scored == ['late']
+
+
+def test_submit_refuses_past_max_pending():
+    batcher, started, gate, scored = gated_batcher(max_batch_size=1, max_pending=1)
+    try:
+        first = batcher.submit(1)
+        assert started.wait(5)
+        second = batcher.submit(2)
+        with pytest.raises(queue.Full):
+            batcher.submit(3)
+    finally:
+        gate.set()
+    assert [first.result(timeout=5), second.result(timeout=5)] == [{'scored': 1}, {'scored': 2}]
+
+
+def test_predict_timeout_returns_503_and_scores_anyway(flask_app, monkeypatch):
+    batcher, started, gate, scored = gated_batcher()
+    monkeypatch.setattr(flask_app, 'inference_batcher', batcher)
+    monkeypatch.setattr(flask_app, 'INFERENCE_TIMEOUT_MS', 50)
+    reading = make_readings(1)[0]
+    try:
+        response = flask_app.app.test_client().post('/predict', json=reading)
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    finally:
+        gate.set()
+    deadline = time.monotonic() + 5
+    while batcher.stats()['scored'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scored == [reading]
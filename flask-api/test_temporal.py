@@ -0,0 +1,101 @@
+# test_temporal.py
+# The incremental TemporalFeatureEngine must give the same features as rebuilding them
+# from each animal's full history, whatever order readings arrive in, however many
+# animals it has to grow to hold, and on the training side (temporal_feature_frame).
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from reference import recompute_temporal_features
+from temporal import REFRESH_EVERY_WINDOWS, TemporalFeatureEngine, temporal_feature_frame
+
+SIGNALS = ['body_temperature', 'heart_rate']
+WINDOWS = (3, 6)
+
+
+def make_history(n_animals=7, per_animal=60, seed=3):
+    """Readings for several animals, interleaved, with some timestamps arriving out of order."""
+    rng = np.random.default_rng(seed)
+    readings = []
+    for step in range(per_animal):
+        for k in range(n_animals):
+            # Up to an hour of jitter on 10-minute spacing: consecutive readings are often out of order
+            t = 1.7e9 + 600.0 * step + rng.uniform(-3600.0, 3600.0) + k
+            readings.append({
+                'cattle_id': f'cow-{k}', 'timestamp': t,
+                'body_temperature': rng.normal(38.6, 0.4), 'heart_rate': rng.normal(65, 6),
+            })
+    return readings
+
+
+def expected_features(readings):
+    """The full-recompute reference for every reading, given everything its animal sent before it."""
+    histories, rows = {}, []
+    for data in readings:
+        history = histories.setdefault(data['cattle_id'], [])
+        history.append([data['timestamp']] + [data[signal] for signal in SIGNALS])
+        rows.append(recompute_temporal_features(history, SIGNALS, WINDOWS))
+    return np.array(rows)
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 64])
+def test_update_many_matches_full_recompute(batch_size):
+    readings = make_history()
+    # Enough readings per animal for the periodic exact refresh of the running sums to run
+    assert len(readings) // 7 > max(WINDOWS) * REFRESH_EVERY_WINDOWS
+    assert any(b['timestamp'] < a['timestamp'] for a, b in zip(readings, readings[7:]))
+    # Capacity 2 for 7 animals: the state arrays grow (and are copied) twice mid-stream
+    engine = TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS, initial_capacity=2)
+    features = np.vstack([engine.update_many(readings[i:i + batch_size]) for i in range(0, len(readings), batch_size)])
+    assert engine.capacity == 8 and engine.stats()['animals'] == 7
+    np.testing.assert_allclose(features, expected_features(readings), rtol=1e-6, atol=1e-6)
+
+
+def test_growth_keeps_existing_state():
+    readings = make_history(n_animals=20, per_animal=10)
+    grown = TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS, initial_capacity=1)
+    preallocated = TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS, initial_capacity=64)
+    assert np.array_equal(grown.update_many(readings), preallocated.update_many(readings))
+    assert grown.capacity == 32
+
+
+def test_animals_past_max_animals_get_nan():
+    engine = TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS, max_animals=3, initial_capacity=2)
+    features = engine.update_many(make_history(n_animals=5, per_animal=2))
+    tracked = [i % 5 < 3 for i in range(10)]
+    assert not np.isnan(features[tracked]).any()
+    assert np.isnan(features[np.logical_not(tracked)]).all()
+    assert engine.capacity == 3
+
+
+def test_update_many_accepts_iso_timestamps_and_carries_missing_values():
+    readings = make_history(n_animals=1, per_animal=4)
+    iso = [dict(data, timestamp=datetime.datetime.fromtimestamp(data['timestamp'], datetime.timezone.utc).isoformat()) for data in readings]
+    engine = TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS)
+    np.testing.assert_allclose(engine.update_many(iso), expected_features(readings), rtol=1e-6, atol=1e-6)
+
+    before = engine.state['ewma'][engine.index['cow-0']].copy()
+    gap = dict(readings[-1], timestamp=readings[-1]['timestamp'] + 600.0, heart_rate=None, body_temperature='n/a')
+    row = engine.update_many([gap])[0]
+    assert np.allclose(engine.state['ewma'][engine.index['cow-0']], before)
+    assert np.isfinite(row).all()
+
+
+def test_temporal_feature_frame_replays_in_time_order():
+    readings = make_history(n_animals=4, per_animal=30, seed=8)
+    df = pd.DataFrame(readings)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s', utc=True)
+    df = df.set_axis(range(100, 100 + len(df))).sample(frac=1.0, random_state=0)
+
+    frame = temporal_feature_frame(df, TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS))
+    assert frame.index.equals(df.index)
+    assert list(frame.columns) == TemporalFeatureEngine(signals=SIGNALS, windows=WINDOWS).feature_names
+
+    # The reference sees each animal's readings in time order, not in the frame's shuffled order
+    order = np.argsort([data['timestamp'] for data in readings], kind='stable')
+    expected = np.empty((len(readings), len(frame.columns)))
+    expected[order] = expected_features([readings[i] for i in order])
+    np.testing.assert_allclose(frame.loc[100 + np.arange(len(readings))].to_numpy(), expected, rtol=1e-6, atol=1e-6)
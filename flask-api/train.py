@@ -0,0 +1,550 @@
+# train.py
+# Headless training: a dataset export in, the artifacts the API serves out (and optionally a
+# new registry version). Same features, model and outputs as the notebook script
+# (Remote_Livestock_Management_Prediction_Model.py), but:
+#     - the parsed dataset is cached (Parquet, or pickle without pyarrow) keyed by the file's
+#       sha256, so re-runs on the same export skip Excel / CSV parsing entirely
+#     - EDA figures are only drawn with --eda, and then saved to files instead of shown
+#     - the forest is fitted (and evaluated) on every core
+#     - every stage is timed, and --report writes the timings and inputs to a JSON file
+#     - --tune searches tree count, depth, leaf size and feature subsampling, measures each
+#       candidate's accuracy / F1 next to its serving latency and bundle size, and trains the
+#       most accurate Pareto-optimal one that fits the /predict latency budget
+#
+#     python train.py ../cattle_dataset.xlsx
+#     python train.py telemetry.csv --out /srv/model --n-jobs 16 --report report.json
+#     python train.py ../cattle_dataset.xlsx --registry /srv/models [--live]
+#     python train.py ../cattle_dataset.xlsx --tune --latency-budget-us 40    # hyperparameter search
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from features import MODEL_FEATURES, FeatureBuilder, golden_vectors
+from registry import file_sha256
+
+DEFAULT_CACHE_DIR = '.dataset-cache'
+# Bump when the cached frame would differ for the same input file (e.g. parsing options change)
+CACHE_FORMAT_VERSION = 1
+RANDOM_STATE = 42
+TEST_SIZE = 0.2
+
+
+class StageTimer:
+    """Wall-clock time per training stage, printed as each one finishes."""
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 3)
+        print(f"[train] {name:<10} {elapsed:9.2f}s")
+
+    def total(self):
+        return round(time.perf_counter() - self.started, 3)
+
+
+# --- Dataset loading ---
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def read_dataset(path):
+    """Parses an .xlsx / .xls / .csv / .parquet export into a DataFrame."""
+    import pandas as pd
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        return pd.read_excel(path)
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    if extension == '.csv':
+        # The pyarrow CSV reader parses on all cores; the default one is single-threaded
+        return pd.read_csv(path, engine='pyarrow') if _parquet_available() else pd.read_csv(path, low_memory=False)
+    raise ValueError(f"Unsupported dataset format '{extension}' (expected .xlsx, .xls, .csv or .parquet)")
+
+
+def load_dataset(path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Loads a dataset export, from the parsed-frame cache when this exact file was loaded before.
+
+    Args:
+        path (str): Dataset file.
+        cache_dir (str, optional): Cache directory; None disables caching.
+
+    Returns:
+        tuple: (DataFrame, sha256 of the dataset file, True if served from the cache)
+    """
+    import pandas as pd
+
+    digest = file_sha256(path)
+    if not cache_dir:
+        return read_dataset(path), digest, False
+
+    use_parquet = _parquet_available()
+    stem = f"{os.path.splitext(os.path.basename(path))[0]}-{digest[:16]}-v{CACHE_FORMAT_VERSION}"
+    cache_path = os.path.join(cache_dir, stem + ('.parquet' if use_parquet else '.pkl'))
+    if os.path.exists(cache_path):
+        try:
+            return (pd.read_parquet(cache_path) if use_parquet else pd.read_pickle(cache_path)), digest, True
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable dataset cache {cache_path}: {e}")
+
+    df = read_dataset(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        if use_parquet:
+            df.to_parquet(temporary, index=False)
+        else:
+            df.to_pickle(temporary)
+        os.replace(temporary, cache_path)
+    except Exception as e:
+        # e.g. an object column mixing numbers and strings that Parquet cannot type; the run still works
+        print(f"Warning: Could not cache the parsed dataset ({e}).")
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+    return df, digest, False
+
+
+# --- EDA (opt-in) ---
+def save_eda_figures(df, out_dir):
+    """Draws the notebook's exploratory figures off-screen and saves them as PNGs in out_dir."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    os.makedirs(out_dir, exist_ok=True)
+    numerical_cols = ['body_temperature', 'respiratory_rate', 'heart_rate', 'milk_production',
+                      'sleeping_duration', 'eating_duration', 'walking_capacity',
+                      'lying_down_duration', 'body_condition_score', 'rumen_fill', 'ruminating']
+    categorical_cols = ['breed_type', 'faecal_consistency', 'health_status']
+
+    def save(name):
+        plt.tight_layout()
+        plt.savefig(os.path.join(out_dir, name))
+        plt.close('all')
+
+    plt.figure(figsize=(10, 6))
+    sns.countplot(data=df, x='breed_type', hue='health_status')
+    plt.title('Health Status by Breed Type')
+    plt.xticks(rotation=45)
+    save('health_by_breed.png')
+
+    plt.figure(figsize=(18, 30))
+    for i, col in enumerate(numerical_cols):
+        plt.subplot(len(numerical_cols) // 2 + 1, 2, i + 1)
+        sns.boxplot(data=df, x='health_status', y=col)
+        plt.title(f'{col.replace("_", " ").title()} vs Health Status')
+    save('numerical_by_health.png')
+
+    df[numerical_cols].hist(figsize=(18, 12), bins=30, edgecolor='black')
+    save('numerical_histograms.png')
+
+    plt.figure(figsize=(18, 5))
+    for i, col in enumerate(categorical_cols):
+        plt.subplot(1, 3, i + 1)
+        sns.countplot(data=df, x=col, hue=col, legend=False)
+        plt.title(f'{col.replace("_", " ").title()} Distribution')
+        plt.xticks(rotation=30)
+    save('categorical_distributions.png')
+    print(f"EDA figures saved to {out_dir}.")
+
+
+# --- Training ---
+def prepare_data(df, timer=None):
+    """
+    Encodes, builds features, scales and splits exactly as the notebook does.
+
+    Returns:
+        dict: scaler, le_health, le_breed, le_faecal, features, X_train, X_test, y_train, y_test, rows
+    """
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    timer = timer or StageTimer()
+    with timer.stage('encode'):
+        le_breed = LabelEncoder().fit(df['breed_type'])
+        le_faecal = LabelEncoder().fit(df['faecal_consistency'])
+        le_health = LabelEncoder()
+        y = le_health.fit_transform(df['health_status'])
+
+    features = list(MODEL_FEATURES)
+    with timer.stage('features'):
+        X = FeatureBuilder(features, le_breed, le_faecal).build_columns(df)
+
+    with timer.stage('scale'):
+        # Fitted on a frame so the scaler carries the column order the API reads back
+        scaler = StandardScaler().fit(pd.DataFrame(X, columns=features))
+        X_scaled = scaler.transform(pd.DataFrame(X, columns=features))
+        X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+
+    return {
+        "scaler": scaler, "le_health": le_health, "le_breed": le_breed, "le_faecal": le_faecal, "features": features,
+        "X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test, "rows": int(len(df)),
+    }
+
+
+def fit_model(df, n_jobs=-1, timer=None, params=None, data=None):
+    """
+    Fits the forest on the prepared split (sklearn defaults unless `params` overrides them)
+    and evaluates it on the held-out test rows.
+
+    Returns:
+        dict: model, scaler, le_health, le_breed, le_faecal, features, params, accuracy, f1, report
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, classification_report, f1_score
+
+    timer = timer or StageTimer()
+    data = data or prepare_data(df, timer)
+    params = dict(params or {})
+    with timer.stage('fit'):
+        # Per-tree seeds are drawn up front, so the forest is identical for any n_jobs
+        model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=n_jobs, **params)
+        model.fit(data['X_train'], data['y_train'])
+
+    with timer.stage('evaluate'):
+        y_pred = model.predict(data['X_test'])
+        accuracy = float(accuracy_score(data['y_test'], y_pred))
+        f1 = float(f1_score(data['y_test'], y_pred, average='macro'))
+        report = classification_report(data['y_test'], y_pred, target_names=data['le_health'].classes_)
+
+    # The API may score single readings with this model; thread fan-out per call would only slow it down
+    model.set_params(n_jobs=None)
+    return {
+        "model": model, "scaler": data['scaler'], "le_health": data['le_health'], "le_breed": data['le_breed'],
+        "le_faecal": data['le_faecal'], "features": data['features'], "params": params,
+        "accuracy": accuracy, "f1": f1, "report": report,
+        "rows": data['rows'], "train_rows": int(len(data['y_train'])), "test_rows": int(len(data['y_test'])),
+    }
+
+
+# --- Hyperparameter search (--tune) ---
+# Tree count, depth, leaf size and feature subsampling set both accuracy and serving cost: /predict
+# walks every tree once per reading, and deeper trees mean longer walks and a bigger bundle.
+SEARCH_SPACE = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [None, 6, 10, 16],
+    'min_samples_leaf': [1, 2, 5, 10],
+    'max_features': ['sqrt', 0.5, 1.0],
+}
+SKLEARN_DEFAULTS = {'n_estimators': 100, 'max_depth': None, 'min_samples_leaf': 1, 'max_features': 'sqrt'}
+DEFAULT_TUNE_SAMPLES = 24
+DEFAULT_LATENCY_BUDGET_US = 50.0
+VALIDATION_SIZE = 0.25
+LATENCY_CALLS = 500
+LATENCY_BATCH = 1000
+
+
+def parse_search_space(spec):
+    """
+    Parses "n_estimators=50,100;max_depth=none,8" into a search space (other parameters keep
+    their SEARCH_SPACE values). 'none' means unlimited; numbers are parsed as int or float.
+    """
+    def value(text):
+        text = text.strip()
+        if text.lower() == 'none':
+            return None
+        for cast in (int, float):
+            try:
+                return cast(text)
+            except ValueError:
+                pass
+        return text
+
+    space = dict(SEARCH_SPACE)
+    for part in filter(None, (part.strip() for part in (spec or '').split(';'))):
+        name, _, values = part.partition('=')
+        if name.strip() not in SEARCH_SPACE or not values.strip():
+            raise ValueError(f"Invalid search space entry '{part}' (parameters: {', '.join(SEARCH_SPACE)})")
+        space[name.strip()] = [value(v) for v in values.split(',') if v.strip()]
+    return space
+
+
+def search_candidates(space, samples=DEFAULT_TUNE_SAMPLES, seed=RANDOM_STATE):
+    """The grid over `space`, or `samples` points drawn from it; the sklearn defaults are always included as the baseline."""
+    import itertools
+
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if samples and samples < len(grid):
+        rng = np.random.default_rng(seed)
+        grid = [grid[i] for i in sorted(rng.choice(len(grid), size=samples, replace=False))]
+    if SKLEARN_DEFAULTS not in grid:
+        grid.insert(0, dict(SKLEARN_DEFAULTS))
+    return grid
+
+
+def _fit_candidate(params, X_fit, y_fit, X_val, y_val):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, f1_score
+
+    model = RandomForestClassifier(random_state=RANDOM_STATE, **params).fit(X_fit, y_fit)
+    y_pred = model.predict(X_val)
+    return model, float(accuracy_score(y_val, y_pred)), float(f1_score(y_val, y_pred, average='macro'))
+
+
+def measure_serving_cost(model, data, readings):
+    """
+    Times a model the way the API runs it (FeatureBuilder + FlatForest): per-call latency of a
+    single /predict reading, per-reading cost of one /predict/batch of LATENCY_BATCH readings,
+    and the size of its serving bundle.
+    """
+    import tempfile
+    from inference import FlatForest, ServingModel, save_serving_bundle
+
+    builder = FeatureBuilder(data['features'], data['le_breed'], data['le_faecal'], data['scaler'])
+    serving = ServingModel('tuning', builder, FlatForest.from_sklearn(model, data['scaler']), data['le_health'])
+
+    for reading in readings[:20]:
+        serving.predict_reading(reading)
+    calls = np.empty(LATENCY_CALLS)
+    for i in range(LATENCY_CALLS):
+        reading = readings[i % len(readings)]
+        start = time.perf_counter()
+        serving.predict_reading(reading)
+        calls[i] = time.perf_counter() - start
+
+    batch = (readings * (LATENCY_BATCH // len(readings) + 1))[:LATENCY_BATCH]
+    batch_seconds = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        serving.predict_records(batch)
+        batch_seconds = min(batch_seconds, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bundle.joblib')
+        save_serving_bundle(path, model, data['scaler'], data['le_health'], data['le_breed'], data['le_faecal'], data['features'])
+        bundle_bytes = os.path.getsize(path)
+
+    return {
+        "single_p50_us": round(float(np.percentile(calls, 50)) * 1e6, 2),
+        "single_p95_us": round(float(np.percentile(calls, 95)) * 1e6, 2),
+        "batch_us_per_reading": round(batch_seconds / LATENCY_BATCH * 1e6, 2),
+        "bundle_bytes": bundle_bytes,
+    }
+
+
+def pareto_front(results):
+    """Indices of the candidates no other candidate beats on both validation F1 and single-reading latency."""
+    front = []
+    for i, a in enumerate(results):
+        dominated = any(
+            b['f1'] >= a['f1'] and b['single_p50_us'] <= a['single_p50_us'] and (b['f1'] > a['f1'] or b['single_p50_us'] < a['single_p50_us'])
+            for b in results
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def select_candidate(results, latency_budget_us):
+    """
+    The Pareto-optimal candidate with the best validation F1 whose single-reading latency fits
+    the budget (ties: faster, then smaller). If none fits, the fastest one, with a warning.
+    """
+    front = [results[i] for i in pareto_front(results)]
+    eligible = [r for r in front if r['single_p50_us'] <= latency_budget_us]
+    if eligible:
+        return max(eligible, key=lambda r: (r['f1'], -r['single_p50_us'], -r['bundle_bytes']))
+    fastest = min(front, key=lambda r: r['single_p50_us'])
+    print(f"Warning: No candidate meets the {latency_budget_us:g} us latency budget; selecting the fastest ({fastest['single_p50_us']} us).")
+    return fastest
+
+
+def tune(data, readings, space=None, samples=DEFAULT_TUNE_SAMPLES, latency_budget_us=DEFAULT_LATENCY_BUDGET_US, n_jobs=-1, timer=None):
+    """
+    Searches forest hyperparameters for the best accuracy the /predict latency budget allows.
+
+    Candidates are fitted in parallel (one per core; tree building releases the GIL, so threads
+    share the training arrays instead of copying them) on part of the training split and scored
+    on the rest, so the test rows stay unseen until the selected model is evaluated. Latency is
+    then measured one candidate at a time, on an otherwise idle process.
+
+    Args:
+        data (dict): prepare_data() output.
+        readings (list): Raw reading dicts to time the serving path with.
+
+    Returns:
+        tuple: (selected parameters, list of per-candidate result dicts)
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import train_test_split
+
+    timer = timer or StageTimer()
+    candidates = search_candidates(space or SEARCH_SPACE, samples)
+    X_fit, X_val, y_fit, y_val = train_test_split(data['X_train'], data['y_train'], test_size=VALIDATION_SIZE, random_state=RANDOM_STATE)
+    print(f"Tuning: {len(candidates)} candidates, {len(y_fit):,} fitting / {len(y_val):,} validation rows, latency budget {latency_budget_us:g} us")
+
+    with timer.stage('search'):
+        fitted = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(_fit_candidate)(params, X_fit, y_fit, X_val, y_val) for params in candidates
+        )
+
+    results = []
+    with timer.stage('latency'):
+        for params, (model, accuracy, f1) in zip(candidates, fitted):
+            results.append(dict(params=params, accuracy=round(accuracy, 4), f1=round(f1, 4), **measure_serving_cost(model, data, readings)))
+    del fitted
+
+    selected = select_candidate(results, latency_budget_us)
+    front = set(pareto_front(results))
+    print(f"{'n_estimators':>12} {'max_depth':>9} {'min_leaf':>8} {'max_feat':>8} {'accuracy':>9} {'f1':>7} {'p50 us':>8} {'p95 us':>8} {'batch us':>9} {'bundle KB':>10}")
+    for i, r in sorted(enumerate(results), key=lambda item: (-item[1]['f1'], item[1]['single_p50_us'])):
+        p = r['params']
+        marker = ' <- selected' if r is selected else ' pareto' if i in front else ''
+        print(f"{p['n_estimators']:>12} {str(p['max_depth']):>9} {p['min_samples_leaf']:>8} {str(p['max_features']):>8} {r['accuracy']:>9.4f} {r['f1']:>7.4f} "
+              f"{r['single_p50_us']:>8.1f} {r['single_p95_us']:>8.1f} {r['batch_us_per_reading']:>9.2f} {r['bundle_bytes'] / 1024:>10.1f}{marker}")
+    for i, r in enumerate(results):
+        r['pareto'] = i in front
+        r['selected'] = r is selected
+    return dict(selected['params']), results
+
+
+def export_artifacts(out_dir, model, scaler, le_health, le_breed, le_faecal, features):
+    """
+    Writes everything the API loads: the .joblib artifacts, golden_vectors.json, forest.npz
+    and serving_bundle.joblib (see app.py and registry.py).
+    """
+    import joblib
+    from inference import flatten_forest, save_serving_bundle
+
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(out_dir, 'model.joblib'))
+    joblib.dump(scaler, os.path.join(out_dir, 'scaler.joblib'))
+    joblib.dump(le_health, os.path.join(out_dir, 'le_health.joblib'))
+    joblib.dump(le_breed, os.path.join(out_dir, 'le_breed.joblib'))
+    joblib.dump(le_faecal, os.path.join(out_dir, 'le_faecal.joblib'))
+    print("Model, Scaler, and LabelEncoders saved successfully!")
+
+    # Golden vectors: edge-case readings with the feature rows and probabilities they produce here.
+    # The API replays them at startup and refuses to serve if its pipeline gives anything different.
+    golden = golden_vectors(FeatureBuilder(features, le_breed, le_faecal, scaler))
+    golden['probabilities'] = model.predict_proba(np.array(golden['scaled'])).tolist()
+    with open(os.path.join(out_dir, 'golden_vectors.json'), 'w') as f:
+        json.dump(golden, f, indent=2)
+    print(f"Golden vectors saved to golden_vectors.json ({len(golden['readings'])} readings).")
+
+    # Node arrays with the scaler folded into the split thresholds, for the flat-array engine
+    forest_arrays = flatten_forest(model, scaler)
+    np.savez(os.path.join(out_dir, 'forest.npz'), **forest_arrays)
+    print(f"Flattened forest saved to forest.npz ({len(forest_arrays['feature'])} nodes, max depth {int(forest_arrays['max_depth'])}).")
+
+    # Same arrays plus scaler constants and label tables in one memory-mappable file
+    save_serving_bundle(os.path.join(out_dir, 'serving_bundle.joblib'), model, scaler, le_health, le_breed, le_faecal, features)
+    print("Serving bundle saved to serving_bundle.joblib.")
+
+
+def publish_model(registry_dir, out_dir, metadata, live=False):
+    """
+    Publishes the exported bundle as a new registry version: live with `live` (or when nothing
+    is live yet), else the candidate the API shadow-scores until it is promoted.
+    """
+    from registry import ModelRegistry
+
+    registry = ModelRegistry(registry_dir)
+    version = registry.publish(out_dir, metadata=metadata)
+    if live or registry.live_version() is None:
+        registry.promote(version)
+    else:
+        registry.set_candidate(version)
+    print(f"Published model version {version} to {registry.root} (live: {registry.live_version()}, candidate: {registry.candidate_version()}).")
+    return version
+
+
+# --- Command line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the health model and export the API's serving artifacts.")
+    parser.add_argument('dataset', help="Dataset export (.xlsx, .xls, .csv or .parquet)")
+    parser.add_argument('--out', default='.', help="Directory for the model artifacts (default: current directory)")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Cores for fitting and evaluation (default: all)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f"Parsed-dataset cache (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true', help="Always parse the dataset file")
+    parser.add_argument('--eda', metavar='DIR', help="Also save the exploratory figures to DIR")
+    parser.add_argument('--registry', default=os.environ.get('MODEL_REGISTRY_DIR'), help="Publish to this model registry (default: $MODEL_REGISTRY_DIR)")
+    parser.add_argument('--live', action='store_true', help="Make the published version live instead of the candidate")
+    parser.add_argument('--report', metavar='PATH', help="Write timings, inputs and metrics as JSON")
+    tuning = parser.add_argument_group('hyperparameter search')
+    tuning.add_argument('--tune', action='store_true', help="Search forest hyperparameters and train the selected ones")
+    tuning.add_argument('--tune-samples', type=int, default=DEFAULT_TUNE_SAMPLES, help=f"Candidates drawn from the grid; 0 = full grid (default {DEFAULT_TUNE_SAMPLES})")
+    tuning.add_argument('--search-space', help="Override grid values, e.g. 'n_estimators=50,100;max_depth=none,8'")
+    tuning.add_argument('--latency-budget-us', type=float, default=float(os.environ.get('TUNE_LATENCY_BUDGET_US', DEFAULT_LATENCY_BUDGET_US)),
+                        help=f"Single-reading /predict latency the selected model must meet (default {DEFAULT_LATENCY_BUDGET_US:g}, or $TUNE_LATENCY_BUDGET_US)")
+    args = parser.parse_args(argv)
+
+    import sklearn
+
+    timer = StageTimer()
+    try:
+        with timer.stage('load'):
+            df, digest, cached = load_dataset(args.dataset, None if args.no_cache else args.cache_dir)
+        print(f"Dataset: {args.dataset} ({len(df):,} rows, sha256 {digest[:12]}, {'cached' if cached else 'parsed'})")
+
+        if args.eda:
+            with timer.stage('eda'):
+                save_eda_figures(df, args.eda)
+
+        params, tuning_results = None, None
+        data = prepare_data(df, timer)
+        if args.tune:
+            readings = df.head(LATENCY_BATCH).to_dict('records')
+            params, tuning_results = tune(data, readings, parse_search_space(args.search_space), args.tune_samples,
+                                          args.latency_budget_us, args.n_jobs, timer)
+            print(f"Selected: {params}")
+
+        # The selected parameters are refitted on the whole training split and scored on the untouched test rows
+        result = fit_model(df, n_jobs=args.n_jobs, timer=timer, params=params, data=data)
+        print(f"Accuracy: {result['accuracy']}")
+        print(result['report'])
+
+        with timer.stage('export'):
+            export_artifacts(args.out, *(result[name] for name in ('model', 'scaler', 'le_health', 'le_breed', 'le_faecal', 'features')))
+
+        version = None
+        if args.registry:
+            with timer.stage('publish'):
+                metadata = {
+                    "accuracy": round(result['accuracy'], 4), "f1": round(result['f1'], 4), "params": result['params'],
+                    "n_estimators": result['model'].n_estimators, "dataset_sha256": digest, "rows": result['rows'], "fit_seconds": timer.stages['fit'],
+                }
+                version = publish_model(args.registry, args.out, metadata, live=args.live)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    print(f"[train] {'total':<10} {timer.total():9.2f}s")
+    if args.report:
+        report = {
+            "dataset": os.path.abspath(args.dataset), "dataset_sha256": digest, "dataset_cached": cached,
+            "rows": result['rows'], "train_rows": result['train_rows'], "test_rows": result['test_rows'],
+            "random_state": RANDOM_STATE, "test_size": TEST_SIZE, "n_jobs": args.n_jobs, "cpus": os.cpu_count(),
+            "params": result['params'], "accuracy": result['accuracy'], "f1": result['f1'], "version": version,
+            "tuning": {"latency_budget_us": args.latency_budget_us, "candidates": tuning_results} if tuning_results else None,
+            "stages_seconds": timer.stages, "total_seconds": timer.total(),
+            "python": platform.python_version(), "numpy": np.__version__, "sklearn": sklearn.__version__,
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())